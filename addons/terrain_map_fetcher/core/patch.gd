@@ -135,6 +135,27 @@ func get_imagery_path() -> String:
 	return patch_dir.path_join("imagery_000.png")
 
 
+## Returns the smallest imagery pyramid level (imagery_000_mip<N>.png, see
+## python/pyramid.py) whose longer side is still at least target_px.
+## Falls back to the full-resolution imagery.
+func get_imagery_level_path(target_px: int) -> String:
+	var base := get_imagery_path()
+	var best := base
+	var w := width_px
+	var h := height_px
+	var level := 0
+	while max(w, h) > 256:  # pyramid.MIN_LEVEL_SIZE
+		w = ceili(w / 2.0)
+		h = ceili(h / 2.0)
+		level += 1
+		if max(w, h) < target_px:
+			break
+		var p := "%s_mip%d.png" % [base.get_basename(), level]
+		if FileAccess.file_exists(p):
+			best = p
+	return best
+
+
 func get_mask_path() -> String:
 	return patch_dir.path_join("mask.png")
 
@@ -143,6 +164,16 @@ func get_preview_path() -> String:
 	return patch_dir.path_join("preview.png")
 
 
+## Small previews written by python/previews.py: imagery at 128 px, and the
+## heightmap's hillshade at 256/128 px for patches without imagery.
+func get_thumb_path() -> String:
+	return patch_dir.path_join("thumb.png")
+
+
+func get_hillshade_path(small: bool = false) -> String:
+	return patch_dir.path_join("hillshade_thumb.png" if small else "hillshade.png")
+
+
 func has_heightmap() -> bool:
 	return FileAccess.file_exists(get_heightmap_path())
 
@@ -164,18 +195,24 @@ func has_preview() -> bool:
 func load_thumbnail() -> ImageTexture:
 	if _thumbnail:
 		return _thumbnail
-	var path := get_preview_path()
-	if not FileAccess.file_exists(path):
-		path = get_imagery_path()
+	var path := ""
+	for p in [get_thumb_path(), get_preview_path(), get_hillshade_path(true), get_hillshade_path()]:
+		if FileAccess.file_exists(p):
+			path = p
+			break
+	if path.is_empty():
+		path = get_imagery_level_path(128)
 	if not FileAccess.file_exists(path):
 		return null
 	var img := Image.load_from_file(path)
 	if not img:
 		return null
-	var scale: float = 128.0 / max(img.get_width(), img.get_height())
-	var tw: int = max(1, int(img.get_width() * scale))
-	var th: int = max(1, int(img.get_height() * scale))
-	img.resize(tw, th, Image.INTERPOLATE_LANCZOS)
+	# thumb.png is already 128 px; anything else is scaled down to it.
+	if max(img.get_width(), img.get_height()) > 128:
+		var scale: float = 128.0 / max(img.get_width(), img.get_height())
+		var tw: int = max(1, int(img.get_width() * scale))
+		var th: int = max(1, int(img.get_height() * scale))
+		img.resize(tw, th, Image.INTERPOLATE_LANCZOS)
 	_thumbnail = ImageTexture.create_from_image(img)
 	return _thumbnail
 
@@ -184,9 +221,10 @@ func invalidate_thumbnail() -> void:
 	_thumbnail = null
 
 
-## Generate and save preview.png at 256×256 from imagery.
+## Generate and save preview.png at 256×256 from imagery. Only needed for
+## patches whose fetch did not write one (python/previews.py).
 func generate_preview() -> bool:
-	var imagery_path := get_imagery_path()
+	var imagery_path := get_imagery_level_path(256)
 	if not FileAccess.file_exists(imagery_path):
 		return false
 	var img := Image.load_from_file(imagery_path)
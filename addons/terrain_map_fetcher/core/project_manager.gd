@@ -153,7 +153,8 @@ func _delete_dir_recursive(dir_path: String) -> void:
 
 
 ## Called after a successful Python fetch. Parses the legacy metadata text file,
-## creates meta.json, generates preview.png, and refreshes the patch list.
+## creates meta.json, generates preview.png if the fetch did not write one,
+## and refreshes the patch list.
 func finalize_patch(patch_name: String, bbox_wgs84: Array) -> Object:
 	var patch_path := project_dir.path_join("patches").path_join(patch_name)
 	var meta_txt := patch_path.path_join("heightmap_000_meta.txt")
@@ -171,7 +172,8 @@ func finalize_patch(patch_name: String, bbox_wgs84: Array) -> Object:
 	patch.elev_max_m   = parsed.get("elev_max_m", 0.0)
 	patch.fetched_at   = Time.get_datetime_string_from_system(true)
 	patch.save_meta()
-	patch.generate_preview()
+	if not patch.has_preview():
+		patch.generate_preview()
 
 	_scan_patches()
 	patches_changed.emit()
@@ -3,16 +3,49 @@ extends Node
 
 ## Wraps OS.execute() calls to the Python helper scripts in the python/ subfolder.
 ## Downloads are shown in a visible terminal window so the user can see progress.
-
-const PYTHON_CANDIDATES := ["python3", "python"]
+##
+## With the project setting terrain_map_fetcher/use_python_worker enabled, the
+## scripts run in one long-lived python/worker.py process instead (shared by
+## every runner, started on first use) and their output goes to the Output
+## panel. The calls below are then awaited without blocking the editor, and
+## cancel_worker_job() can stop the one in flight. Every request carries the
+## token the worker writes to its port file, so other local programs cannot
+## queue jobs on its port.
+
+const PYTHON_CANDIDATES       := ["python3", "python"]
+const WORKER_SETTING          := "terrain_map_fetcher/use_python_worker"
+const WORKER_IDLE_TIMEOUT_S   := 900
+const WORKER_START_TIMEOUT_MS := 15000
+const WORKER_STOP_TIMEOUT_MS  := 200
+const WORKER_CANCEL_TIMEOUT_MS := 30000   # a GDAL warp or EXR write in progress finishes first
+
+static var _python_path := ""
+static var _worker_pid  := 0
+static var _worker_port := 0
+static var _worker_token := ""
+static var _starting_pid := 0   # worker being launched, until its port file appears
+static var _next_id     := 0
+
+var use_worker := false
+var _peer: StreamPeerTCP
+var _job_id := 0   # worker request this runner is waiting for
+var _cancel_deadline := 0   # ticks by which a cancelled job must have answered
+
+
+func _ready() -> void:
+	use_worker = ProjectSettings.get_setting(WORKER_SETTING, false)
 
 
 ## Locate a working Python executable. Returns "" if none found.
+## The result is kept for the rest of the editor session.
 func find_python() -> String:
+	if not _python_path.is_empty():
+		return _python_path
 	for candidate in PYTHON_CANDIDATES:
 		var out  := []
 		var code := OS.execute(candidate, ["--version"], out, true)
 		if code == 0:
+			_python_path = candidate
 			return candidate
 	return ""
 
@@ -26,6 +59,13 @@ func check_dependencies() -> Dictionary:
 			"success": false,
 			"message": "Python 3 not found. Please install Python 3 and ensure it is on your PATH."
 		}
+	if await _worker_wanted():
+		var reply: Dictionary = await _call_worker("check_dependencies")
+		if reply.has("result"):
+			var missing: Array = reply["result"].get("missing", [])
+			if missing.is_empty():
+				return {"success": true, "message": "All dependencies satisfied."}
+			return {"success": false, "message": "Missing packages: " + ", ".join(missing)}
 	var out  := []
 	var code := OS.execute(python, [_script_dir().path_join("setup.py"), "--check"], out, true)
 	var msg  := "\n".join(out).strip_edges()
@@ -65,36 +105,28 @@ func process_tiles(dem_urls: Array, imagery_urls: Array, out_dir: String, bbox:
 	_write_lines(dem_list_path, dem_urls)
 	_write_lines(imagery_list_path, imagery_urls)
 
-	# Write a combined runner script that runs both steps and pauses at the end.
+	if await _worker_wanted():
+		var reply: Dictionary = await _call_worker("fetch_pipeline", {"args": [
+			"--dem-url-list", dem_list_path, "--imagery-url-list", imagery_list_path,
+			"--out-dir", out_dir, "--bbox",
+			str(bbox.get("min_lon", 0.0)), str(bbox.get("min_lat", 0.0)),
+			str(bbox.get("max_lon", 0.0)), str(bbox.get("max_lat", 0.0))]})
+		DirAccess.remove_absolute(dem_list_path)
+		DirAccess.remove_absolute(imagery_list_path)
+		return _worker_result(reply, out_dir)
+
+	# Write a runner script that fetches both products in one overlapped
+	# pipeline process and pauses at the end.
 	var runner_path := out_dir.path_join("_run_fetch.bat")
 	var runner_content := (
 		"@echo off\n" +
 		"echo ============================================\n" +
-		"echo  Terrain Map Fetcher — DEM Download\n" +
+		"echo  Terrain Map Fetcher — DEM + Imagery Download\n" +
 		"echo ============================================\n" +
-		'"%s" "%s" --url-list "%s" --out-dir "%s" --bbox %s %s %s %s\n' % [
+		'"%s" "%s" --dem-url-list "%s" --imagery-url-list "%s" --out-dir "%s" --bbox %s %s %s %s\n' % [
 			python,
-			script_dir.path_join("process_dem.py"),
+			script_dir.path_join("fetch_pipeline.py"),
 			dem_list_path,
-			out_dir,
-			bbox.get("min_lon", 0.0),
-			bbox.get("min_lat", 0.0),
-			bbox.get("max_lon", 0.0),
-			bbox.get("max_lat", 0.0)
-		] +
-		"if errorlevel 1 (\n" +
-		"  echo.\n" +
-		"  echo ERROR: DEM processing failed.\n" +
-		"  pause\n" +
-		"  exit /b 1\n" +
-		")\n" +
-		"echo.\n" +
-		"echo ============================================\n" +
-		"echo  Terrain Map Fetcher — Imagery Download\n" +
-		"echo ============================================\n" +
-		'"%s" "%s" --url-list "%s" --out-dir "%s" --bbox %s %s %s %s\n' % [
-			python,
-			script_dir.path_join("process_imagery.py"),
 			imagery_list_path,
 			out_dir,
 			bbox.get("min_lon", 0.0),
@@ -104,7 +136,7 @@ func process_tiles(dem_urls: Array, imagery_urls: Array, out_dir: String, bbox:
 		] +
 		"if errorlevel 1 (\n" +
 		"  echo.\n" +
-		"  echo ERROR: Imagery processing failed.\n" +
+		"  echo ERROR: Processing failed.\n" +
 		"  pause\n" +
 		"  exit /b 1\n" +
 		")\n" +
@@ -150,6 +182,13 @@ func compose_canvas(project_dir: String, export_name: String,
 	var exports_dir := project_dir.path_join("exports").path_join(export_name)
 	DirAccess.make_dir_recursive_absolute(exports_dir)
 
+	if await _worker_wanted():
+		var reply: Dictionary = await _call_worker("compose_canvas", {"args": [
+			"--project-dir", project_dir, "--export-name", export_name,
+			"--out-width", str(out_width), "--out-height", str(out_height),
+			"--edge-feather", str(edge_feather)]})
+		return _worker_result(reply, exports_dir)
+
 	var runner_path := exports_dir.path_join("_run_compose.bat")
 	var runner_content := (
 		"@echo off\n" +
@@ -203,6 +242,12 @@ func combine_tiles(tile_paths: Array, out_dir: String) -> Dictionary:
 	var tile_list_path := out_dir.path_join("_tile_list.txt")
 	_write_lines(tile_list_path, tile_paths)
 
+	if await _worker_wanted():
+		var reply: Dictionary = await _call_worker("combine_tiles", {"args": [
+			"--tile-list", tile_list_path, "--out-dir", out_dir]})
+		DirAccess.remove_absolute(tile_list_path)
+		return _worker_result(reply, out_dir)
+
 	var runner_path := out_dir.path_join("_run_combine.bat")
 	var runner_content := (
 		"@echo off\n" +
@@ -241,6 +286,187 @@ func combine_tiles(tile_paths: Array, out_dir: String) -> Dictionary:
 	return result
 
 
+# ── Worker ────────────────────────────────────────────────────────────────────
+
+## Start the shared worker process unless it is already running.
+## Returns true once it accepts connections; waits a frame at a time, so await it.
+## A runner that calls it while another one is launching the worker waits for
+## that launch instead of starting a second process.
+func start_worker() -> bool:
+	while _starting_pid > 0:
+		await _next_frame()
+	if is_worker_running():
+		if _peer != null:
+			_peer.poll()
+			if _peer.get_status() == StreamPeerTCP.STATUS_CONNECTED:
+				return true
+		return await _connect_worker()
+	var python := find_python()
+	if python.is_empty():
+		return false
+	var port_file := OS.get_user_data_dir().path_join("terrain_fetcher_worker.port")
+	DirAccess.remove_absolute(port_file)
+	var pid := OS.create_process(python, [
+		_script_dir().path_join("worker.py"), "--port", "0", "--port-file", port_file,
+		"--idle-timeout", str(WORKER_IDLE_TIMEOUT_S)])
+	if pid <= 0:
+		return false
+	_starting_pid = pid
+	var deadline := Time.get_ticks_msec() + WORKER_START_TIMEOUT_MS
+	while not FileAccess.file_exists(port_file):
+		if Time.get_ticks_msec() > deadline or not OS.is_process_running(pid):
+			OS.kill(pid)
+			if _starting_pid == pid:
+				_starting_pid = 0
+			return false
+		await _next_frame()
+	if _starting_pid != pid:   # stop_worker() killed it meanwhile
+		return false
+	var lines := FileAccess.get_file_as_string(port_file).split("\n")
+	_starting_pid = 0
+	_worker_pid   = pid
+	_worker_port  = lines[0].to_int()
+	_worker_token = lines[1].strip_edges() if lines.size() > 1 else ""
+	return await _connect_worker()
+
+
+## True while the shared worker process is alive (it exits by itself when idle).
+func is_worker_running() -> bool:
+	if _worker_pid > 0 and not OS.is_process_running(_worker_pid):
+		_worker_pid = 0
+		_peer = null
+	return _worker_pid > 0
+
+
+## Ask the shared worker to exit, cancelling whatever it is running. Called
+## when the plugin unloads, where there are no frames left to wait for, so it
+## connects blocking for at most WORKER_STOP_TIMEOUT_MS and otherwise kills
+## the process.
+static func stop_worker() -> void:
+	if _starting_pid > 0:
+		OS.kill(_starting_pid)
+		_starting_pid = 0
+	if _worker_pid <= 0 or not OS.is_process_running(_worker_pid):
+		_worker_pid = 0
+		return
+	var peer := StreamPeerTCP.new()
+	var deadline := Time.get_ticks_msec() + WORKER_STOP_TIMEOUT_MS
+	if peer.connect_to_host("127.0.0.1", _worker_port) == OK:
+		peer.poll()
+		while peer.get_status() == StreamPeerTCP.STATUS_CONNECTING and Time.get_ticks_msec() < deadline:
+			OS.delay_msec(5)
+			peer.poll()
+	if peer.get_status() == StreamPeerTCP.STATUS_CONNECTED:
+		_next_id += 1
+		peer.put_data(_encode({"jsonrpc": "2.0", "id": _next_id, "method": "shutdown"}))
+		peer.disconnect_from_host()
+	else:
+		OS.kill(_worker_pid)
+	_worker_pid = 0
+
+
+## True while this runner waits for a worker job, which cancel_worker_job() can stop.
+func is_worker_job_running() -> bool:
+	return _job_id != 0
+
+
+## Cancel the worker job this runner is waiting for; the call then fails. A
+## worker that does not answer within WORKER_CANCEL_TIMEOUT_MS is killed.
+func cancel_worker_job() -> void:
+	if _job_id == 0 or _peer == null:
+		return
+	_cancel_deadline = Time.get_ticks_msec() + WORKER_CANCEL_TIMEOUT_MS
+	_next_id += 1
+	_send({"jsonrpc": "2.0", "id": _next_id, "method": "cancel", "params": {"id": _job_id}})
+
+
+func _worker_wanted() -> bool:
+	return use_worker and await start_worker()
+
+
+func _connect_worker() -> bool:
+	_peer = StreamPeerTCP.new()
+	if _peer.connect_to_host("127.0.0.1", _worker_port) != OK:
+		_peer = null
+		return false
+	var deadline := Time.get_ticks_msec() + WORKER_START_TIMEOUT_MS
+	while _peer.get_status() == StreamPeerTCP.STATUS_CONNECTING and Time.get_ticks_msec() < deadline:
+		await _next_frame()
+		_peer.poll()
+	if _peer.get_status() != StreamPeerTCP.STATUS_CONNECTED:
+		_peer = null
+		return false
+	return true
+
+
+func _send(msg: Dictionary) -> void:
+	_peer.put_data(_encode(msg))
+
+
+static func _encode(msg: Dictionary) -> PackedByteArray:
+	msg["token"] = _worker_token
+	return (JSON.stringify(msg) + "\n").to_utf8_buffer()
+
+
+func _call_worker(method: String, params: Dictionary = {}) -> Dictionary:
+	## Send one request and wait for its reply a frame at a time, printing the
+	## job's output lines as they arrive. Returns the JSON-RPC reply.
+	_next_id += 1
+	var id := _next_id
+	_job_id = id
+	_cancel_deadline = 0
+	_send({"jsonrpc": "2.0", "id": id, "method": method, "params": params})
+	var buffer := PackedByteArray()
+	while true:
+		_peer.poll()
+		if _peer.get_status() != StreamPeerTCP.STATUS_CONNECTED:
+			break
+		var available := _peer.get_available_bytes()
+		if available > 0:
+			buffer.append_array(_peer.get_partial_data(available)[1])
+		var newline := buffer.find(10)
+		while newline >= 0:
+			var msg = JSON.parse_string(buffer.slice(0, newline).get_string_from_utf8())
+			buffer = buffer.slice(newline + 1)
+			newline = buffer.find(10)
+			if not (msg is Dictionary):
+				continue
+			if msg.get("method", "") == "log":
+				print("[worker] ", msg["params"]["text"])
+			elif msg.get("id") == id:
+				_job_id = 0
+				return msg
+		if _cancel_deadline != 0 and Time.get_ticks_msec() > _cancel_deadline:
+			_job_id = 0
+			_peer = null
+			if _worker_pid > 0:
+				OS.kill(_worker_pid)
+				_worker_pid = 0
+			return {"error": {"code": -1, "message": "The Python worker did not stop the job; it was killed."}}
+		await _next_frame()
+	_job_id = 0
+	_peer = null
+	return {"error": {"code": -1, "message": "Lost the connection to the Python worker."}}
+
+
+func _next_frame() -> void:
+	## Yield to the editor until the next frame (or sleep briefly outside the tree).
+	if is_inside_tree():
+		await get_tree().process_frame
+	else:
+		OS.delay_msec(10)
+
+
+func _worker_result(reply: Dictionary, output_path: String) -> Dictionary:
+	if reply.has("error"):
+		return {"success": false, "output_path": "", "error": reply["error"].get("message", "Worker error.")}
+	var code := int(reply["result"].get("exit_code", 1))
+	if code != 0:
+		return {"success": false, "output_path": "",
+				"error": "Script failed (exit %d). Check the Output panel for details." % code}
+	return {"success": true, "output_path": output_path, "error": ""}
+
+
 # ── Private helpers ───────────────────────────────────────────────────────────
 
 func _run_visible(bat_path: String) -> Dictionary:
@@ -2,6 +2,7 @@
 extends EditorPlugin
 
 const PANEL_SCENE = preload("res://addons/terrain_map_fetcher/ui/map_fetcher_panel.tscn")
+const PythonRunner = preload("res://addons/terrain_map_fetcher/core/python_runner.gd")
 
 var _window: Window
 var _panel: Control
@@ -9,6 +10,7 @@ var _toolbar_btn: Button
 
 
 func _enter_tree() -> void:
+	_add_settings()
 	_toolbar_btn = Button.new()
 	_toolbar_btn.text = "Terrain Fetcher"
 	_toolbar_btn.tooltip_text = "Open Terrain Map Fetcher v2"
@@ -18,6 +20,7 @@ func _enter_tree() -> void:
 
 
 func _exit_tree() -> void:
+	PythonRunner.stop_worker()
 	if _window:
 		_window.queue_free()
 		_window = null
@@ -28,6 +31,15 @@ func _exit_tree() -> void:
 	print("[TerrainMapFetcher] Plugin unloaded.")
 
 
+func _add_settings() -> void:
+	## Show the plugin's project settings under Project Settings (Advanced).
+	var setting: String = PythonRunner.WORKER_SETTING
+	if not ProjectSettings.has_setting(setting):
+		ProjectSettings.set_setting(setting, false)
+	ProjectSettings.set_initial_value(setting, false)
+	ProjectSettings.add_property_info({"name": setting, "type": TYPE_BOOL})
+
+
 func _on_toolbar_btn_pressed() -> void:
 	if _window == null:
 		_window = Window.new()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+bench_blend.py
+--------------
+Seam handling of combine_tiles.py on a synthetic grid of tiles, in memory
+(no EXR I/O). The terrain is a smooth surface plus fine relief; every tile
+is offset by a random few metres so each seam has a step to remove.
+
+  seams     _blend_seams() on edge-to-edge tiles, against the per-pixel
+            column/row loop it replaced (--no-reference skips the loop,
+            which also needs a second copy of the canvas)
+  overlap   placing overlapping tiles with cross-fades (_place_tile and
+            _normalize_weights), against plain assignment of the same tiles
+
+For each it records the time, the largest remaining step between two
+pixels near a seam (beyond the terrain's own slope; 0 = invisible) and how
+much of the fine relief inside the blended bands survives (1 = all of it).
+
+The canvas takes grid^2 x tile-px^2 x 4 bytes: the 10 x 10 tiles of 4096 px
+the defaults ask for need 6.7 GB (twice that with the reference loop), so
+use smaller --grid / --tile-px on smaller machines.
+
+Usage:
+    python3 bench_blend.py [--grid 10] [--tile-px 4096] [--blend-px 16] \
+                           [--overlap 64] [--no-reference] [--out FILE]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+SCRIPT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SCRIPT_DIR))
+import combine_tiles   # noqa: E402
+
+combine_tiles.import_heavy()
+
+
+def terrain(y0: int, x0: int, h: int, w: int) -> np.ndarray:
+    """Smooth hills plus a few metres of fine relief, in metres, for canvas rows/cols from (y0, x0)."""
+    y = np.arange(y0, y0 + h, dtype=np.float32)[:, None]
+    x = np.arange(x0, x0 + w, dtype=np.float32)[None, :]
+    return (1500.0 + 300.0 * np.sin(x / 2900.0) * np.cos(y / 3700.0) + 0.02 * x
+            + 3.0 * np.sin(x / 3.1) * np.cos(y / 4.3)).astype(np.float32)
+
+
+def fine_relief(y0: int, x0: int, h: int, w: int) -> np.ndarray:
+    y = np.arange(y0, y0 + h, dtype=np.float32)[:, None]
+    x = np.arange(x0, x0 + w, dtype=np.float32)[None, :]
+    return (3.0 * np.sin(x / 3.1) * np.cos(y / 4.3)).astype(np.float32)
+
+
+def blend_seams_loop(canvas: np.ndarray, tile_w: int, tile_h: int,
+                     cols: int, rows: int, blend_px: int) -> np.ndarray:
+    """The seam blending combine_tiles.py used before: a straight line across each band, pixel by pixel."""
+    out  = canvas.copy()
+    h, w = canvas.shape
+    for col in range(1, cols):
+        x = col * tile_w
+        left, right = max(0, x - blend_px), min(w - 1, x + blend_px)
+        for px in range(left, right + 1):
+            alpha = (px - left) / max(1, right - left)
+            out[:, px] = (1.0 - alpha) * canvas[:, left] + alpha * canvas[:, right]
+    for row in range(1, rows):
+        y = row * tile_h
+        top, bottom = max(0, y - blend_px), min(h - 1, y + blend_px)
+        for py in range(top, bottom + 1):
+            alpha = (py - top) / max(1, bottom - top)
+            out[py, :] = (1.0 - alpha) * canvas[top, :] + alpha * canvas[bottom, :]
+    return out
+
+
+def seam_quality(canvas: np.ndarray, seams_x: list[int], band: int) -> dict:
+    """Remaining step and surviving fine relief across the vertical seams at `seams_x`."""
+    rows   = slice(0, min(canvas.shape[0], 2048))
+    steps  = []
+    relief = []
+    for x in seams_x:
+        x0, x1 = x - band - 1, x + band + 1   # the band and a pixel either side
+        got   = canvas[rows, x0:x1].astype(np.float64)
+        want  = terrain(0, x0, got.shape[0], x1 - x0).astype(np.float64)
+        steps.append(np.abs(np.diff(got, axis=1) - np.diff(want, axis=1)).max(axis=1).mean())
+        # Fine relief = what is left after removing each row's straight-line trend.
+        fine  = fine_relief(0, x0, got.shape[0], x1 - x0).astype(np.float64)
+        resid = (got - want) - (got - want).mean(axis=1, keepdims=True)
+        kept  = np.sum((fine + resid) * fine) / np.sum(fine * fine)
+        relief.append(kept)
+    return {"seam_step_m": round(float(np.mean(steps)), 4),
+            "relief_kept": round(float(np.mean(relief)), 3)}
+
+
+def grid_plan(grid: int, tile: int, overlap: int, blend_px: int) -> tuple[list, tuple]:
+    """combine_tiles.py's plan and seams for a full grid of tiles."""
+    n      = grid * grid
+    layout = combine_tiles._grid_layout([Path(f"tile_{i}") for i in range(n)],
+                                        [(tile, tile)] * n, (grid, grid), overlap)
+    return layout["plan"], combine_tiles._link_tiles(layout["plan"], blend_px)
+
+
+def make_canvas(grid: int, tile: int, overlap: int, rng) -> tuple[np.ndarray, list]:
+    """Tiles of the synthetic terrain, each offset by a random few metres, and their positions."""
+    step   = tile - overlap
+    size   = grid * step + overlap
+    canvas = np.zeros((size, size), dtype=np.float32)
+    tiles  = []
+    for r in range(grid):
+        for c in range(grid):
+            data = terrain(r * step, c * step, tile, tile) + np.float32(rng.uniform(-5.0, 5.0))
+            tiles.append((r, c, data))
+    return canvas, tiles
+
+
+def bench_seams(args, rng) -> dict:
+    canvas, tiles = make_canvas(args.grid, args.tile_px, 0, rng)
+    for r, c, data in tiles:
+        canvas[r * args.tile_px:(r + 1) * args.tile_px, c * args.tile_px:(c + 1) * args.tile_px] = data
+    del tiles
+    seams  = [c * args.tile_px for c in range(1, min(args.grid, 4))]
+    band   = min(args.blend_px, args.tile_px // 2)
+    plan, tile_seams = grid_plan(args.grid, args.tile_px, 0, args.blend_px)
+    result = {"before": seam_quality(canvas, seams, band)}
+
+    if not args.no_reference:
+        t0  = time.perf_counter()
+        ref = blend_seams_loop(canvas, args.tile_px, args.tile_px, args.grid, args.grid, args.blend_px)
+        result["loop"] = {"time_s": round(time.perf_counter() - t0, 4),
+                          **seam_quality(ref, seams, band)}
+        del ref
+
+    t0 = time.perf_counter()
+    combine_tiles._blend_seams(canvas, *tile_seams, plan)
+    result["vectorized"] = {"time_s": round(time.perf_counter() - t0, 4),
+                            **seam_quality(canvas, seams, band)}
+    return result
+
+
+def bench_overlap(args, rng) -> dict:
+    ov            = args.overlap
+    step          = args.tile_px - ov
+    plan, _       = grid_plan(args.grid, args.tile_px, ov, args.blend_px)
+    canvas, tiles = make_canvas(args.grid, args.tile_px, ov, rng)
+    seams         = [c * step + ov // 2 for c in range(1, min(args.grid, 4))]
+
+    t0 = time.perf_counter()
+    for r, c, data in tiles:
+        canvas[r * step:r * step + args.tile_px, c * step:c * step + args.tile_px] = data
+    result = {"assign": {"time_s": round(time.perf_counter() - t0, 4),
+                         **seam_quality(canvas, seams, ov // 2)}}
+
+    canvas[...] = 0.0
+    t0 = time.perf_counter()
+    for tile, (r, c, data) in zip(plan, tiles):
+        combine_tiles._place_tile(canvas, data, r * step, c * step, tile["fade_y"], tile["fade_x"])
+    combine_tiles._normalize_weights(canvas, plan)
+    result["cross_fade"] = {"time_s": round(time.perf_counter() - t0, 4),
+                            **seam_quality(canvas, seams, ov // 2)}
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--grid",     type=int, default=10, help="Tiles per side.")
+    parser.add_argument("--tile-px",  type=int, default=4096)
+    parser.add_argument("--blend-px", type=int, default=combine_tiles.BLEND_PX)
+    parser.add_argument("--overlap",  type=int, default=64,
+                        help="Pixels shared by neighbouring tiles in the overlap case (0 = skip it).")
+    parser.add_argument("--no-reference", action="store_true",
+                        help="Skip the old per-pixel loop (it needs a second copy of the canvas).")
+    parser.add_argument("--seed",     type=int, default=1)
+    parser.add_argument("--out",      default=None,
+                        help="Results JSON (default: <tmp>/terrain_fetcher_bench/blend_results.json).")
+    args = parser.parse_args()
+
+    out = Path(args.out) if args.out else \
+        Path(tempfile.gettempdir()) / "terrain_fetcher_bench" / "blend_results.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    rng  = np.random.default_rng(args.seed)
+    side = args.grid * args.tile_px
+    print(f"{args.grid}x{args.grid} tiles of {args.tile_px} px: canvas {side} x {side} "
+          f"({side * side * 4 / 1024 ** 3:.2f} GB)")
+
+    results = {"seams": bench_seams(args, rng)}
+    if args.overlap:
+        results["overlap"] = bench_overlap(args, rng)
+
+    for case, runs in results.items():
+        for name, r in runs.items():
+            t = f"{r['time_s']:8.3f}s" if "time_s" in r else " " * 9
+            print(f"  {case:<8} {name:<11} {t}  step {r['seam_step_m']:7.3f} m  "
+                  f"relief kept {r['relief_kept']:5.2f}")
+
+    out.write_text(json.dumps({"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                               "python": sys.version.split()[0],
+                               "cpus": os.cpu_count(),
+                               "grid": args.grid, "tile_px": args.tile_px,
+                               "blend_px": args.blend_px, "overlap": args.overlap,
+                               "results": results}, indent=2))
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+bench_encoders.py
+-----------------
+Benchmark of the color map encoders in image_encoders.py: for each output
+size and format it records
+
+  encode_s   time to write the file (best of --repeat)
+  bytes      file size
+  decode_s   time for Pillow to decode it again (first mip level for DDS)
+  godot_s    time for Godot to load it into a Texture2D, mipmaps included
+             (only with --godot; PNG/WebP are decoded and mipmapped on the
+             CPU, DDS is read as-is. A --headless Godot skips the GPU upload)
+
+The input is a synthetic color map (the mock exportImage pattern plus
+noise, which compresses about like aerial imagery) unless --image is given.
+Results go to a JSON file and a short table is printed.
+
+Usage:
+    python3 bench_encoders.py [--sizes 1024 4096] [--formats png webp dds-bc1 ...] \
+                              [--png-levels 1 6] [--image FILE] [--repeat 3] \
+                              [--godot /path/to/godot] [--work-dir DIR] [--out FILE]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import image_encoders
+from mock_server import render_export
+
+try:
+    from PIL import Image
+except ImportError:
+    print("ERROR: Pillow not installed. Run setup.py --install first.", file=sys.stderr)
+    sys.exit(1)
+
+BBOX = (-105.475, 39.775, -105.275, 39.975)
+
+# Loads every file given after "--" and prints "@@load <path> <usec> <ok|fail>".
+GODOT_SCRIPT = """extends SceneTree
+
+func _init() -> void:
+	for path in OS.get_cmdline_user_args():
+		var t0 := Time.get_ticks_usec()
+		var tex: Texture2D = null
+		if path.get_extension() == "dds":
+			tex = ResourceLoader.load(path, "", ResourceLoader.CACHE_MODE_IGNORE) as Texture2D
+		else:
+			var img := Image.load_from_file(path)
+			if img:
+				img.generate_mipmaps()
+				tex = ImageTexture.create_from_image(img)
+		var dt := Time.get_ticks_usec() - t0
+		print("@@load %s %d %s" % [path, dt, "ok" if tex else "fail"])
+	quit()
+"""
+
+
+def synthetic_image(size: int) -> "Image.Image":
+    """The mock exportImage pattern plus per-pixel noise."""
+    with Image.open(BytesIO(render_export(BBOX, size, size))) as im:
+        arr = np.asarray(im.convert("RGB")).astype(np.int16)
+    noise = np.random.default_rng(0).normal(0, 12, arr.shape).astype(np.int16)
+    return Image.fromarray(np.clip(arr + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def variants(formats: list[str], png_levels: list[int]) -> list[tuple]:
+    """(label, format, png_level) for every run."""
+    out = []
+    for fmt in formats:
+        if fmt == "png":
+            out += [(f"png-{lvl}", "png", lvl) for lvl in png_levels]
+        else:
+            out.append((fmt, fmt, image_encoders.DEFAULT_PNG_LEVEL))
+    return out
+
+
+def time_encode(img, path: Path, fmt: str, png_level: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        image_encoders.save(img, path, fmt, png_level)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def time_decode(path: Path, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with Image.open(path) as im:
+            im.load()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def godot_load_times(godot: str, paths: list[Path], work: Path) -> dict:
+    """{path: seconds or None} from one headless Godot run."""
+    script = work / "load_bench.gd"
+    script.write_text(GODOT_SCRIPT)
+    proc = subprocess.run([godot, "--headless", "--script", str(script), "--",
+                           *[str(p) for p in paths]],
+                          capture_output=True, text=True, timeout=600)
+    times = {str(p): None for p in paths}
+    for line in proc.stdout.splitlines():
+        m = re.match(r"@@load (.+) (\d+) (ok|fail)$", line)
+        if m and m.group(3) == "ok":
+            times[m.group(1)] = int(m.group(2)) / 1e6
+    if proc.returncode != 0:
+        print(f"  Warning: godot exited with {proc.returncode}", file=sys.stderr)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes",      type=int, nargs="+", default=[1024, 4096])
+    parser.add_argument("--formats",    nargs="+", choices=list(image_encoders.FORMATS),
+                        default=list(image_encoders.FORMATS))
+    parser.add_argument("--png-levels", type=int, nargs="+", default=[1, 6])
+    parser.add_argument("--image",      default=None,
+                        help="Encode this image (resized to each size) instead of a synthetic one.")
+    parser.add_argument("--repeat",     type=int, default=3)
+    parser.add_argument("--godot",      default=None, help="Godot 4 binary for load times.")
+    parser.add_argument("--work-dir",   default=str(Path(tempfile.gettempdir()) / "terrain_fetcher_bench"))
+    parser.add_argument("--out",        default=None,
+                        help="Results JSON (default: <work-dir>/encoder_results.json).")
+    args = parser.parse_args()
+
+    work = Path(args.work_dir) / "encoders"
+    work.mkdir(parents=True, exist_ok=True)
+    out  = Path(args.out) if args.out else work.parent / "encoder_results.json"
+    if "dds-bc7" in args.formats and importlib.util.find_spec("etcpak") is None:
+        print("  etcpak not installed -- skipping dds-bc7")
+        args.formats.remove("dds-bc7")
+
+    results = []
+    for size in args.sizes:
+        if args.image:
+            with Image.open(args.image) as im:
+                img = im.convert("RGB").resize((size, size), Image.LANCZOS)
+        else:
+            img = synthetic_image(size)
+        print(f"{size}x{size}:")
+        for label, fmt, level in variants(args.formats, args.png_levels):
+            path = work / f"{size}_{label}{image_encoders.suffix(fmt)}"
+            enc  = time_encode(img, path, fmt, level, args.repeat)
+            dec  = time_decode(path, args.repeat)
+            results.append({"size": size, "format": label, "path": str(path),
+                            "encode_s": round(enc, 4), "bytes": path.stat().st_size,
+                            "decode_s": round(dec, 4), "godot_s": None})
+            print(f"  {label:<14} encode {enc:7.3f}s  {path.stat().st_size / 1024 / 1024:8.2f} MB  "
+                  f"decode {dec:6.3f}s")
+
+    if args.godot:
+        times = godot_load_times(args.godot, [Path(r["path"]) for r in results], work)
+        print("Godot load:")
+        for r in results:
+            r["godot_s"] = times.get(r["path"])
+            shown = f"{r['godot_s']:.3f}s" if r["godot_s"] is not None else "failed"
+            print(f"  {r['size']:>5} {r['format']:<14} {shown}")
+
+    out.write_text(json.dumps({"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                               "python": sys.version.split()[0],
+                               "cpus": os.cpu_count(),
+                               "input": args.image or "synthetic",
+                               "results": results}, indent=2))
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+bench_exr.py
+------------
+Benchmark of the heightmap EXR options in exr_io.py: for each output size,
+channel layout, pixel type and compression it records
+
+  write_s    time for ScanlineWriter to write the file (best of --repeat)
+  bytes      file size
+  read_s     time to read the R channel back as float32 (best of --repeat)
+  max_err_m  largest difference between what was read back and the input,
+             in metres (0 = lossless); for half pixels also the rounding
+             error ScanlineWriter reported (writer_err_m)
+
+The input is a synthetic heightmap (hills from --base-m up by about 1500 m
+with a few metres of fine relief) unless --exr names a float EXR to use.
+Results go to a JSON file and a short table is printed.
+
+Usage:
+    python3 bench_exr.py [--sizes 1024 4096] [--channels r rgb] \
+                         [--pixel-types float half] [--compressions zip piz ...] \
+                         [--base-m 1500] [--exr FILE] [--repeat 3] \
+                         [--work-dir DIR] [--out FILE]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import exr_io
+
+
+def synthetic_heightmap(size: int, base_m: float) -> np.ndarray:
+    y = np.linspace(0.0, 40.0, size, dtype=np.float32)[:, None]
+    x = np.linspace(0.0, 40.0, size, dtype=np.float32)[None, :]
+    hills = 750.0 * (1.0 + np.sin(x / 7.0) * np.cos(y / 9.0)) + 40.0 * np.sin(x * 1.3 + y)
+    rng   = np.random.default_rng(size)
+    return (base_m + hills + rng.normal(0.0, 2.0, (size, size))).astype(np.float32)
+
+
+def read_heightmap(path: Path) -> np.ndarray:
+    with exr_io.ScanlineReader(path) as exr:
+        return exr.read(0, exr.height)
+
+
+def time_write(data: np.ndarray, path: Path, options: dict, repeat: int) -> tuple[float, float]:
+    best, error = float("inf"), 0.0
+    h, w = data.shape
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with exr_io.ScanlineWriter(path, w, h, **options) as exr:
+            for y0, y1 in exr_io.row_blocks(h):
+                exr.write(data[y0:y1])
+        best  = min(best, time.perf_counter() - t0)
+        error = exr.max_error
+    return best, error
+
+
+def time_read(path: Path, repeat: int) -> tuple[float, np.ndarray]:
+    best = float("inf")
+    for _ in range(repeat):
+        t0   = time.perf_counter()
+        back = read_heightmap(path)
+        best = min(best, time.perf_counter() - t0)
+    return best, back
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes",        type=int, nargs="+", default=[1024, 4096])
+    parser.add_argument("--channels",     nargs="+", choices=list(exr_io.CHANNELS),
+                        default=list(exr_io.CHANNELS))
+    parser.add_argument("--pixel-types",  nargs="+", choices=exr_io.PIXEL_TYPES,
+                        default=list(exr_io.PIXEL_TYPES))
+    parser.add_argument("--compressions", nargs="+", choices=exr_io.COMPRESSIONS,
+                        default=list(exr_io.COMPRESSIONS))
+    parser.add_argument("--base-m",       type=float, default=1500.0,
+                        help="Lowest elevation of the synthetic heightmap; half precision "
+                             "coarsens with height.")
+    parser.add_argument("--exr",          default=None,
+                        help="Use this heightmap (R channel) instead; --sizes is ignored.")
+    parser.add_argument("--repeat",       type=int, default=3)
+    parser.add_argument("--work-dir",     default=str(Path(tempfile.gettempdir()) / "terrain_fetcher_bench"))
+    parser.add_argument("--out",          default=None,
+                        help="Results JSON (default: <work-dir>/exr_results.json).")
+    args = parser.parse_args()
+
+    work = Path(args.work_dir) / "exr"
+    work.mkdir(parents=True, exist_ok=True)
+    out  = Path(args.out) if args.out else Path(args.work_dir) / "exr_results.json"
+
+    if args.exr:
+        inputs = [(Path(args.exr).name, read_heightmap(Path(args.exr)))]
+    else:
+        inputs = [(f"{s}x{s}", synthetic_heightmap(s, args.base_m)) for s in args.sizes]
+
+    results = []
+    for name, data in inputs:
+        h, w = data.shape
+        print(f"{name} ({w}x{h}, {float(np.nanmin(data)):.0f}-{float(np.nanmax(data)):.0f} m):")
+        for channels in args.channels:
+            for pixel_type in args.pixel_types:
+                for compression in args.compressions:
+                    options = {"channels": exr_io.CHANNELS[channels],
+                               "pixel_type": pixel_type, "compression": compression}
+                    path    = work / f"{name}_{channels}_{pixel_type}_{compression}.exr"
+                    write_s, writer_err = time_write(data, path, options, args.repeat)
+                    read_s, back        = time_read(path, args.repeat)
+                    max_err = float(np.nanmax(np.abs(back - data)))
+                    r = {"input": name, "width": w, "height": h, **options,
+                         "write_s": round(write_s, 4), "read_s": round(read_s, 4),
+                         "bytes": path.stat().st_size, "max_err_m": round(max_err, 4)}
+                    if pixel_type == "half":
+                        r["writer_err_m"] = round(writer_err, 4)
+                    results.append(r)
+                    print(f"  {exr_io.describe(options):<16} write {write_s:7.3f}s  "
+                          f"read {read_s:7.3f}s  {r['bytes'] / 1024 / 1024:8.2f} MB  "
+                          f"max error {max_err:7.3f} m")
+                    path.unlink()
+
+    out.write_text(json.dumps({"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                               "python": sys.version.split()[0],
+                               "cpus": os.cpu_count(),
+                               "base_m": args.base_m,
+                               "results": results}, indent=2))
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+bench_startup.py
+----------------
+Start-up cost of the scripts, each run as a fresh process like the plugin
+does (median of --repeat runs):
+
+  bare        `python -c pass`, the interpreter floor
+  check       setup.py --check
+  <script>    `<script> --help`: module imports plus argument parsing
+  *_cached    process_dem.py / process_imagery.py / fetch_pipeline.py on an
+              output directory that is already up to date (the cache-hit
+              path, which should not need numpy, GDAL or OpenEXR at all)
+
+The cached output is produced once from the mock server. With --importtime
+the heaviest imports of each cache-hit run are listed (python -X importtime).
+Results go to a JSON file and a short table is printed.
+
+Usage:
+    python3 bench_startup.py [--repeat 7] [--importtime] [--work-dir DIR] [--out FILE]
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_server import MockServer
+from synth_tiles import grid_bbox_wgs, make_tiles
+
+SCRIPT_DIR = Path(__file__).resolve().parent.parent
+SCRIPTS    = ["process_dem.py", "process_imagery.py", "fetch_pipeline.py",
+              "combine_tiles.py", "compose_canvas.py", "previews.py", "worker.py"]
+
+
+def timed(cmd: list[str], env: dict | None = None) -> tuple[float, subprocess.CompletedProcess]:
+    t0   = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=SCRIPT_DIR, env=env)
+    return time.perf_counter() - t0, proc
+
+
+def median_time(cmd: list[str], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        dt, proc = timed(cmd)
+        if proc.returncode not in (0, 1):
+            raise RuntimeError(f"{' '.join(cmd[1:3])} failed: {proc.stderr[-500:]}")
+        times.append(dt)
+    return round(statistics.median(times), 4)
+
+
+def heaviest_imports(cmd: list[str], top: int = 8) -> list[tuple[str, float]]:
+    """(module, cumulative ms) of the slowest top-level imports of one run."""
+    _, proc = timed([cmd[0], "-X", "importtime", *cmd[1:]])
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if m and len(m.group(2)) <= 1:   # top level only
+            rows.append((m.group(3), int(m.group(1)) / 1000))
+    return sorted(rows, key=lambda r: -r[1])[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat",     type=int, default=7)
+    parser.add_argument("--importtime", action="store_true",
+                        help="List the heaviest imports of each cache-hit run.")
+    parser.add_argument("--work-dir",   default=str(Path(tempfile.gettempdir()) / "terrain_fetcher_bench"))
+    parser.add_argument("--out",        default=None,
+                        help="Results JSON (default: <work-dir>/startup_results.json).")
+    args = parser.parse_args()
+
+    work = Path(args.work_dir) / "startup"
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    out  = Path(args.out) if args.out else work.parent / "startup_results.json"
+    py   = sys.executable
+
+    tiles = make_tiles(Path(args.work_dir) / "tiles_worker_600", 1, 600)
+    bbox  = [str(v) for v in grid_bbox_wgs(1)]
+    srv   = MockServer(tiles[0].parent).start()
+    try:
+        dem_urls = work / "dem_urls.txt"
+        img_urls = work / "img_urls.txt"
+        dem_urls.write_text(srv.tile_url(tiles[0].name))
+        img_urls.write_text(srv.export_url(tuple(float(v) for v in bbox), 512))
+        cached = work / "cached"
+        dt, proc = timed([py, str(SCRIPT_DIR / "fetch_pipeline.py"),
+                          "--dem-url-list", str(dem_urls), "--imagery-url-list", str(img_urls),
+                          "--out-dir", str(cached), "--bbox", *bbox, "--dem-args=--no-cache"])
+        if proc.returncode != 0:
+            raise RuntimeError(f"Could not build the cached output: {proc.stderr[-500:]}")
+    finally:
+        srv.stop()
+
+    cases = {
+        "bare":  [py, "-c", "pass"],
+        "check": [py, str(SCRIPT_DIR / "setup.py"), "--check"],
+    }
+    for script in SCRIPTS:
+        cases[Path(script).stem] = [py, str(SCRIPT_DIR / script), "--help"]
+    cases["process_dem_cached"] = [py, str(SCRIPT_DIR / "process_dem.py"),
+                                   "--url-list", str(dem_urls), "--out-dir", str(cached),
+                                   "--bbox", *bbox]
+    cases["process_imagery_cached"] = [py, str(SCRIPT_DIR / "process_imagery.py"),
+                                       "--url-list", str(img_urls), "--out-dir", str(cached),
+                                       "--bbox", *bbox]
+    cases["fetch_pipeline_cached"] = [py, str(SCRIPT_DIR / "fetch_pipeline.py"),
+                                      "--dem-url-list", str(dem_urls),
+                                      "--imagery-url-list", str(img_urls),
+                                      "--out-dir", str(cached), "--bbox", *bbox]
+
+    results = {}
+    for name, cmd in cases.items():
+        results[name] = {"median_s": median_time(cmd, args.repeat)}
+        print(f"  {name:<24} {results[name]['median_s'] * 1000:8.1f} ms")
+        if args.importtime and name.endswith("_cached"):
+            results[name]["imports_ms"] = heaviest_imports(cmd)
+            for module, ms in results[name]["imports_ms"]:
+                print(f"      {module:<28} {ms:7.1f} ms")
+
+    out.write_text(json.dumps({"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                               "python": sys.version.split()[0],
+                               "cpus": os.cpu_count(),
+                               "repeat": args.repeat,
+                               "results": results}, indent=2))
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
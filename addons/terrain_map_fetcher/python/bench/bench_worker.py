@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+bench_worker.py
+---------------
+Per-call latency of the persistent worker (worker.py, over its stdio
+transport) against the one-interpreter-per-call path the plugin uses
+without it. Each case is timed --repeat times both ways:
+
+  version         `python --version` (find_python) vs the ping method
+  check           setup.py --check vs check_dependencies
+  dem_cached      process_dem.py on an up-to-date output (argument parsing,
+                  imports and the cache check -- the fixed cost of a call)
+  imagery_cached  the same for process_imagery.py
+  dem_fetch       a small real DEM job from the mock server (--no-cache,
+                  fresh output directory each time)
+
+It also records the worker's start-up time (launch to first ping reply)
+and its first, still-cold call. Results go to a JSON file and a short
+table is printed.
+
+Usage:
+    python3 bench_worker.py [--repeat 5] [--tile-px 600] [--work-dir DIR] [--out FILE]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_server import MockServer
+from synth_tiles import grid_bbox_wgs, make_tiles
+
+SCRIPT_DIR = Path(__file__).resolve().parent.parent
+
+
+class WorkerClient:
+    """Minimal JSON-RPC client for worker.py --stdio."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen([sys.executable, str(SCRIPT_DIR / "worker.py"), "--stdio",
+                                      "--idle-timeout", "0"],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     text=True, bufsize=1, cwd=SCRIPT_DIR)
+        self._next = 0
+
+    def call(self, method: str, params: dict | None = None):
+        self._next += 1
+        self.proc.stdin.write(json.dumps({"jsonrpc": "2.0", "id": self._next,
+                                          "method": method, "params": params or {}}) + "\n")
+        self.proc.stdin.flush()
+        for line in self.proc.stdout:
+            msg = json.loads(line)
+            if msg.get("id") == self._next:
+                if "error" in msg:
+                    raise RuntimeError(f"{method}: {msg['error']['message']}")
+                return msg["result"]
+        raise RuntimeError("worker exited")
+
+    def close(self) -> None:
+        self.call("shutdown")
+        self.proc.stdin.close()
+        self.proc.wait(timeout=30)
+
+
+def spawn(cmd: list[str]) -> float:
+    t0   = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=SCRIPT_DIR)
+    dt   = time.perf_counter() - t0
+    if proc.returncode not in (0, 1):   # setup.py --check exits 1 when something is missing
+        raise RuntimeError(f"{Path(cmd[1]).name} failed: {proc.stderr[-500:]}")
+    return dt
+
+
+def rpc(client: WorkerClient, method: str, args: list[str] | None = None) -> float:
+    t0     = time.perf_counter()
+    result = client.call(method, {"args": args} if args is not None else None)
+    dt     = time.perf_counter() - t0
+    if isinstance(result, dict) and result.get("exit_code"):
+        raise RuntimeError(f"{method} exited with {result['exit_code']}")
+    return dt
+
+
+def summary(times: list[float]) -> dict:
+    return {"median_s": round(statistics.median(times), 4), "min_s": round(min(times), 4),
+            "runs": [round(t, 4) for t in times]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat",   type=int, default=5)
+    parser.add_argument("--tile-px",  type=int, default=600,
+                        help="Size of the synthetic DEM tile of the dem_fetch case.")
+    parser.add_argument("--work-dir", default=str(Path(tempfile.gettempdir()) / "terrain_fetcher_bench"))
+    parser.add_argument("--out",      default=None,
+                        help="Results JSON (default: <work-dir>/worker_results.json).")
+    args = parser.parse_args()
+
+    work = Path(args.work_dir) / "worker"
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    out  = Path(args.out) if args.out else work.parent / "worker_results.json"
+
+    tiles = make_tiles(Path(args.work_dir) / f"tiles_worker_{args.tile_px}", 1, args.tile_px)
+    bbox  = [str(v) for v in grid_bbox_wgs(1)]
+    srv   = MockServer(tiles[0].parent).start()
+    try:
+        dem_urls = work / "dem_urls.txt"
+        img_urls = work / "img_urls.txt"
+        dem_urls.write_text(srv.tile_url(tiles[0].name))
+        img_urls.write_text(srv.export_url(tuple(float(v) for v in bbox), 512))
+
+        # One complete output for the cached cases.
+        cached  = work / "cached"
+        dem_arg = ["--url-list", str(dem_urls), "--out-dir", str(cached), "--bbox", *bbox,
+                   "--no-cache"]
+        img_arg = ["--url-list", str(img_urls), "--out-dir", str(cached), "--bbox", *bbox]
+        py      = sys.executable
+        spawn([py, str(SCRIPT_DIR / "process_dem.py"), *dem_arg])
+        spawn([py, str(SCRIPT_DIR / "process_imagery.py"), *img_arg])
+
+        def fetch_args(n: int) -> list[str]:
+            return ["--url-list", str(dem_urls), "--out-dir", str(work / f"fetch_{n}"),
+                    "--bbox", *bbox, "--no-cache"]
+
+        cases = {   # name -> (spawned command, (rpc method, args or None))
+            "version":        (lambda n: [py, "--version"], lambda n: ("ping", None)),
+            "check":          (lambda n: [py, str(SCRIPT_DIR / "setup.py"), "--check"],
+                               lambda n: ("check_dependencies", None)),
+            "dem_cached":     (lambda n: [py, str(SCRIPT_DIR / "process_dem.py"), *dem_arg],
+                               lambda n: ("process_dem", dem_arg)),
+            "imagery_cached": (lambda n: [py, str(SCRIPT_DIR / "process_imagery.py"), *img_arg],
+                               lambda n: ("process_imagery", img_arg)),
+            "dem_fetch":      (lambda n: [py, str(SCRIPT_DIR / "process_dem.py"), *fetch_args(n)],
+                               lambda n: ("process_dem", fetch_args(n))),
+        }
+
+        t0      = time.perf_counter()
+        client  = WorkerClient()
+        client.call("ping")
+        startup = time.perf_counter() - t0
+        first   = rpc(client, "process_dem", dem_arg)
+
+        results = {}
+        n       = 0
+        for name, (cmd, method) in cases.items():
+            spawned, served = [], []
+            for _ in range(args.repeat):
+                n += 1
+                spawned.append(spawn(cmd(n)))
+                n += 1
+                served.append(rpc(client, *method(n)))
+            results[name] = {"spawn": summary(spawned), "worker": summary(served),
+                             "speedup": round(statistics.median(spawned)
+                                              / statistics.median(served), 1)}
+        client.close()
+    finally:
+        srv.stop()
+
+    print(f"Worker start-up: {startup:.3f}s, first (cold) process_dem call: {first:.3f}s")
+    print(f"{'case':<16}{'spawn':>10}{'worker':>10}{'speedup':>9}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['spawn']['median_s']:>9.3f}s{r['worker']['median_s']:>9.3f}s"
+              f"{r['speedup']:>8.1f}x")
+
+    out.write_text(json.dumps({"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                               "python": sys.version.split()[0],
+                               "cpus": os.cpu_count(),
+                               "repeat": args.repeat,
+                               "worker_startup_s": round(startup, 4),
+                               "first_call_s": round(first, 4),
+                               "results": results}, indent=2))
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+check_reuse.py
+--------------
+Offline check of process_dem.py's reuse path (a nudged bbox) against the
+local mock server, with 3DEP-named 1x1 degree tiles so that _may_cover()
+leaves some of them out of the second run:
+
+  1. fetch a bbox around the corner the four tiles n41w106, n41w105,
+     n40w106 and n40w105 share
+  2. nudge it south in the same output directory: the overlap is reused and
+     only the southern strip, on the two n40 tiles, is fetched
+and fails unless run 2 reused pixels, downloaded only the n40 tiles,
+reported exactly the tiles it downloaded as warped into the mosaic, holds
+run 1's pixels unchanged where the two overlap and has no NoData left in
+the strip it fetched.
+
+Usage:
+    python3 check_reuse.py [--tile-px 720] [--max-size 1024] [--work-dir DIR] [--keep]
+"""
+
+import argparse
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from mock_server import MockServer
+from synth_tiles import make_tiles
+
+SCRIPT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SCRIPT_DIR))
+import exr_io            # noqa: E402
+import output_manifest   # noqa: E402
+
+ORIGIN = (-106.0, 41.0)    # NW corner of n41w106
+NAMES  = ["USGS_13_n41w106.tif", "USGS_13_n41w105.tif",
+          "USGS_13_n40w106.tif", "USGS_13_n40w105.tif"]   # make_tiles' row-major order
+BBOX   = (-105.10, 39.92, -104.90, 40.08)
+NUDGE  = 0.03              # degrees south
+
+
+def run_dem(urls: Path, out_dir: Path, bbox: tuple, args) -> str:
+    cmd  = [sys.executable, "-u", str(SCRIPT_DIR / "process_dem.py"),
+            "--url-list", str(urls), "--out-dir", str(out_dir),
+            "--bbox", *[str(v) for v in bbox], "--max-size", str(args.max_size),
+            "--no-cache"]
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=SCRIPT_DIR)
+    if proc.returncode != 0:
+        sys.exit(f"process_dem.py failed:\n{proc.stdout}\n{proc.stderr}")
+    return proc.stdout
+
+
+def read_dem(out_dir: Path) -> tuple[np.ndarray, dict]:
+    with exr_io.ScanlineReader(out_dir / "heightmap_000.exr") as r:
+        return r.read(0, r.height), output_manifest.load(out_dir)["dem"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tile-px",  type=int, default=720)
+    parser.add_argument("--max-size", type=int, default=1024)
+    parser.add_argument("--work-dir", default=str(Path(tempfile.gettempdir()) / "terrain_fetcher_bench"))
+    parser.add_argument("--keep",     action="store_true", help="Keep run outputs.")
+    args = parser.parse_args()
+
+    work  = Path(args.work_dir)
+    synth = make_tiles(work / f"tiles_3dep_2x2_{args.tile_px}", 2, args.tile_px, 1.0,
+                       origin=ORIGIN)
+    runs  = work / "reuse"
+    shutil.rmtree(runs, ignore_errors=True)
+    root  = runs / "tiles"
+    root.mkdir(parents=True)
+    for src, name in zip(synth, NAMES):
+        shutil.copyfile(src, root / name)
+
+    nudged = (BBOX[0], BBOX[1] - NUDGE, BBOX[2], BBOX[3] - NUDGE)
+    srv    = MockServer(root).start()
+    try:
+        urls = runs / "dem_urls.txt"
+        urls.write_text("\n".join(srv.tile_url(n) for n in NAMES))
+        run_dem(urls, runs / "out", BBOX, args)
+        first, first_meta = read_dem(runs / "out")
+        log = run_dem(urls, runs / "out", nudged, args)
+    finally:
+        srv.stop()
+    second, second_meta = read_dem(runs / "out")
+
+    fetched = set(re.findall(r"(USGS_13_\w+\.tif) ready", log))
+    warped  = set(re.findall(r"(USGS_13_\w+\.tif): warped into mosaic", log))
+    # Where run 1's grid lies in run 2's (rows, cols of its top-left pixel).
+    rows    = round((first_meta["transform"][5] - second_meta["transform"][5])
+                    / second_meta["transform"][4])
+    cols    = round((first_meta["transform"][2] - second_meta["transform"][2])
+                    / second_meta["transform"][0])
+    y0, x0  = max(0, rows), max(0, cols)
+    y1      = min(second.shape[0], rows + first.shape[0])
+    x1      = min(second.shape[1], cols + first.shape[1])
+    same    = y1 > y0 and x1 > x0 and np.array_equal(
+        second[y0:y1, x0:x1], first[y0 - rows:y1 - rows, x0 - cols:x1 - cols])
+    checks  = {
+        "overlap reused":              "Reusing " in log,
+        "only the n40 tiles fetched":  fetched == set(NAMES[2:]),
+        "warped tiles were fetched":   warped == fetched,
+        "overlap unchanged":           same,
+        "strip filled":                bool(np.isfinite(second).all() and second.min() > 1000.0),
+    }
+    print(f"Fetched {sorted(fetched)}, warped {sorted(warped)}; "
+          f"{(y1 - y0) * (x1 - x0)} px shared with run 1")
+    for name, ok in checks.items():
+        print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    if not args.keep:
+        shutil.rmtree(runs, ignore_errors=True)
+    if not all(checks.values()):
+        print(log, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+mock_server.py
+--------------
+Local stand-in for the USGS TNM download host and the NAIP ImageServer, for
+benchmarks that must not touch tnmaccess.nationalmap.gov / gis.apfo.usda.gov.
+
+  GET/HEAD /tiles/<name>   static files from --root, with Content-Length,
+                           ETag/Last-Modified, keep-alive and single-range
+                           (206) support -- what downloader.py relies on
+  GET .../exportImage?...  a synthetic PNG for bbox/size (bboxSR 4326),
+                           rendered from lon/lat so adjacent requests agree
+
+Optional --latency-ms delays every response and --bandwidth-mbps throttles
+each connection, to model a remote server. Bytes sent are counted per path
+kind so a benchmark can report bytes moved.
+
+Usage:
+    python3 mock_server.py --root /tmp/tiles [--port 8765] \
+                           [--latency-ms 0] [--bandwidth-mbps 0]
+"""
+
+import argparse
+import email.utils
+import io
+import os
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    print("ERROR: Pillow not installed. Run setup.py --install first.", file=sys.stderr)
+    sys.exit(1)
+
+CHUNK = 64 * 1024
+
+
+@lru_cache(maxsize=16)
+def render_export(bbox: tuple, width: int, height: int) -> bytes:
+    """A width x height RGB PNG of a lon/lat pattern over `bbox`."""
+    lon = bbox[0] + (np.arange(width) + 0.5) * (bbox[2] - bbox[0]) / width
+    lat = bbox[3] - (np.arange(height) + 0.5) * (bbox[3] - bbox[1]) / height
+    r   = (128 + 100 * np.sin(lon * 300)).astype(np.uint8)
+    g   = (128 + 100 * np.cos(lat * 300)).astype(np.uint8)
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    rgb[..., 0] = r[np.newaxis, :]
+    rgb[..., 1] = g[:, np.newaxis]
+    rgb[..., 2] = (128 + 60 * np.sin((lon[np.newaxis, :] + lat[:, np.newaxis]) * 200)).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(rgb, "RGB").save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root: Path, port: int = 0, latency_ms: float = 0.0,
+                 bandwidth_mbps: float = 0.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.root           = Path(root)
+        self.latency        = latency_ms / 1000.0
+        self.bytes_per_s    = bandwidth_mbps * 1e6 / 8 if bandwidth_mbps > 0 else 0.0
+        self._lock          = threading.Lock()
+        self._thread        = None
+        self.reset_stats()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def tile_url(self, name: str) -> str:
+        return f"{self.base_url}/tiles/{name}"
+
+    def export_url(self, bbox: tuple, size: int = 4096) -> str:
+        """Same shape as the NAIP URL built in core/usgs_api.gd."""
+        return (f"{self.base_url}/arcgis/rest/services/NAIP/ImageServer/exportImage"
+                f"?bbox={bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]}"
+                f"&bboxSR=4326&size={size},{size}&imageSR=4326"
+                f"&format=png&pixelType=U8&f=image")
+
+    # -- Statistics ------------------------------------------------------------
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = {"requests": 0, "tile_bytes": 0, "export_bytes": 0}
+
+    def count(self, key: str, nbytes: int) -> None:
+        with self._lock:
+            self.stats[key] += nbytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+    # -- Lifecycle -------------------------------------------------------------
+
+    def start(self) -> "MockServer":
+        """Serve from a daemon thread and return self."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real hosts
+
+    def log_message(self, fmt, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self._dispatch(head=True)
+
+    def do_GET(self) -> None:
+        self._dispatch(head=False)
+
+    def _dispatch(self, head: bool) -> None:
+        srv = self.server
+        srv.count("requests", 1)
+        if srv.latency:
+            time.sleep(srv.latency)
+        parts = urlsplit(self.path)
+        if parts.path.endswith("/exportImage"):
+            self._export(dict(parse_qsl(parts.query)), head)
+        elif parts.path.startswith("/tiles/"):
+            self._tile(parts.path[len("/tiles/"):], head)
+        else:
+            self.send_error(404)
+
+    def _export(self, query: dict, head: bool) -> None:
+        try:
+            bbox = tuple(float(v) for v in query["bbox"].split(","))
+            w, h = (int(v) for v in query["size"].split(","))
+        except (KeyError, ValueError):
+            self.send_error(400, "bbox and size are required")
+            return
+        body = render_export(bbox, w, h)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self._send(body, "export_bytes")
+
+    def _tile(self, name: str, head: bool) -> None:
+        path = self.server.root / Path(name).name
+        try:
+            st = path.stat()
+        except OSError:
+            self.send_error(404)
+            return
+        size  = st.st_size
+        etag  = f'"{st.st_mtime_ns:x}-{size:x}"'
+        start, end = 0, size - 1
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if m and (if_range is None or if_range == etag):
+            start = int(m.group(1))
+            end   = min(size - 1, int(m.group(2))) if m.group(2) else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "image/tiff")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", email.utils.formatdate(st.st_mtime, usegmt=True))
+        self.end_headers()
+        if head:
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK, remaining))
+                if not chunk:
+                    break
+                self._send(chunk, "tile_bytes")
+                remaining -= len(chunk)
+
+    def _send(self, data: bytes, key: str) -> None:
+        """Write `data`, throttled to the configured bandwidth."""
+        rate = self.server.bytes_per_s
+        for i in range(0, len(data), CHUNK):
+            chunk = data[i:i + CHUNK]
+            t0 = time.perf_counter()
+            self.wfile.write(chunk)
+            self.server.count(key, len(chunk))
+            if rate:
+                delay = len(chunk) / rate - (time.perf_counter() - t0)
+                if delay > 0:
+                    time.sleep(delay)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", required=True, help="Directory served under /tiles/.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0,
+                        help="Per-connection throttle (0 = unlimited).")
+    args = parser.parse_args()
+
+    srv = MockServer(Path(args.root), args.port, args.latency_ms, args.bandwidth_mbps)
+    print(f"Serving {os.path.abspath(args.root)} at {srv.base_url}/tiles/")
+    print(f"Fake exportImage at {srv.export_url((-105.4, 39.6, -105.1, 39.9))}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+
+
+if __name__ == "__main__":
+    main()
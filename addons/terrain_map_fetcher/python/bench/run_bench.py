@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+run_bench.py
+------------
+End-to-end benchmark of process_dem.py and process_imagery.py against the
+local mock server -- no USGS/NAIP traffic.
+
+For every scenario (tile count x output size) it generates (or reuses) a
+synthetic tile set, serves it with mock_server.py, runs both scripts as
+separate processes exactly as the plugin does and records, per script:
+
+  wall_s        total wall time
+  stages        wall time per stage, from the script's --events output
+  stage_stats   bytes, pixels and throughput per stage (see stages.py); the
+                DEM's download and warp stages overlap
+  http_bytes    bytes the mock server sent
+  output_bytes  bytes written to the output directory
+  peak_rss_mb   peak resident set of the script (including reaped worker
+                processes; None where os.wait4 is unavailable, e.g. Windows)
+
+Results go to a JSON file (one object per scenario and repeat) and a short
+table is printed.
+
+Usage:
+    python3 run_bench.py [--grids 1 2 3] [--sizes 1024 4096] [--tile-px 2700] \
+                         [--crs EPSG:4269] [--repeat 1] [--work-dir DIR] [--out FILE] \
+                         [--latency-ms 0] [--bandwidth-mbps 0] [-- extra process_dem.py args]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_server import MockServer, render_export
+from synth_tiles import TILE_DEG, TILE_PX, grid_bbox_wgs, make_tiles
+
+SCRIPT_DIR = Path(__file__).resolve().parent.parent
+
+# Linux seeds a process's peak RSS with its parent's at exec(), and this
+# runner holds rasterio + numpy, so scripts are started from a minimal
+# interpreter that reports the script's own peak (ru_maxrss via wait4,
+# which includes reaped worker processes) on a marker line.
+RSS_MARKER   = "@@peak_rss "
+RSS_LAUNCHER = (
+    "import os, sys\n"
+    "pid = os.fork()\n"
+    "if pid == 0:\n"
+    "    os.execv(sys.executable, [sys.executable] + sys.argv[1:])\n"
+    "_, status, usage = os.wait4(pid, 0)\n"
+    f"print('{RSS_MARKER}' + str(usage.ru_maxrss), flush=True)\n"
+    "sys.exit(os.waitstatus_to_exitcode(status))\n"
+)
+
+
+def run_script(script: str, argv: list[str], events: Path) -> dict:
+    """Run one pipeline script, timing its stages from its --events file."""
+    events.unlink(missing_ok=True)
+    cmd  = [sys.executable, "-u", str(SCRIPT_DIR / script), *argv, "--events", str(events)]
+    if hasattr(os, "wait4"):
+        cmd = [sys.executable, "-c", RSS_LAUNCHER, *cmd[1:]]
+    t0   = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            text=True, cwd=SCRIPT_DIR)
+    tail     = []
+    peak_rss = None
+    for line in proc.stdout:
+        if line.startswith(RSS_MARKER):
+            # ru_maxrss is in KiB on Linux, bytes on macOS.
+            scale    = 1024 * 1024 if sys.platform == "darwin" else 1024
+            peak_rss = round(int(line[len(RSS_MARKER):]) / scale, 1)
+            continue
+        tail = (tail + [line.rstrip()])[-20:]
+    returncode = proc.wait()
+    wall       = time.perf_counter() - t0
+
+    timings, stats = {}, {}
+    for line in (events.read_text().splitlines() if events.exists() else []):
+        e = json.loads(line)
+        if e["event"] == "stage_end":
+            # A stage that runs more than once (one warp per strip) is summed.
+            timings[e["stage"]] = round(timings.get(e["stage"], 0.0) + e["elapsed_s"], 4)
+            s = stats.setdefault(e["stage"], {"bytes": 0, "pixels": 0})
+            s["bytes"]  += e["bytes"]
+            s["pixels"] += e["pixels"]
+    for name, s in stats.items():
+        elapsed = timings[name]
+        s["mb_per_s"]   = round(s["bytes"] / 1024 / 1024 / elapsed, 2) if elapsed else None
+        s["mpix_per_s"] = round(s["pixels"] / 1e6 / elapsed, 2) if elapsed else None
+    result = {
+        "wall_s":      round(wall, 4),
+        "stages":      timings,
+        "stage_stats": stats,
+        "peak_rss_mb": peak_rss,
+        "returncode":  returncode,
+    }
+    if returncode != 0:
+        result["output_tail"] = tail
+    return result
+
+
+def dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def run_scenario(work: Path, grid: int, size: int, args, extra: list[str],
+                 repeat: int) -> dict:
+    tiles_dir = work / f"tiles_{args.crs.replace(':', '')}_{grid}x{grid}_{args.tile_px}"
+    tiles     = make_tiles(tiles_dir, grid, args.tile_px, args.tile_deg, args.crs)
+    bbox      = grid_bbox_wgs(grid, args.tile_deg)
+    name      = f"{grid * grid}tiles_{size}px"
+    run_dir   = work / "runs" / f"{name}_{repeat}"
+    shutil.rmtree(run_dir, ignore_errors=True)
+    out_dir   = run_dir / "out"
+    out_dir.mkdir(parents=True)
+
+    srv = MockServer(tiles_dir, latency_ms=args.latency_ms,
+                     bandwidth_mbps=args.bandwidth_mbps).start()
+    try:
+        dem_urls = run_dir / "dem_urls.txt"
+        dem_urls.write_text("\n".join(srv.tile_url(p.name) for p in tiles))
+        img_url  = srv.export_url(bbox, size)
+        img_urls = run_dir / "img_urls.txt"
+        img_urls.write_text(img_url)
+        render_export(tuple(bbox), size, size)   # render outside the timed run
+        bbox_args = [str(v) for v in bbox]
+
+        # A fresh tile cache per run, so the download is part of the timing.
+        srv.reset_stats()
+        dem = run_script("process_dem.py",
+                         ["--url-list", str(dem_urls), "--out-dir", str(out_dir),
+                          "--bbox", *bbox_args, "--max-size", str(size),
+                          "--cache-dir", str(run_dir / "cache"), *extra],
+                         run_dir / "dem_events.jsonl")
+        dem["http_bytes"]   = srv.snapshot()["tile_bytes"]
+        dem["output_bytes"] = dir_bytes(out_dir)
+
+        srv.reset_stats()
+        before  = dir_bytes(out_dir)
+        imagery = run_script("process_imagery.py",
+                             ["--url-list", str(img_urls), "--out-dir", str(out_dir),
+                              "--bbox", *bbox_args],
+                             run_dir / "imagery_events.jsonl")
+        imagery["http_bytes"]   = srv.snapshot()["export_bytes"]
+        imagery["output_bytes"] = dir_bytes(out_dir) - before
+    finally:
+        srv.stop()
+        if not args.keep:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    return {
+        "scenario":     name,
+        "repeat":       repeat,
+        "tiles":        grid * grid,
+        "tile_px":      args.tile_px,
+        "tile_crs":     args.crs,
+        "max_size":     size,
+        "bbox_wgs84":   list(bbox),
+        "source_bytes": sum(p.stat().st_size for p in tiles),
+        "dem":          dem,
+        "imagery":      imagery,
+    }
+
+
+def main() -> None:
+    argv, extra = sys.argv[1:], []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra = argv[:i], argv[i + 1:]
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--grids",    type=int, nargs="+", default=[1, 2, 3],
+                        help="Tiles per side; 1 2 3 = 1, 4 and 9 tiles.")
+    parser.add_argument("--sizes",    type=int, nargs="+", default=[1024, 4096],
+                        help="Output sizes (DEM --max-size and exportImage size).")
+    parser.add_argument("--tile-px",  type=int, default=TILE_PX)
+    parser.add_argument("--tile-deg", type=float, default=TILE_DEG)
+    parser.add_argument("--crs",      default="EPSG:4269", help="CRS of the synthetic tiles.")
+    parser.add_argument("--repeat",   type=int, default=1)
+    parser.add_argument("--latency-ms",     type=float, default=0.0)
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0)
+    parser.add_argument("--work-dir", default=str(Path(tempfile.gettempdir()) / "terrain_fetcher_bench"),
+                        help="Synthetic tiles are kept here between runs.")
+    parser.add_argument("--out",      default=None,
+                        help="Results JSON (default: <work-dir>/bench_results.json).")
+    parser.add_argument("--keep",     action="store_true", help="Keep run outputs.")
+    args = parser.parse_args(argv)
+
+    work = Path(args.work_dir)
+    work.mkdir(parents=True, exist_ok=True)
+    out  = Path(args.out) if args.out else work / "bench_results.json"
+
+    results = []
+    for grid in args.grids:
+        for size in args.sizes:
+            for rep in range(args.repeat):
+                print(f"Scenario: {grid * grid} tile(s), {size} px (run {rep + 1}/{args.repeat})")
+                r = run_scenario(work, grid, size, args, extra, rep)
+                results.append(r)
+                for script in ("dem", "imagery"):
+                    s = r[script]
+                    stages = "  ".join(f"{k}={v:.2f}s" for k, v in s["stages"].items()
+                                       if v is not None)
+                    print(f"  {script:<8} {s['wall_s']:7.2f}s  rss {s['peak_rss_mb']} MB  "
+                          f"http {s['http_bytes'] / 1024 / 1024:.2f} MB  {stages}")
+                    if s["returncode"] != 0:
+                        print(f"  {script} FAILED (exit {s['returncode']}):", file=sys.stderr)
+                        print("\n".join(s["output_tail"]), file=sys.stderr)
+
+    out.write_text(json.dumps({"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                               "python": sys.version.split()[0],
+                               "cpus": os.cpu_count(),
+                               "extra_args": extra,
+                               "results": results}, indent=2))
+    print(f"\nResults written to {out}")
+    if any(r[s]["returncode"] for r in results for s in ("dem", "imagery")):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
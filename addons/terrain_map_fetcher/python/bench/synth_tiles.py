@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+synth_tiles.py
+--------------
+Generates synthetic 3DEP-like GeoTIFF tiles for the benchmark suite:
+single-band float32, deflate-compressed, 512 px internal tiles, nodata
+-999999, covering an n x n grid of square cells starting at a given NW corner.
+
+Elevations are smooth analytic terrain (a few sine ridges on a 2000 m
+plateau) evaluated in lon/lat, so neighbouring tiles join seamlessly whatever
+the tile CRS. An optional fraction of each tile can be punched out as nodata
+to exercise the fill path.
+
+Files are named synth_r<row>_c<col>.tif -- deliberately not n##w###, so the
+pipeline never infers a 1 degree extent from the name.
+
+Usage:
+    python3 synth_tiles.py --out-dir /tmp/tiles --grid 3 \
+                           [--tile-px 2700] [--tile-deg 0.25] [--crs EPSG:4269] \
+                           [--origin -105.5 40.0] [--nodata-frac 0.0]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import rasterio
+    from rasterio.crs import CRS
+    from rasterio.transform import from_bounds
+    from rasterio.warp import transform as warp_transform, transform_bounds
+    from rasterio.windows import Window
+except ImportError:
+    print("ERROR: rasterio not installed. Run setup.py --install first.", file=sys.stderr)
+    sys.exit(1)
+
+TILE_PX     = 2700       # ~1/3 arc-second over 0.25 degrees, like 3DEP 13
+TILE_DEG    = 0.25
+ORIGIN      = (-105.5, 40.0)   # NW corner (lon, lat) of cell r0 c0
+NODATA      = -999999.0
+BLOCK_ROWS  = 512
+
+
+def elevation(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """The synthetic terrain surface, in meters."""
+    return (2000.0
+            + 300.0 * np.sin(lon * 3600.0 / 80.0)
+            + 200.0 * np.cos(lat * 3600.0 / 60.0)
+            + 150.0 * np.sin((lon + lat) * 40.0)).astype(np.float32)
+
+
+def tile_name(row: int, col: int) -> str:
+    return f"synth_r{row}_c{col}.tif"
+
+
+def cell_bounds_wgs(row: int, col: int, tile_deg: float = TILE_DEG,
+                    origin: tuple = ORIGIN) -> tuple:
+    """(min_lon, min_lat, max_lon, max_lat) of grid cell (row, col)."""
+    west  = origin[0] + col * tile_deg
+    north = origin[1] - row * tile_deg
+    return (west, north - tile_deg, west + tile_deg, north)
+
+
+def grid_bbox_wgs(grid: int, tile_deg: float = TILE_DEG, origin: tuple = ORIGIN,
+                  margin: float = 0.1) -> tuple:
+    """A bbox inside the whole n x n grid, inset by `margin` of a cell on each side."""
+    inset = margin * tile_deg
+    return (origin[0] + inset, origin[1] - grid * tile_deg + inset,
+            origin[0] + grid * tile_deg - inset, origin[1] - inset)
+
+
+def write_tile(path: Path, bounds_wgs: tuple, tile_px: int, crs: str,
+               nodata_frac: float = 0.0, seed: int = 0) -> None:
+    """Write one tile covering `bounds_wgs` (in `crs`) at tile_px x tile_px."""
+    dst_crs = CRS.from_user_input(crs)
+    bounds  = bounds_wgs if dst_crs.is_geographic else \
+        transform_bounds("EPSG:4326", dst_crs, *bounds_wgs, densify_pts=21)
+    transform = from_bounds(*bounds, tile_px, tile_px)
+    profile = {
+        "driver":    "GTiff",
+        "dtype":     "float32",
+        "count":     1,
+        "width":     tile_px,
+        "height":    tile_px,
+        "crs":       dst_crs,
+        "transform": transform,
+        "nodata":    NODATA,
+        "compress":  "deflate",
+        "predictor": 3,
+        "tiled":     True,
+        "blockxsize": 512,
+        "blockysize": 512,
+    }
+    rng  = np.random.default_rng(seed)
+    xs   = bounds[0] + (np.arange(tile_px) + 0.5) * transform.a
+    tmp  = Path(str(path) + ".part")
+    with rasterio.open(tmp, "w", **profile) as dst:
+        for y0 in range(0, tile_px, BLOCK_ROWS):
+            y1 = min(tile_px, y0 + BLOCK_ROWS)
+            ys = bounds[3] + (np.arange(y0, y1) + 0.5) * transform.e
+            X, Y = np.meshgrid(xs, ys)
+            if dst_crs.is_geographic:
+                lon, lat = X, Y
+            else:
+                lon, lat = warp_transform(dst_crs, "EPSG:4326", X.ravel(), Y.ravel())
+                lon = np.asarray(lon).reshape(X.shape)
+                lat = np.asarray(lat).reshape(X.shape)
+            block = elevation(lon, lat)
+            if nodata_frac > 0:
+                block[rng.random(block.shape) < nodata_frac] = NODATA
+            dst.write(block, 1, window=Window(0, y0, tile_px, y1 - y0))
+    tmp.replace(path)
+
+
+def make_tiles(out_dir: Path, grid: int, tile_px: int = TILE_PX, tile_deg: float = TILE_DEG,
+               crs: str = "EPSG:4269", origin: tuple = ORIGIN,
+               nodata_frac: float = 0.0) -> list[Path]:
+    """
+    Write the n x n tile set into `out_dir` (row-major). Tiles are reused if
+    the directory already holds a set generated with the same parameters.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    params  = {"grid": grid, "tile_px": tile_px, "tile_deg": tile_deg, "crs": crs,
+               "origin": list(origin), "nodata_frac": nodata_frac}
+    stamp   = out_dir / "synth_params.json"
+    paths   = [out_dir / tile_name(r, c) for r in range(grid) for c in range(grid)]
+    try:
+        if json.loads(stamp.read_text()) == params and all(p.exists() for p in paths):
+            return paths
+    except (OSError, ValueError):
+        pass
+
+    stamp.unlink(missing_ok=True)
+    for i, path in enumerate(paths):
+        r, c = divmod(i, grid)
+        write_tile(path, cell_bounds_wgs(r, c, tile_deg, origin), tile_px, crs,
+                   nodata_frac, seed=i)
+        print(f"  Generated {path.name} ({path.stat().st_size / 1024 / 1024:.1f} MB)")
+    stamp.write_text(json.dumps(params))
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out-dir",  required=True)
+    parser.add_argument("--grid",     type=int, default=2, help="Tiles per side (n x n).")
+    parser.add_argument("--tile-px",  type=int, default=TILE_PX)
+    parser.add_argument("--tile-deg", type=float, default=TILE_DEG)
+    parser.add_argument("--crs",      default="EPSG:4269",
+                        help="Tile CRS (3DEP uses EPSG:4269; any projected CRS works too).")
+    parser.add_argument("--origin",   type=float, nargs=2, default=ORIGIN,
+                        metavar=("WEST_LON", "NORTH_LAT"))
+    parser.add_argument("--nodata-frac", type=float, default=0.0,
+                        help="Fraction of pixels per tile set to nodata.")
+    args = parser.parse_args()
+
+    paths = make_tiles(Path(args.out_dir), args.grid, args.tile_px, args.tile_deg,
+                       args.crs, tuple(args.origin), args.nodata_frac)
+    print(f"{len(paths)} tile(s) in {args.out_dir}")
+    print(f"Bbox (WGS84): {grid_bbox_wgs(args.grid, args.tile_deg, tuple(args.origin))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,44 +3,112 @@
 combine_tiles.py
 ----------------
 Merges multiple Terrain3D-compatible EXR heightmap tiles into a single
-large EXR heightmap. Tiles are arranged in a grid based on their geographic
-metadata embedded in the EXR, or sorted alphabetically as a fallback.
+large EXR heightmap. Tiles that process_dem.py wrote (with its
+fetch_manifest.json or heightmap_000_meta.txt beside them) are placed at
+their true position on a canvas covering just their joint extent, at the
+finest pixel size among them; otherwise, or with --layout
+grid/horizontal/vertical, they are arranged in a grid in list order.
+Overlapping tiles (georeferenced, or --overlap in a grid) are cross-faded
+over the pixels they share; edge-to-edge tiles get the step at each seam
+faded out over --blend-px pixels on either side, keeping the relief.
+Canvas pixels no tile covers (holes in a georeferenced layout, beyond the
+gaps a seam bridges) are set to the lowest covered elevation rather than
+0 m, so they show as flat ground instead of pits in Terrain3D.
+
+The layout, placement and any resampling are planned from the tile headers
+alone; tiles are then decoded --workers at a time in worker processes,
+resampled there to the size of their slot, and placed in order, and the EXR
+is written in bands of rows. A canvas larger than --memory-mb (or any, with
+--stream) lives in a memory-mapped scratch file in --scratch-dir, removed
+afterwards.
 
 Output:
-  - combined_heightmap.exr  -- merged RGB 32-bit float EXR
+  - combined_heightmap.exr  -- merged float EXR (R; see the --exr-* options in exr_io.py)
+  - terrain3d_regions/      -- with --output regions|both, the same heightmap cut
+                               into Terrain3D regions, and their regions.json
+                               index (see terrain3d_regions.py); regions no tile
+                               covers are skipped
   - combined_heightmap_meta.txt -- companion metadata
 
 Usage:
-    python3 combine_tiles.py --tile-list /path/to/tiles.txt --out-dir /path/to/output
+    python3 combine_tiles.py --tile-list /path/to/tiles.txt --out-dir /path/to/output \
+                             [--layout auto|geo|grid|horizontal|vertical] [--overlap 0] [--blend-px 16] [--workers N] \
+                             [--memory-mb 0] [--stream] [--scratch-dir DIR] \
+                             [--output single|regions|both] [--region-size 256] [--region-origin X Y] \
+                             [--exr-channels r|rgb] [--exr-pixel-type float|half] \
+                             [--exr-compression zip] \
+                             [--events events.jsonl] [--profile DIR]
 """
 
+from __future__ import annotations
+
 import argparse
+import os
 import sys
 import math
 import re
+from collections import deque
 from pathlib import Path
 
-import numpy as np
+import exr_io
+import output_manifest
+import process_pool
+import stages
+import terrain3d_regions
+
+BLEND_PX          = 16   # pixels either side of a seam that its step is faded over
+EXR_BAND_MB       = 64   # output rows per EXR write call, as float32 pixels
+EXR_MIN_BAND_ROWS = 16
+
+
+def import_heavy() -> None:
+    """Import numpy and OpenEXR into this module; main() does once the arguments check out."""
+    global np, OpenEXR, Imath
+    import numpy as np
 
-try:
-    import OpenEXR
-    import Imath
-except ImportError:
-    print("ERROR: OpenEXR is not installed. Run setup.py --install first.", file=sys.stderr)
-    sys.exit(1)
+    try:
+        import OpenEXR
+        import Imath
+    except ImportError:
+        print("ERROR: OpenEXR is not installed. Run setup.py --install first.", file=sys.stderr)
+        sys.exit(1)
 
 
 # -- Entry point ---------------------------------------------------------------
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
     parser = argparse.ArgumentParser(description="Combine multiple EXR heightmap tiles into one.")
     parser.add_argument("--tile-list", required=True, help="Path to a text file with one EXR path per line.")
     parser.add_argument("--out-dir",   required=True, help="Directory where the combined EXR will be saved.")
     parser.add_argument("--layout",    default="auto",
-                        choices=["auto", "horizontal", "vertical", "grid"],
-                        help="How to arrange tiles. 'auto' picks the most square grid possible.")
-    args = parser.parse_args()
-
+                        choices=["auto", "geo", "horizontal", "vertical", "grid"],
+                        help="How to arrange tiles. 'geo' places them by their georeference; "
+                             "'auto' does too if every tile has one, else picks the most "
+                             "square grid possible.")
+    parser.add_argument("--overlap",   type=int, default=0,
+                        help="Pixels each tile shares with its grid neighbours; they are "
+                             "cross-faded. Georeferenced tiles overlap where their bboxes do.")
+    parser.add_argument("--blend-px",  type=int, default=BLEND_PX,
+                        help="Pixels either side of a seam between edge-to-edge tiles to fade its step over.")
+    parser.add_argument("--workers",   type=int, default=0,
+                        help="Processes used to decode tiles and write regions in parallel "
+                             "(0 = one per CPU, capped at the tile count; 1 = serial).")
+    parser.add_argument("--memory-mb", type=int, default=0,
+                        help="Peak memory for pixel data; a canvas that does not fit is "
+                             "memory-mapped to a scratch file (0 = no limit).")
+    parser.add_argument("--stream",    action="store_true",
+                        help="Always memory-map the canvas to a scratch file.")
+    parser.add_argument("--scratch-dir", default=None,
+                        help="Directory for the scratch canvas (default: --out-dir).")
+    terrain3d_regions.add_arguments(parser)
+    exr_io.add_arguments(parser)
+    stages.add_argument(parser)
+    args = parser.parse_args(argv)
+    with stages.run("combine_tiles", args.events, args.profile):
+        _combine(args)
+
+
+def _combine(args: argparse.Namespace) -> None:
     tile_list_path = Path(args.tile_list)
     out_dir        = Path(args.out_dir)
 
@@ -57,96 +125,400 @@ def main() -> None:
         print("ERROR: No valid EXR files found in tile list.", file=sys.stderr)
         sys.exit(1)
 
+    import_heavy()
     print(f"Combining {len(tile_paths)} EXR tile(s)...")
 
-    # -- Load all tiles --------------------------------------------------------
-    tiles: list[dict] = []
-    for i, path in enumerate(tile_paths):
-        print(f"  [{i+1}/{len(tile_paths)}] Reading: {path.name}")
-        tile = _read_exr(path)
-        tiles.append(tile)
-        print(f"    Size: {tile['width']}x{tile['height']} | "
-              f"Elev: {tile['data'].min():.1f}m - {tile['data'].max():.1f}m")
-
-    # -- Validate consistent tile sizes ---------------------------------------
-    widths  = [t["width"]  for t in tiles]
-    heights = [t["height"] for t in tiles]
-
-    if len(set(widths)) > 1 or len(set(heights)) > 1:
-        print("WARNING: Tiles have different sizes. They will be resampled to match the largest tile.")
-        target_w = max(widths)
-        target_h = max(heights)
-        for tile in tiles:
-            if tile["width"] != target_w or tile["height"] != target_h:
-                tile["data"]   = _resample(tile["data"], target_w, target_h)
-                tile["width"]  = target_w
-                tile["height"] = target_h
-
-    tile_w = tiles[0]["width"]
-    tile_h = tiles[0]["height"]
-    n      = len(tiles)
-
-    # -- Determine grid layout -------------------------------------------------
-    cols, rows = _compute_grid(n, args.layout)
-    print(f"\nLayout: {cols} column(s) x {rows} row(s)")
-
-    # Pad with blank tiles if n doesn't fill the grid evenly.
-    while len(tiles) < cols * rows:
-        blank = np.zeros((tile_h, tile_w), dtype=np.float32)
-        tiles.append({"data": blank, "width": tile_w, "height": tile_h})
-
-    # -- Stitch tiles into canvas ----------------------------------------------
-    canvas_w = cols * tile_w
-    canvas_h = rows * tile_h
-    canvas   = np.zeros((canvas_h, canvas_w), dtype=np.float32)
-
+    # -- Plan the layout from the tile headers ---------------------------------
+    sizes   = [_read_exr_size(path) for path in tile_paths]
+    n       = len(tile_paths)
+    georefs = _georefs(tile_paths, sizes, args.layout)
+    if georefs:
+        layout = _geo_layout(tile_paths, sizes, georefs)
+        print(f"\nLayout: georeferenced, {layout['crs']} at "
+              f"{layout['res'][0]:.2f} x {layout['res'][1]:.2f} m/px")
+        if args.overlap:
+            print("  --overlap is ignored: georeferenced tiles overlap where their bboxes do.")
+    else:
+        tile_w = max(w for w, _ in sizes)
+        tile_h = max(h for _, h in sizes)
+        if not 0 <= args.overlap <= min(tile_w, tile_h) // 2:
+            print(f"ERROR: --overlap must be between 0 and half the tile size "
+                  f"({min(tile_w, tile_h) // 2} px).", file=sys.stderr)
+            sys.exit(1)
+        layout = _grid_layout(tile_paths, sizes, _compute_grid(n, args.layout), args.overlap)
+        print(f"\nLayout: {layout['cols']} column(s) x {layout['rows']} row(s)")
+
+    plan     = layout["plan"]
+    seams    = _link_tiles(plan, args.blend_px)
+    canvas_w = layout["width"]
+    canvas_h = layout["height"]
     print(f"Canvas size: {canvas_w} x {canvas_h} pixels")
 
-    for idx, tile in enumerate(tiles[:cols * rows]):
-        row = idx // cols
-        col = idx  % cols
-        y0  = row * tile_h
-        y1  = y0  + tile_h
-        x0  = col * tile_w
-        x1  = x0  + tile_w
-        canvas[y0:y1, x0:x1] = tile["data"]
-        print(f"  Placed tile {idx+1:>3} at grid [{col}, {row}]  "
-              f"pixel [{x0}:{x1}, {y0}:{y1}]")
-
-    # -- Blend seams between tiles ---------------------------------------------
-    blend_px = 4  # pixels to blend at each seam
-    canvas = _blend_seams(canvas, tile_w, tile_h, cols, rows, blend_px)
-    print(f"Seam blending applied ({blend_px}px fade).")
-
-    # -- Write combined EXR ----------------------------------------------------
+    uncovered = canvas_w * canvas_h - _covered_px(plan)
+    if uncovered:
+        print(f"Note: {100 * uncovered / (canvas_w * canvas_h):.1f}% of the canvas is outside "
+              f"every tile and is set to the lowest covered elevation (gaps of up to "
+              f"{args.blend_px}px between tiles are bridged).")
+    resampled = sum(tile["resample"] for tile in plan)
+    if resampled:
+        print(f"WARNING: {resampled} tile(s) do not match the canvas pixel grid and will be "
+              f"resampled to it as they are decoded.")
+
+    # -- Memory plan -----------------------------------------------------------
+    # In memory: the canvas, the tiles being decoded (each with its copies
+    # while reading and resampling; in parallel also the decoded tiles
+    # waiting to be placed) and one band of output rows (with its conversion
+    # and byte copies). Over the budget the canvas goes to a scratch file.
+    cpus         = os.cpu_count() or 1
+    jobs         = args.workers if args.workers > 0 else min(cpus, n)
+    jobs         = max(1, min(jobs, n))
+    budget       = args.memory_mb * 1024 * 1024
+    canvas_bytes = canvas_w * canvas_h * 4
+    tile_bytes   = max(max(t["size"][0] * t["size"][1], t["w"] * t["h"]) for t in plan) * 4 * 3
+    queued_bytes = max(t["w"] * t["h"] for t in plan) * 4
+    if budget and jobs > 1:
+        # Parallel decoding gets at most half the budget.
+        jobs = max(1, min(jobs, budget // 2 // (tile_bytes + queued_bytes)))
+    decode_bytes = tile_bytes if jobs == 1 else jobs * (tile_bytes + queued_bytes)
+    row_bytes    = canvas_w * 4 * 3
+    band_bytes   = EXR_BAND_MB * 1024 * 1024
+    if budget:
+        band_bytes = min(band_bytes, max(0, budget - decode_bytes) // 2)
+    band_rows = max(EXR_MIN_BAND_ROWS, min(canvas_h, band_bytes // row_bytes))
+    work      = decode_bytes + band_rows * row_bytes
+    stream    = args.stream or bool(budget and canvas_bytes + work > budget)
+    if budget and work > budget:
+        print(f"WARNING: --memory-mb {args.memory_mb} is less than one tile and one band of "
+              f"output rows need ({work / 1024 / 1024:.0f} MB); going over it.")
+
+    print(f"Decoding: {jobs} process(es)")
+
+    scratch = None
+    if stream:
+        scratch = (Path(args.scratch_dir) if args.scratch_dir else out_dir) \
+            / f"combined_heightmap.{os.getpid()}.canvas"
+        print(f"Canvas memory-mapped to {scratch} ({canvas_bytes / 1024 ** 3:.2f} GB)")
     out_path = out_dir / "combined_heightmap.exr"
-    _write_exr_rgb32(canvas, out_path)
-
-    min_elev = float(canvas.min())
-    max_elev = float(canvas.max())
-
-    print(f"\nOK Saved: {out_path.name}")
+    try:
+        if scratch:
+            canvas = np.memmap(scratch, dtype=np.float32, mode="w+", shape=(canvas_h, canvas_w))
+        else:
+            canvas = np.zeros((canvas_h, canvas_w), dtype=np.float32)
+        written = _build_canvas(canvas, layout, seams, args, out_path, band_rows, jobs)
+    finally:
+        canvas = None   # unmaps the scratch file, so it can be removed
+        if scratch:
+            scratch.unlink(missing_ok=True)
+
+    if args.output != "regions":
+        print(f"\nOK Saved: {out_path.name}")
     print(f"  Size:      {canvas_w} x {canvas_h} px")
-    print(f"  Elevation: {min_elev:.1f}m - {max_elev:.1f}m")
+    print(f"  Elevation: {written['min_elev']:.1f}m - {written['max_elev']:.1f}m")
+    if "max_error" in written:
+        print(f"  Half:      max rounding error {written['max_error']:.3f}m")
 
-    _write_metadata(out_dir / "combined_heightmap_meta.txt", tile_paths, {
+    _write_metadata(out_dir / "combined_heightmap_meta.txt", layout, {
         "canvas_w": canvas_w,
         "canvas_h": canvas_h,
-        "cols":     cols,
-        "rows":     rows,
-        "tile_w":   tile_w,
-        "tile_h":   tile_h,
-        "min_elev": min_elev,
-        "max_elev": max_elev,
+        "overlap":  args.overlap,
+        **written,
     })
 
     print("Done!")
 
 
+def _build_canvas(canvas: np.ndarray, layout: dict, seams: tuple[list, list],
+                  args: argparse.Namespace, out_path: Path, band_rows: int, jobs: int) -> dict:
+    """
+    Decode the planned tiles (`jobs` at a time), place them in `canvas` in
+    tile order, cross-fade their overlaps and blend the seams in place and
+    write the EXR in bands of rows and/or the Terrain3D regions (--output).
+    Returns what _write_exr() does, plus the region index under "regions".
+    """
+    plan   = layout["plan"]
+    mapped = isinstance(canvas, np.memmap)
+
+    # -- Stitch tiles into canvas ----------------------------------------------
+    for tile, loaded in _decode_tiles(plan, jobs):
+        data = loaded["data"]
+        print(f"    Size: {tile['size'][0]}x{tile['size'][1]} | "
+              f"Elev: {loaded['min']:.1f}m - {loaded['max']:.1f}m")
+        y0, x0 = tile["y0"], tile["x0"]
+        with stages.stage("merge", tile=tile["index"] + 1) as st:
+            _place_tile(canvas, data, y0, x0, tile["fade_y"], tile["fade_x"])
+            if mapped:
+                canvas.flush()   # write back each tile, so dirty pages stay bounded
+            st.add(pixels=data.size)
+        del data, loaded
+        print(f"  Placed tile {tile['index'] + 1:>3} at {tile['where']}"
+              f"pixel [{x0}:{x0 + tile['w']}, {y0}:{y0 + tile['h']}]")
+
+    # -- Blend overlaps and seams between tiles --------------------------------
+    fade = max(max(t["fade_y"] + t["fade_x"]) for t in plan)
+    if fade:
+        _normalize_weights(canvas, plan)
+        print(f"Tile overlaps cross-faded (up to {fade}px).")
+    if seams[0] or seams[1]:
+        with stages.stage("blend", blend_px=args.blend_px) as st:
+            _blend_seams(canvas, *seams, plan)
+            st.add(pixels=canvas.size)
+        print(f"Seam blending applied ({args.blend_px}px fade).")
+    floor = _fill_uncovered(canvas, plan, seams, band_rows)
+    if floor is not None:
+        print(f"Uncovered pixels set to {floor:.1f}m.")
+
+    # -- Write combined EXR and/or Terrain3D regions ---------------------------
+    exr_opts = exr_io.writer_options(args)
+    written  = {}
+    if args.output != "regions":
+        with stages.stage("exr_write", band_rows=band_rows, **exr_opts) as st:
+            written = _write_exr(canvas, out_path, band_rows, exr_opts)
+            st.add(nbytes=out_path.stat().st_size, pixels=canvas.size)
+    if args.output != "single":
+        h, w    = canvas.shape
+        grid    = terrain3d_regions.plan(w, h, args.region_size, args.region_origin)
+        regions = terrain3d_regions.export(
+            out_path.parent, canvas, grid, exr_opts, args.workers,
+            coverage=lambda x0, y0, x1, y1: ~_uncovered(plan, x0, x1, y0, y1),
+            vertex_spacing=layout["res"][0] if "res" in layout else None)
+        if not written:
+            written = {"min_elev": regions["elev_min_m"], "max_elev": regions["elev_max_m"],
+                       "exr": exr_opts, **({"max_error": regions["max_error"]}
+                                           if "max_error" in regions else {})}
+        written["regions"] = regions
+    return written
+
+
+def _georefs(tile_paths: list[Path], sizes: list[tuple[int, int]],
+             layout: str) -> list[dict] | None:
+    """
+    Every tile's _read_georef() for --layout auto or geo, or None to lay the
+    tiles out in a grid: always for the other layouts, and for auto when a
+    tile has no georeference or the tiles are in different CRSs.
+    """
+    if layout not in ("auto", "geo"):
+        return None
+    georefs = [_read_georef(path, size) for path, size in zip(tile_paths, sizes)]
+    missing = [path for path, g in zip(tile_paths, georefs) if g is None]
+    crss    = sorted({g["crs"] for g in georefs if g})
+    if missing:
+        problem = f"{len(missing)} tile(s) have no georeference (e.g. {missing[0]})"
+    elif len(crss) > 1:
+        problem = f"the tiles are in different CRSs ({', '.join(crss)})"
+    else:
+        return georefs
+    if layout == "geo":
+        print(f"ERROR: --layout geo: {problem}.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Note: {problem}; arranging the tiles in a grid in list order.")
+    return None
+
+
+def _read_georef(path: Path, size: tuple[int, int]) -> dict | None:
+    """
+    A tile's {"crs", "transform"}: exact from the fetch_manifest.json that
+    process_dem.py wrote beside it, else from the UTM bbox in its _meta.txt
+    (0.1 m precision). None if neither describes a north-up grid of the
+    tile's size. (A patch's meta.json only has the requested WGS84 bbox.)
+    """
+    dem = output_manifest.load(path.parent).get("dem")
+    if dem and dem.get("file") == path.name and (dem["width"], dem["height"]) == size:
+        crs, transform = dem["crs"], tuple(dem["transform"][:6])
+    else:
+        try:
+            text = path.with_name(f"{path.stem}_meta.txt").read_text()
+        except OSError:
+            return None
+        m_size = re.search(r"^Size:\s+(\d+)\s+x\s+(\d+)", text, re.M)
+        m_crs  = re.search(r"^CRS:\s+(\S+)", text, re.M)
+        m_bbox = re.search(r"^Bbox \(UTM\):\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)",
+                           text, re.M)
+        if not (m_size and m_crs and m_bbox) or (int(m_size[1]), int(m_size[2])) != size:
+            return None
+        left, bottom, right, top = (float(v) for v in m_bbox.groups())
+        crs       = m_crs[1]
+        transform = ((right - left) / size[0], 0.0, left, 0.0, -(top - bottom) / size[1], top)
+    if transform[1] or transform[3] or transform[0] <= 0 or transform[4] >= 0:
+        return None
+    return {"crs": crs, "transform": transform}
+
+
+def _geo_layout(tile_paths: list[Path], sizes: list[tuple[int, int]],
+                georefs: list[dict]) -> dict:
+    """
+    Every tile at its true pixel offset on a canvas covering just the
+    tiles' joint extent, at the finest pixel size among them (coarser tiles
+    are resampled to it). Offsets are snapped to the nearest canvas pixel.
+    """
+    res_x = min(g["transform"][0] for g in georefs)
+    res_y = min(-g["transform"][4] for g in georefs)
+    left  = min(g["transform"][2] for g in georefs)
+    top   = max(g["transform"][5] for g in georefs)
+    plan  = []
+    for idx, (path, (w, h), g) in enumerate(zip(tile_paths, sizes, georefs)):
+        a, _, c, _, e, f = g["transform"]
+        x0, x1 = _snap((c - left) / res_x), _snap((c + w * a - left) / res_x)
+        y0, y1 = _snap((top - f) / res_y), _snap((top - f - h * e) / res_y)
+        plan.append(_tile(idx, path, (w, h), y0, x0, max(1, y1 - y0), max(1, x1 - x0), ""))
+    return {"plan":      plan,
+            "width":     max(t["x0"] + t["w"] for t in plan),
+            "height":    max(t["y0"] + t["h"] for t in plan),
+            "crs":       georefs[0]["crs"],
+            "res":       (res_x, res_y),
+            "transform": (res_x, 0.0, left, 0.0, -res_y, top)}
+
+
+def _grid_layout(tile_paths: list[Path], sizes: list[tuple[int, int]],
+                 grid: tuple[int, int], overlap: int) -> dict:
+    """
+    The tiles in list order, left to right and top to bottom, in cells the
+    size of the largest tile (smaller ones are resampled to it), with
+    neighbours sharing `overlap` pixels. Cells without a tile stay blank.
+    """
+    cols, rows = grid
+    tile_w     = max(w for w, _ in sizes)
+    tile_h     = max(h for _, h in sizes)
+    plan       = []
+    for idx, (path, size) in enumerate(zip(tile_paths, sizes)):
+        row, col = divmod(idx, cols)
+        plan.append(_tile(idx, path, size, row * (tile_h - overlap), col * (tile_w - overlap),
+                          tile_h, tile_w, f"grid [{col}, {row}]  "))
+    return {"plan":   plan,
+            "cols":   cols,
+            "rows":   rows,
+            "width":  cols * (tile_w - overlap) + overlap,
+            "height": rows * (tile_h - overlap) + overlap}
+
+
+def _tile(index: int, path: Path, size: tuple[int, int], y0: int, x0: int,
+          h: int, w: int, where: str) -> dict:
+    """A plan entry: tile `size` (w, h) goes to the h x w canvas block at (y0, x0)."""
+    return {"index": index, "path": path, "size": size, "where": where,
+            "y0": y0, "x0": x0, "h": h, "w": w, "resample": size != (w, h),
+            "fade_y": [0, 0], "fade_x": [0, 0]}
+
+
+def _snap(v: float) -> int:
+    """Nearest integer, halves rounding up (round() would round them to even)."""
+    return math.floor(v + 0.5)
+
+
+def _link_tiles(plan: list[dict], blend_px: int) -> tuple[list, list]:
+    """
+    Set each plan entry's fades from the tiles overlapping it and return
+    the seams between edge-to-edge tiles as ([(x, y0, y1, band, gap), ...]
+    for vertical seams, [(y, x0, x1, band, gap), ...] for horizontal ones).
+
+    A tile overlapping a neighbour fades out over the shared pixels on that
+    side (at most half the tile); side by side if the overlap is taller than
+    wide, above/below otherwise. Tiles that touch get a seam along the
+    shared part of their edge, faded over blend_px pixels (at most half
+    either tile) on each side. Tiles up to blend_px pixels apart (georeferenced
+    neighbours rarely meet exactly) get a seam whose `gap` pixels before x
+    or y are bridged instead.
+    """
+    seams_x, seams_y = [], []
+    for i, a in enumerate(plan):
+        for b in plan[i + 1:]:
+            ix = min(a["x0"] + a["w"], b["x0"] + b["w"]) - max(a["x0"], b["x0"])
+            iy = min(a["y0"] + a["h"], b["y0"] + b["h"]) - max(a["y0"], b["y0"])
+            if ix > 0 and iy > 0:
+                if iy > ix:
+                    first, second = (a, b) if a["x0"] <= b["x0"] else (b, a)
+                    first["fade_x"][1]  = max(first["fade_x"][1], ix)
+                    second["fade_x"][0] = max(second["fade_x"][0], ix)
+                else:
+                    first, second = (a, b) if a["y0"] <= b["y0"] else (b, a)
+                    first["fade_y"][1]  = max(first["fade_y"][1], iy)
+                    second["fade_y"][0] = max(second["fade_y"][0], iy)
+            elif -blend_px <= ix <= 0 and iy > 0:
+                band = min(blend_px, a["w"] // 2, b["w"] // 2)
+                if band > 0:
+                    seams_x.append((max(a["x0"], b["x0"]), max(a["y0"], b["y0"]),
+                                    min(a["y0"] + a["h"], b["y0"] + b["h"]), band, -ix))
+            elif -blend_px <= iy <= 0 and ix > 0:
+                band = min(blend_px, a["h"] // 2, b["h"] // 2)
+                if band > 0:
+                    seams_y.append((max(a["y0"], b["y0"]), max(a["x0"], b["x0"]),
+                                    min(a["x0"] + a["w"], b["x0"] + b["w"]), band, -iy))
+    for t in plan:
+        t["fade_y"] = [min(f, t["h"] // 2) for f in t["fade_y"]]
+        t["fade_x"] = [min(f, t["w"] // 2) for f in t["fade_x"]]
+    return seams_x, seams_y
+
+
+def _decode_tiles(plan: list[dict], jobs: int):
+    """
+    Yield (tile, _load_tile() result) for every tile of the plan, in order.
+    With jobs > 1 the tiles are decoded in that many worker processes --
+    OpenEXR holds the GIL while it decodes, so threads would not overlap --
+    and at most `jobs` decoded tiles wait for the caller at a time.
+    """
+    executor = None
+    if jobs > 1:
+        executor = process_pool.start(jobs, [__name__, "numpy", "OpenEXR"])
+    ahead    = iter(plan)
+    pending  = deque()
+
+    def submit_ahead() -> None:
+        while len(pending) < jobs:
+            tile = next(ahead, None)
+            if tile is None:
+                return
+            pending.append(executor.submit(_load_tile, tile["path"], tile["w"], tile["h"]))
+
+    try:
+        if executor is not None:
+            submit_ahead()
+        for tile in plan:
+            print(f"  [{tile['index'] + 1}/{len(plan)}] Reading: {tile['path'].name}")
+            # In parallel this times the wait for the worker, not the decode.
+            with stages.stage("read", tile=tile["index"] + 1, resampled=tile["resample"]) as st:
+                if executor is None:
+                    loaded = _load_tile(tile["path"], tile["w"], tile["h"])
+                else:
+                    loaded = pending.popleft().result()
+                    submit_ahead()
+                st.add(nbytes=tile["path"].stat().st_size, pixels=loaded["data"].size)
+            yield tile, loaded
+            del loaded   # so the caller's del frees the tile before the next decode
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _load_tile(path: Path, width: int, height: int) -> dict:
+    """
+    Decode a tile and, if it is another size, resample it to width x height.
+    Runs in a worker process in parallel mode, so it takes and returns only
+    picklable values. Returns {"data", "min", "max"}, min/max being the
+    tile's elevation range before resampling.
+    """
+    import_heavy()
+    data   = _read_exr(path)["data"]
+    loaded = {"min": float(data.min()), "max": float(data.max())}
+    if data.shape != (height, width):
+        data = _resample(data, width, height)
+    loaded["data"] = data
+    return loaded
+
+
 # -- EXR I/O -------------------------------------------------------------------
 
+def _read_exr_size(path: Path) -> tuple[int, int]:
+    """(width, height) of an EXR from its header, without decoding any pixels."""
+    f  = OpenEXR.InputFile(str(path))
+    dw = f.header()["dataWindow"]
+    f.close()
+    return dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1
+
+
 def _read_exr(path: Path) -> dict:
-    """Read an RGB 32-bit float EXR and return the R channel as a float32 array."""
+    """
+    Read a heightmap EXR and return the R channel as a float32 array. The
+    array wraps the buffer OpenEXR decoded into, without a copy, so it is
+    read-only.
+    """
     f = OpenEXR.InputFile(str(path))
     header = f.header()
 
@@ -159,26 +531,29 @@ def _read_exr(path: Path) -> dict:
     f.close()
 
     # R channel holds real elevation in meters.
-    data = np.frombuffer(r_bytes, dtype=np.float32).reshape((height, width)).copy()
+    data = np.frombuffer(r_bytes, dtype=np.float32).reshape((height, width))
     return {"data": data, "width": width, "height": height, "path": path}
 
 
-def _write_exr_rgb32(elevation: np.ndarray, out_path: Path) -> None:
-    """Write a 2D float32 array as an RGB 32-bit float EXR (R=G=B=elevation)."""
+def _write_exr(elevation: np.ndarray, out_path: Path, band_rows: int,
+               exr_opts: dict) -> dict:
+    """
+    Write a 2D float32 array as an EXR (see exr_io.writer_options),
+    band_rows scanlines at a time. Returns its min/max elevation, the
+    options and, for half pixels, the largest rounding error.
+    """
     height, width = elevation.shape
-    channel_bytes = elevation.astype(np.float32).tobytes()
-
-    header = OpenEXR.Header(width, height)
-    header["channels"] = {
-        "R": Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT)),
-        "G": Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT)),
-        "B": Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT)),
-    }
-    header.pop("A", None)
-
-    exr = OpenEXR.OutputFile(str(out_path), header)
-    exr.writePixels({"R": channel_bytes, "G": channel_bytes, "B": channel_bytes})
-    exr.close()
+    lo, hi = math.inf, -math.inf
+    with exr_io.ScanlineWriter(out_path, width, height, **exr_opts) as exr:
+        for y0, y1 in exr_io.row_blocks(height, band_rows):
+            band = elevation[y0:y1]
+            lo   = min(lo, float(band.min()))
+            hi   = max(hi, float(band.max()))
+            exr.write(band)
+    written = {"min_elev": lo, "max_elev": hi, "exr": exr_opts}
+    if exr.half:
+        written["max_error"] = exr.max_error
+    return written
 
 
 # -- Grid layout ---------------------------------------------------------------
@@ -209,67 +584,254 @@ def _resample(data: np.ndarray, target_w: int, target_h: int) -> np.ndarray:
     from PIL import Image
     img     = Image.fromarray(data, mode="F")
     resized = img.resize((target_w, target_h), Image.BILINEAR)
-    return np.array(resized, dtype=np.float32)
+    return np.frombuffer(resized.tobytes(), dtype=np.float32).reshape(target_h, target_w)
 
 
 # -- Seam blending -------------------------------------------------------------
 
-def _blend_seams(canvas: np.ndarray, tile_w: int, tile_h: int,
-                 cols: int, rows: int, blend_px: int) -> np.ndarray:
+def _place_tile(canvas: np.ndarray, data: np.ndarray, y0: int, x0: int,
+                fade_y: list[int], fade_x: list[int]) -> None:
     """
-    Smooth the hard seams between stitched tiles by blending
-    a narrow strip on either side of each internal seam.
+    Add `data` to the canvas at (x0, y0), weighted by linear ramps over the
+    first/last fade_y rows and fade_x columns it shares with its neighbours.
+    Only those edge bands are multiplied; the rest is added as it is (other
+    tiles may lie under it where georeferenced tiles overlap by more than
+    their fades).
     """
-    out = canvas.copy()
-    h, w = canvas.shape
-
-    # Blend vertical seams (between columns).
-    for col in range(1, cols):
-        x = col * tile_w
-        if x >= w:
+    h, w = data.shape
+    wy   = _fade_weights(h, *fade_y)
+    wx   = _fade_weights(w, *fade_x)
+    for ys in _bands(h, *fade_y):
+        for xs in _bands(w, *fade_x):
+            dst = canvas[y0 + ys.start:y0 + ys.stop, x0 + xs.start:x0 + xs.stop]
+            if ys == slice(fade_y[0], h - fade_y[1]) and xs == slice(fade_x[0], w - fade_x[1]):
+                dst += data[ys, xs]
+            else:
+                dst += data[ys, xs] * (wy[ys, None] * wx[None, xs])
+
+
+def _normalize_weights(canvas: np.ndarray, plan: list[dict]) -> None:
+    """
+    Cross-faded tiles' weights add up to 1 only where every faded edge has
+    a neighbour fading the other way over the same pixels -- not where three
+    tiles meet at a corner, where a neighbour covers only part of an edge or
+    where overlaps differ -- nor where tiles overlap beyond their fades.
+    Divide every block the fades reach or more than one tile covers by the
+    sum of the weights that went into it. Blocks are cut at every tile edge
+    and fade boundary, so each tile's weight is a plain product of ramps in
+    each.
+    """
+    weights = [(_fade_weights(t["h"], *t["fade_y"]), _fade_weights(t["w"], *t["fade_x"]))
+               for t in plan]
+
+    def cuts(tiles, o, n, fade):
+        return sorted({v for t in tiles for v in (t[o], t[o] + t[fade][0],
+                                                  t[o] + t[n] - t[fade][1], t[o] + t[n])})
+
+    ys = cuts(plan, "y0", "h", "fade_y")
+    for ya, yb in zip(ys, ys[1:]):
+        band = [t for t in plan if t["y0"] <= ya and yb <= t["y0"] + t["h"]]
+        xs   = cuts(band, "x0", "w", "fade_x")
+        for xa, xb in zip(xs, xs[1:]):
+            cover = [t for t in band if t["x0"] <= xa and xb <= t["x0"] + t["w"]]
+            faded = len(cover) > 1 or any(
+                ya < t["y0"] + t["fade_y"][0] or yb > t["y0"] + t["h"] - t["fade_y"][1]
+                or xa < t["x0"] + t["fade_x"][0] or xb > t["x0"] + t["w"] - t["fade_x"][1]
+                for t in cover)
+            if not faded:
+                continue
+            total = np.zeros((yb - ya, xb - xa), dtype=np.float32)
+            for t in cover:
+                wy, wx = weights[t["index"]]
+                total += wy[ya - t["y0"]:yb - t["y0"], None] * wx[None, xa - t["x0"]:xb - t["x0"]]
+            canvas[ya:yb, xa:xb] /= total
+
+
+def _fade_weights(n: int, before: int, after: int) -> np.ndarray:
+    """Weights along one tile axis: ramps over the first `before` and last `after` pixels, 1 between."""
+    w = np.ones(n, dtype=np.float32)
+    if before:
+        w[:before] = (np.arange(before, dtype=np.float32) + 0.5) / before
+    if after:
+        w[n - after:] = (np.arange(after, 0, -1, dtype=np.float32) - 0.5) / after
+    return w
+
+
+def _bands(n: int, before: int, after: int) -> list[slice]:
+    """The ramp-up, full-weight and ramp-down ranges of one tile axis (empty ones left out)."""
+    return [s for s in (slice(0, before), slice(before, n - after), slice(n - after, n))
+            if s.stop > s.start]
+
+
+def _blend_seams(canvas: np.ndarray, seams_x: list[tuple], seams_y: list[tuple],
+                 plan: list[dict] | None = None) -> None:
+    """
+    Remove the step at every seam between edge-to-edge tiles (see
+    _link_tiles()), in place. The jump across a seam, less the slope on
+    either side of it, is split between the two tiles and faded out
+    linearly over the seam's band, so the terrain near a seam is offset
+    rather than replaced. Each seam is done at once with broadcast ramps;
+    vertical seams first. A seam with a gap has the pixels no tile of
+    `plan` covers interpolated across it instead.
+    """
+    for x, y0, y1, band, gap in seams_x:
+        rows = canvas[y0:y1]
+        if gap:
+            _bridge(rows[:, x - gap - 1:x + 1].T, _uncovered(plan, x - gap, x, y0, y1).T)
             continue
-        left  = max(0,     x - blend_px)
-        right = min(w - 1, x + blend_px)
-        for px in range(left, right + 1):
-            alpha = (px - left) / max(1, right - left)
-            out[:, px] = (1.0 - alpha) * canvas[:, left] + alpha * canvas[:, right]
-
-    # Blend horizontal seams (between rows).
-    for row in range(1, rows):
-        y = row * tile_h
-        if y >= h:
+        step = _seam_step(rows[:, x - 2], rows[:, x - 1], rows[:, x], rows[:, x + 1])
+        fade = 0.5 * step[:, None] * _seam_ramp(band)
+        rows[:, x - band:x] += fade[:, ::-1]
+        rows[:, x:x + band] -= fade
+
+    for y, x0, x1, band, gap in seams_y:
+        cols = canvas[:, x0:x1]
+        if gap:
+            _bridge(cols[y - gap - 1:y + 1], _uncovered(plan, x0, x1, y - gap, y))
             continue
-        top    = max(0,     y - blend_px)
-        bottom = min(h - 1, y + blend_px)
-        for py in range(top, bottom + 1):
-            alpha = (py - top) / max(1, bottom - top)
-            out[py, :] = (1.0 - alpha) * canvas[top, :] + alpha * canvas[bottom, :]
+        step = _seam_step(cols[y - 2], cols[y - 1], cols[y], cols[y + 1])
+        fade = 0.5 * step[None, :] * _seam_ramp(band)[:, None]
+        cols[y - band:y] += fade[::-1]
+        cols[y:y + band] -= fade
+
 
-    return out
+def _bridge(block: np.ndarray, empty: np.ndarray) -> None:
+    """
+    Fill the inner rows of `block` where `empty` (one row per inner row) by
+    linear interpolation between its first and last rows.
+    """
+    n = block.shape[0] - 1
+    t = (np.arange(1, n, dtype=np.float32) / n)[:, None]
+    np.copyto(block[1:-1], block[0] + t * (block[-1] - block[0]), where=empty)
+
+
+def _fill_uncovered(canvas: np.ndarray, plan: list[dict], seams: tuple[list, list],
+                    band_rows: int) -> float | None:
+    """
+    Set the canvas pixels no tile covers and no seam bridged (see
+    _blend_seams()) to the lowest covered elevation, band_rows rows at a
+    time, in place. Returns that elevation, or None if there are no such
+    pixels.
+    """
+    h, w = canvas.shape
+    if _covered_px(plan) == h * w:
+        return None
+    bridged = [(y0, y1, x - gap, x) for x, y0, y1, _, gap in seams[0] if gap] \
+        + [(y - gap, y, x0, x1) for y, x0, x1, _, gap in seams[1] if gap]
+
+    def holes(ya: int, yb: int) -> np.ndarray:
+        empty = _uncovered(plan, 0, w, ya, yb)
+        for y0, y1, x0, x1 in bridged:
+            if max(y0, ya) < min(y1, yb):
+                empty[max(y0, ya) - ya:min(y1, yb) - ya, x0:x1] = False
+        return empty
+
+    floor = math.inf
+    for ya, yb in exr_io.row_blocks(h, band_rows):
+        empty = holes(ya, yb)
+        if not empty.all():
+            floor = min(floor, float(canvas[ya:yb][~empty].min()))
+    if floor == math.inf:
+        return None
+    for ya, yb in exr_io.row_blocks(h, band_rows):
+        empty = holes(ya, yb)
+        if empty.any():
+            canvas[ya:yb][empty] = floor
+    if isinstance(canvas, np.memmap):
+        canvas.flush()
+    return floor
+
+
+def _uncovered(plan: list[dict], x0: int, x1: int, y0: int, y1: int) -> np.ndarray:
+    """Mask of the canvas block [y0:y1, x0:x1] that no tile of `plan` covers."""
+    empty = np.ones((y1 - y0, x1 - x0), dtype=bool)
+    for t in plan:
+        ya, yb = max(y0, t["y0"]), min(y1, t["y0"] + t["h"])
+        xa, xb = max(x0, t["x0"]), min(x1, t["x0"] + t["w"])
+        if ya < yb and xa < xb:
+            empty[ya - y0:yb - y0, xa - x0:xb - x0] = False
+    return empty
+
+
+def _covered_px(plan: list[dict]) -> int:
+    """Canvas pixels inside at least one tile."""
+    ys    = sorted({v for t in plan for v in (t["y0"], t["y0"] + t["h"])})
+    total = 0
+    for ya, yb in zip(ys, ys[1:]):
+        spans = sorted((t["x0"], t["x0"] + t["w"]) for t in plan
+                       if t["y0"] <= ya and yb <= t["y0"] + t["h"])
+        end   = -1
+        for xa, xb in spans:
+            total += (yb - ya) * max(0, xb - max(xa, end))
+            end    = max(end, xb)
+    return total
+
+
+def _seam_step(before2: np.ndarray, before1: np.ndarray,
+               after1: np.ndarray, after2: np.ndarray) -> np.ndarray:
+    """Jump across a seam beyond what the slope on both sides accounts for."""
+    slope = 0.5 * ((before1 - before2) + (after2 - after1))
+    return (after1 - before1) - slope
+
+
+def _seam_ramp(n: int) -> np.ndarray:
+    """1 next to the seam, falling linearly towards 0 `n` pixels away."""
+    return (1.0 - np.arange(n) / n).astype(np.float32)
 
 
 # -- Metadata ------------------------------------------------------------------
 
-def _write_metadata(meta_path: Path, tile_paths: list[Path], meta: dict) -> None:
+def _write_metadata(meta_path: Path, layout: dict, meta: dict) -> None:
+    plan = layout["plan"]
+    if "crs" in layout:
+        res_x, res_y = layout["res"]
+        left, top    = layout["transform"][2], layout["transform"][5]
+        placement = [
+            "Layout:        georeferenced",
+            f"CRS:           {layout['crs']}",
+            f"Resolution:    {res_x:.2f}m x {res_y:.2f}m per pixel",
+            f"Bbox (UTM):    {left:.1f} {top - meta['canvas_h'] * res_y:.1f} "
+            f"{left + meta['canvas_w'] * res_x:.1f} {top:.1f}",
+        ]
+        spacing = f"  - vertex_spacing: {res_x:.1f} (meters per pixel -- set on the Terrain3D node)"
+        order   = "Tile placement (canvas pixels):"
+        tiles   = [f"  [{t['index'] + 1:>3}] {t['path'].parent.name}/{t['path'].name}  "
+                   f"[{t['x0']}:{t['x0'] + t['w']}, {t['y0']}:{t['y0'] + t['h']}]" for t in plan]
+    else:
+        placement = [
+            f"Grid layout:   {layout['cols']} col(s) x {layout['rows']} row(s)",
+            f"Tile size:     {plan[0]['w']} x {plan[0]['h']} px each",
+            f"Tile overlap:  {meta['overlap']} px (cross-faded)",
+        ]
+        spacing = "  - 1 pixel = 1 meter (approx) -- leave vertex_spacing at 1.0"
+        order   = "Tile order (left->right, top->bottom):"
+        tiles   = [f"  [{t['index'] + 1:>3}] {t['path'].name}" for t in plan]
+    regions = meta.get("regions")
+    if regions:
+        spacing += (f"\n  - Regions: {len(regions['regions'])} of {regions['region_size']} px in "
+                    f"{terrain3d_regions.DIR_NAME}/ from location {tuple(regions['origin'])} "
+                    f"({regions['skipped']} empty skipped), listed in "
+                    f"{terrain3d_regions.INDEX_NAME} -- set region_size "
+                    f"{regions['region_size']} on the Terrain3D node")
     lines = [
         "Terrain Map Fetcher -- Combined Heightmap Metadata",
         "=" * 40,
-        f"Total tiles:   {len(tile_paths)}",
-        f"Grid layout:   {meta['cols']} col(s) x {meta['rows']} row(s)",
-        f"Tile size:     {meta['tile_w']} x {meta['tile_h']} px each",
+        f"Total tiles:   {len(plan)}",
+        *placement,
         f"Canvas size:   {meta['canvas_w']} x {meta['canvas_h']} px total",
         f"Min elevation: {meta['min_elev']:.2f} m",
         f"Max elevation: {meta['max_elev']:.2f} m",
         f"Elev range:    {meta['max_elev'] - meta['min_elev']:.2f} m",
         "",
         "Terrain3D Import Notes:",
-        "  - EXR format: RGB 32-bit float, values in real meters",
+        f"  - EXR format: {exr_io.describe(meta['exr'])}, values in real meters"
+        + (f" (max rounding error {meta['max_error']:.3f} m)" if "max_error" in meta else ""),
         f"  - Height scale:  {meta['max_elev'] - meta['min_elev']:.1f} (elevation range)",
         f"  - Height offset: {meta['min_elev']:.1f} (minimum elevation)",
-        "  - 1 pixel = 1 meter (approx) -- leave vertex_spacing at 1.0",
+        spacing,
         "",
-        "Tile order (left->right, top->bottom):",
-    ] + [f"  [{i+1:>3}] {p.name}" for i, p in enumerate(tile_paths)]
+        order,
+    ] + tiles
     meta_path.write_text("\n".join(lines))
 
 
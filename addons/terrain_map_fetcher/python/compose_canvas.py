@@ -6,10 +6,28 @@ Reads a TerrainProject's project.json + placed patch data, then composites
 all placed patches (heightmap EXR + imagery PNG) using their masks into a
 single merged EXR + imagery PNG.
 
+Each patch is read from the smallest pyramid level (see pyramid.py) that
+still covers its size in the output, so a small export never decodes the
+full-resolution files.
+
+The merged imagery is written as imagery.png by default; --image-format
+selects WebP or a block-compressed DDS instead (see image_encoders.py).
+With --output regions (or both) the heightmap and imagery are instead (or
+also) cut into Terrain3D regions under terrain3d_regions/, written by
+--workers processes and indexed by regions.json; regions outside every
+patch mask are skipped (see terrain3d_regions.py).
+
 Usage:
     python3 compose_canvas.py --project-dir /path/to/TerrainProject
                                --export-name combined_terrain
                                [--max-resolution 8192]
+                               [--image-format png|webp|webp-lossless|dds-bc1|dds-bc7]
+                               [--png-level 6] [--webp-quality 90]
+                               [--output single|regions|both] [--region-size 256]
+                               [--region-origin X Y] [--workers N]
+                               [--exr-channels r|rgb] [--exr-pixel-type float|half]
+                               [--exr-compression zip]
+                               [--events events.jsonl] [--profile DIR]
 """
 
 import argparse
@@ -17,21 +35,32 @@ import json
 import sys
 from pathlib import Path
 
-import numpy as np
+import exr_io
+import image_encoders
+import stages
+import terrain3d_regions
+
+
+def import_heavy():
+    """Import numpy, Pillow and OpenEXR into this module; main() does once the project checks out."""
+    global np, Image, GaussianBlur, OpenEXR, Imath, pyramid
+    import numpy as np
 
-try:
-    from PIL import Image
-    from PIL.ImageFilter import GaussianBlur
-except ImportError:
-    print("ERROR: Pillow not installed. Run setup.py --install first.", file=sys.stderr)
-    sys.exit(1)
+    import pyramid
 
-try:
-    import OpenEXR
-    import Imath
-except ImportError:
-    print("ERROR: OpenEXR not installed. Run setup.py --install first.", file=sys.stderr)
-    sys.exit(1)
+    try:
+        from PIL import Image
+        from PIL.ImageFilter import GaussianBlur
+    except ImportError:
+        print("ERROR: Pillow not installed. Run setup.py --install first.", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        import OpenEXR
+        import Imath
+    except ImportError:
+        print("ERROR: OpenEXR not installed. Run setup.py --install first.", file=sys.stderr)
+        sys.exit(1)
 
 
 # ── Resample helpers ──────────────────────────────────────────────────────────
@@ -60,9 +89,20 @@ def _resample_rgb(arr, w, h):
     return np.array(pil.resize((w, h), Image.LANCZOS), dtype=np.uint8)
 
 
+def _read_exr_r(path):
+    """Read the R channel of a float EXR as a 2D float32 array."""
+    exr = OpenEXR.InputFile(str(path))
+    dw  = exr.header()["dataWindow"]
+    w   = dw.max.x - dw.min.x + 1
+    h   = dw.max.y - dw.min.y + 1
+    raw = exr.channel("R", Imath.PixelType(Imath.PixelType.FLOAT))
+    exr.close()
+    return np.frombuffer(raw, dtype=np.float32).reshape(h, w)
+
+
 # ── Main ──────────────────────────────────────────────────────────────────────
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--project-dir",   required=True)
     parser.add_argument("--export-name",   required=True)
@@ -75,8 +115,19 @@ def main() -> None:
     # Legacy fallback — kept for CLI use
     parser.add_argument("--max-resolution", type=int, default=0,
                         help="Deprecated: use --out-width/--out-height instead")
-    args = parser.parse_args()
-
+    parser.add_argument("--workers",       type=int, default=0,
+                        help="Processes writing Terrain3D regions in parallel "
+                             "(0 = one per CPU; 1 = serial).")
+    terrain3d_regions.add_arguments(parser)
+    image_encoders.add_arguments(parser)
+    exr_io.add_arguments(parser)
+    stages.add_argument(parser)
+    args = parser.parse_args(argv)
+    with stages.run("compose_canvas", args.events, args.profile):
+        _compose(args)
+
+
+def _compose(args: argparse.Namespace) -> None:
     project_dir   = Path(args.project_dir)
     export_name   = args.export_name
     edge_feather  = max(0, args.edge_feather)
@@ -97,13 +148,15 @@ def main() -> None:
         print("ERROR: No patches placed on canvas.", file=sys.stderr)
         sys.exit(1)
 
+    import_heavy()
     print(f"Compositing {len(canvas_patches)} placed patch(es)...")
 
     # -- Load each patch -------------------------------------------------------
-    # We store SOURCE pixel data here (not pre-scaled), plus the effective
-    # canvas extents (src * scale_xy).  All resampling happens at composite time
-    # so we never allocate the full scaled-up array up front.
+    # Only sizes are read here, plus the effective canvas extents
+    # (src * scale_xy). Heightmap and imagery pixels are read at composite
+    # time, from the cheapest pyramid level that covers the output size.
     loaded = []
+    load   = stages.stage("load", patches=len(canvas_patches))
     for cp in canvas_patches:
         patch_name = cp.get("patch_name", "")
         cx       = int(cp.get("canvas_x", 0))
@@ -142,33 +195,27 @@ def main() -> None:
             print(f"  Warning: imagery not found for '{patch_name}'")
             img_path = None
 
-        # Read EXR heightmap at native resolution
+        # Read the EXR header for the native size
         try:
             exr = OpenEXR.InputFile(str(hm_path))
             dw  = exr.header()["dataWindow"]
             src_w = dw.max.x - dw.min.x + 1
             src_h = dw.max.y - dw.min.y + 1
-            raw   = exr.channel("R", Imath.PixelType(Imath.PixelType.FLOAT))
             exr.close()
-            hm_data = np.frombuffer(raw, dtype=np.float32).reshape(src_h, src_w)
         except Exception as e:
             print(f"  Skipping '{patch_name}': EXR read error: {e}", file=sys.stderr)
             continue
 
-        # Apply scale_z (height exaggeration) in-place
-        if abs(scale_z - 1.0) > 1e-6:
-            hm_data = hm_data * scale_z
-
         # Effective canvas extents — used for layout, NOT for pixel allocation
         eff_w = max(1, int(round(src_w * scale_xy)))
         eff_h = max(1, int(round(src_h * scale_xy)))
 
-        # Read imagery at native resolution
-        img_data = None
+        # Imagery size (Image.open only parses the header)
+        img_size = None
         if img_path:
             try:
-                img_pil  = Image.open(img_path).convert("RGB")
-                img_data = np.array(img_pil, dtype=np.uint8)
+                with Image.open(img_path) as img_pil:
+                    img_size = img_pil.size
             except Exception as e:
                 print(f"  Warning: could not load imagery for '{patch_name}': {e}")
 
@@ -197,13 +244,17 @@ def main() -> None:
             "eff_h":     eff_h,   # canvas-space height (cy + eff_h = bottom edge)
             "scale_xy":  scale_xy,
             "scale_z":   scale_z,
-            "hm":        hm_data,   # native-res float32
-            "img":       img_data,  # native-res uint8 RGB or None
+            "hm_path":   hm_path,
+            "hm_size":   (src_w, src_h),
+            "img_path":  img_path if img_size else None,
+            "img_size":  img_size,
             "mask":      mask_data, # native-res float32 [0,1]
         })
+        load.add(pixels=mask_data.size)
         print(f"  OK Loaded '{patch_name}' (src {src_w}x{src_h} px, "
               f"canvas {eff_w}x{eff_h} px, scale_xy={scale_xy}, "
               f"scale_z={scale_z}, offset {cx},{cy})")
+    load.end()
 
     if not loaded:
         print("ERROR: No valid patches could be loaded.", file=sys.stderr)
@@ -239,7 +290,9 @@ def main() -> None:
     out_alpha = np.zeros((out_h, out_w), dtype=np.float32)
     out_img   = np.zeros((out_h, out_w, 3), dtype=np.float32)
 
-    for patch in loaded:
+    composite = stages.stage("composite", width=out_w, height=out_h)
+    for n, patch in enumerate(loaded, 1):
+        composite.progress(n - 1, len(loaded), "patches")
         # Output-pixel position and size for this patch
         ox0 = int(round((patch["cx"] - min_cx) * out_scale))
         oy0 = int(round((patch["cy"] - min_cy) * out_scale))
@@ -248,11 +301,31 @@ def main() -> None:
         ox1 = ox0 + pw
         oy1 = oy0 + ph
 
-        # Resample all layers to output dimensions
-        hm_rs   = _resample_f32(patch["hm"],   pw, ph)
+        # Read the cheapest level that covers pw x ph, then resample all
+        # layers to output dimensions
+        hm_level, lw, lh = pyramid.pick_level(patch["hm_path"], *patch["hm_size"], pw, ph)
+        try:
+            hm_data = _read_exr_r(hm_level)
+        except Exception as e:
+            print(f"  Skipping '{patch['name']}': EXR read error: {e}", file=sys.stderr)
+            continue
+        # Apply scale_z (height exaggeration)
+        if abs(patch["scale_z"] - 1.0) > 1e-6:
+            hm_data = hm_data * patch["scale_z"]
+        img_data = None
+        if patch["img_path"]:
+            img_level, _, _ = pyramid.pick_level(patch["img_path"], *patch["img_size"], pw, ph)
+            try:
+                img_data = np.array(Image.open(img_level).convert("RGB"), dtype=np.uint8)
+            except Exception as e:
+                print(f"  Warning: could not load imagery for '{patch['name']}': {e}")
+        if hm_level != patch["hm_path"]:
+            print(f"  '{patch['name']}': using {hm_level.name} ({lw}x{lh} px)")
+
+        hm_rs   = _resample_f32(hm_data,   pw, ph)
         mask_rs = _resample_mask(patch["mask"], pw, ph)
-        img_rs  = (_resample_rgb(patch["img"], pw, ph)
-                   if patch["img"] is not None else None)
+        img_rs  = (_resample_rgb(img_data, pw, ph)
+                   if img_data is not None else None)
 
         # Apply edge feather (blurs the mask so patch edges blend softly)
         if edge_feather > 0:
@@ -292,24 +365,72 @@ def main() -> None:
             out_img[py0:py1, px0:px1] = (
                 img_region  * new_alpha_3 +
                 out_img[py0:py1, px0:px1] * old_alpha_3) / denom[:, :, np.newaxis]
-
-    print(f"\nElevation range: {out_hm.min():.1f}m - {out_hm.max():.1f}m")
-
-    # -- Write combined EXR ----------------------------------------------------
-    exr_out_path = exports_dir / "heightmap.exr"
-    header  = OpenEXR.Header(out_w, out_h)
-    channel = Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT))
-    header["channels"] = {"R": channel}
-    exr_out = OpenEXR.OutputFile(str(exr_out_path), header)
-    exr_out.writePixels({"R": out_hm.tobytes()})
-    exr_out.close()
-    print(f"OK Saved: {exr_out_path}")
-
-    # -- Write combined imagery ------------------------------------------------
-    img_out_path = exports_dir / "imagery.png"
-    img_out_arr  = np.clip(out_img, 0, 255).astype(np.uint8)
-    Image.fromarray(img_out_arr, "RGB").save(str(img_out_path))
-    print(f"OK Saved: {img_out_path}")
+        composite.add(pixels=(py1 - py0) * (px1 - px0))
+    composite.end()
+
+    # Pixels no patch covers would stay at 0 m, a pit far below the terrain;
+    # set them to the lowest covered elevation instead.
+    uncovered = out_alpha == 0
+    if uncovered.any() and not uncovered.all():
+        out_hm[uncovered] = out_hm[~uncovered].min()
+    del uncovered
+    elev_min, elev_max = float(out_hm.min()), float(out_hm.max())
+    print(f"\nElevation range: {elev_min:.1f}m - {elev_max:.1f}m")
+
+    exr_opts    = exr_io.writer_options(args)
+    img_out_arr = np.clip(out_img, 0, 255).astype(np.uint8)
+    del out_img
+    written     = {"heightmap_exr": exr_opts}
+
+    if args.output != "regions":
+        # -- Write combined EXR ------------------------------------------------
+        exr_out_path = exports_dir / "heightmap.exr"
+        with stages.stage("exr_write", **exr_opts) as st:
+            with exr_io.ScanlineWriter(exr_out_path, out_w, out_h, **exr_opts) as exr_out:
+                for y0, y1 in exr_io.row_blocks(out_h):
+                    exr_out.write(out_hm[y0:y1])
+            st.add(nbytes=exr_out_path.stat().st_size, pixels=out_hm.size)
+        print(f"OK Saved: {exr_out_path} ({exr_io.describe(exr_opts)})")
+        if exr_out.half:
+            print(f"  Half pixels: max rounding error {exr_out.max_error:.3f}m")
+            written["heightmap_exr"] = {**exr_opts, "max_error": exr_out.max_error}
+
+        # -- Write combined imagery --------------------------------------------
+        img_out_path = exports_dir / f"imagery{image_encoders.suffix(args.image_format)}"
+        try:
+            with stages.stage("image_encode", format=args.image_format) as st:
+                image_encoders.save(Image.fromarray(img_out_arr, "RGB"), img_out_path,
+                                    args.image_format, args.png_level, args.webp_quality)
+                st.add(nbytes=img_out_path.stat().st_size, pixels=out_w * out_h)
+        except Exception as e:
+            print(f"ERROR: Could not write {img_out_path.name}: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"OK Saved: {img_out_path} ({args.image_format})")
+        written["imagery_file"] = img_out_path.name
+
+    if args.output != "single":
+        # -- Write Terrain3D regions -------------------------------------------
+        # A canvas pixel is vertex_spacing metres; the output is out_scale of that.
+        spacing = project.get("global_settings", {}).get("vertex_spacing")
+        grid    = terrain3d_regions.plan(out_w, out_h, args.region_size, args.region_origin)
+        try:
+            regions = terrain3d_regions.export(
+                exports_dir, out_hm, grid, exr_opts, args.workers, color=img_out_arr,
+                image_opts={"fmt": args.image_format, "png_level": args.png_level,
+                            "webp_quality": args.webp_quality},
+                coverage=lambda x0, y0, x1, y1: out_alpha[y0:y1, x0:x1] > 0,
+                vertex_spacing=float(spacing) / out_scale if spacing else None)
+        except Exception as e:
+            print(f"ERROR: Could not write the Terrain3D regions: {e}", file=sys.stderr)
+            sys.exit(1)
+        if "max_error" in regions:
+            print(f"  Half pixels: max rounding error {regions['max_error']:.3f}m")
+            written["heightmap_exr"] = {**exr_opts, "max_error": regions["max_error"]}
+        written["regions"] = {"index":       f"{terrain3d_regions.DIR_NAME}/{regions['path'].name}",
+                              "region_size": regions["region_size"],
+                              "origin":      regions["origin"],
+                              "count":       len(regions["regions"]),
+                              "skipped":     regions["skipped"]}
 
     # -- Write metadata --------------------------------------------------------
     meta_out = exports_dir / "export_meta.json"
@@ -319,11 +440,16 @@ def main() -> None:
             "output_width_px":  out_w,
             "output_height_px": out_h,
             "edge_feather_px":  edge_feather,
+            "output":           args.output,
+            "imagery_file":     written.get("imagery_file"),
+            "imagery_format":   args.image_format,
+            "heightmap_exr":    written["heightmap_exr"],
+            **({"regions": written["regions"]} if "regions" in written else {}),
             "canvas_width_px":  canvas_w,
             "canvas_height_px": canvas_h,
             "patch_count":      len(loaded),
-            "elev_min_m":       float(out_hm.min()),
-            "elev_max_m":       float(out_hm.max()),
+            "elev_min_m":       elev_min,
+            "elev_max_m":       elev_max,
             "patches": [{"instance_id": p["instance"], "name": p["name"],
                           "cx": p["cx"], "cy": p["cy"],
                           "scale_xy": p["scale_xy"], "scale_z": p["scale_z"]}
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+downloader.py
+-------------
+Shared HTTP download helpers for process_dem.py and process_imagery.py.
+
+  - HostPool:   keep-alive HTTP(S) connections, one per host per thread, so
+                several tiles from the same server reuse their sockets.
+  - Progress:   one aggregated progress line for all in-flight downloads.
+  - fetch():    stream a single URL to a file, retrying with backoff and
+                resuming partial files with HTTP Range requests.
+  - head():     fetch only the response headers (ETag, Last-Modified, size).
+  - run_concurrent(): run a download function over many items with a bounded
+                worker pool, yielding each result as soon as it finishes.
+"""
+
+import http.client
+import random
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+CHUNK_SIZE      = 1024 * 256   # 256 KB download chunks
+DEFAULT_TIMEOUT = 300          # seconds per socket operation
+MAX_REDIRECTS   = 5
+RETRIES         = 5            # extra attempts after the first failure
+BACKOFF_BASE    = 1.0          # seconds; doubled per attempt, with full jitter
+BACKOFF_MAX     = 60.0
+
+
+# -- Connection pool -----------------------------------------------------------
+
+class HostPool:
+    """
+    Keep-alive connections keyed by (scheme, host, port), one set per thread.
+    http.client connections are not thread-safe, so each worker thread owns
+    its own sockets and reuses them for every request to the same host.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self._local  = threading.local()
+        self._ssl    = ssl.create_default_context()
+        self._lock   = threading.Lock()
+        self._all: list = []
+
+    def _conns(self) -> dict:
+        if not hasattr(self._local, "conns"):
+            self._local.conns = {}
+        return self._local.conns
+
+    def get(self, scheme: str, host: str, port) -> http.client.HTTPConnection:
+        key   = (scheme, host, port)
+        conns = self._conns()
+        conn  = conns.get(key)
+        if conn is None:
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(host, port, timeout=self.timeout,
+                                                   context=self._ssl)
+            else:
+                conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+            conns[key] = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def discard(self, scheme: str, host: str, port) -> None:
+        conn = self._conns().pop((scheme, host, port), None)
+        if conn is not None:
+            conn.close()
+
+    def close(self) -> None:
+        """Close every connection opened by any thread."""
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+
+
+# -- Progress ------------------------------------------------------------------
+
+class Progress:
+    """
+    Aggregated byte counter printed as a single \\r-updated line. With a
+    `stage` (see stages.py) the bytes and progress are reported to it too.
+    """
+
+    def __init__(self, count: int, interval: float = 0.5, stage=None):
+        self.count     = count
+        self.interval  = interval
+        self.stage     = stage
+        self._lock     = threading.Lock()
+        self._done     = 0
+        self._totals: dict = {}
+        self._finished = 0
+        self._last     = 0.0
+
+    def start(self, key, total: int) -> None:
+        with self._lock:
+            self._totals[key] = total
+
+    def advance(self, nbytes: int) -> None:
+        if self.stage is not None:
+            self.stage.add(nbytes=nbytes)
+        with self._lock:
+            self._done += nbytes
+            now = time.monotonic()
+            if now - self._last >= self.interval:
+                self._last = now
+                self._print_locked()
+
+    def finish(self, key, message: str = "") -> None:
+        with self._lock:
+            self._finished += 1
+            if message:
+                print(" " * 72, end="\r")
+                print(f"  [{self._finished}/{self.count}] {message}", flush=True)
+
+    def _print_locked(self) -> None:
+        total = sum(self._totals.values())
+        mb    = self._done / 1024 / 1024
+        if self.stage is not None:
+            self.stage.progress(self._done, total or None)
+        if total:
+            pct = min(100.0, self._done / total * 100)
+            print(f"  {pct:.0f}%  ({mb:.1f} / {total / 1024 / 1024:.1f} MB, "
+                  f"{self._finished}/{self.count} done)", end="\r", flush=True)
+        else:
+            print(f"  {mb:.1f} MB  ({self._finished}/{self.count} done)", end="\r", flush=True)
+
+
+# -- Errors --------------------------------------------------------------------
+
+class DownloadError(RuntimeError):
+    """A failed request. `retryable` marks transient failures worth retrying."""
+
+    def __init__(self, message: str, retryable: bool = False, status: int = 0,
+                 retry_after: float | None = None):
+        super().__init__(message)
+        self.retryable   = retryable
+        self.status      = status
+        self.retry_after = retry_after
+
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def _status_error(url: str, status: int, reason: str, headers) -> DownloadError:
+    retry_after = None
+    try:
+        retry_after = float(headers.get("Retry-After", ""))
+    except (TypeError, ValueError):
+        pass
+    return DownloadError(f"Download failed: HTTP {status} {reason} ({url})",
+                         retryable=status in RETRYABLE_STATUS, status=status,
+                         retry_after=retry_after)
+
+
+# -- Single download -----------------------------------------------------------
+
+def fetch(url: str, dest: Path, headers: dict | None = None,
+          pool: HostPool | None = None, progress: Progress | None = None,
+          retries: int = RETRIES, resume: bool = True,
+          if_range: str | None = None, reject_types: tuple = ()) -> int:
+    """
+    Stream `url` into `dest` and return the final file size.
+
+    Transient failures (connection resets, timeouts, 5xx/429, short bodies) are
+    retried up to `retries` times with exponential backoff and full jitter.
+    With `resume`, a retry -- or a later run that finds `dest` already partly
+    written -- continues with a Range request instead of starting over. An
+    If-Range validator (`if_range`, or the ETag/Last-Modified of the first
+    response) makes the server send the whole file again if it has changed in
+    between. The finished size is checked against Content-Length.
+
+    Responses whose Content-Type contains any of `reject_types` (e.g. an XML
+    error document from a WMS) fail immediately without retrying.
+
+    Uses a keep-alive connection from `pool` when given; falls back to urllib
+    when no pool is given or a proxy is configured for the URL's scheme.
+    """
+    dest      = Path(dest)
+    name      = Path(urllib.parse.urlsplit(url).path).name or url[:60]
+    validator = if_range
+    counted   = 0   # bytes of dest already reported to `progress`
+
+    for attempt in range(retries + 1):
+        have = dest.stat().st_size if resume and dest.exists() else 0
+        req_headers = dict(headers or {})
+        if have:
+            req_headers["Range"] = f"bytes={have}-"
+            if validator:
+                req_headers["If-Range"] = validator
+        try:
+            try:
+                r = _open(url, "GET", req_headers, pool)
+            except DownloadError as e:
+                if e.status == 416 and have:
+                    # Nothing left to send: either already complete or the
+                    # partial file is bogus. Start from scratch to be sure.
+                    dest.unlink(missing_ok=True)
+                    raise DownloadError("range not satisfiable", retryable=True) from e
+                raise
+            with r:
+                _reject(r, url, reject_types)
+                validator = validator or r.headers.get("ETag") or r.headers.get("Last-Modified")
+                if r.status == 206:
+                    start, total = _content_range(r.headers)
+                    if start != have:
+                        dest.unlink(missing_ok=True)
+                        raise DownloadError(f"server resumed at byte {start}, expected {have}",
+                                            retryable=True)
+                    mode = "ab"
+                else:
+                    # Full body: first request, or the server ignored the Range.
+                    length = r.headers.get("Content-Length")
+                    total  = int(length) if length else None
+                    have   = 0
+                    mode   = "wb"
+                if progress:
+                    if counted != have:
+                        progress.advance(have - counted)
+                        counted = have
+                    progress.start(url, total or 0)
+                try:
+                    counted += _stream(r, dest, mode, progress)
+                except (OSError, http.client.HTTPException) as e:
+                    # _stream reported every byte it wrote, so progress now
+                    # matches whatever made it to disk.
+                    counted = dest.stat().st_size if dest.exists() else 0
+                    raise DownloadError(f"connection lost: {e}", retryable=True) from e
+
+            size = dest.stat().st_size
+            if total is not None and size != total:
+                raise DownloadError(f"incomplete body ({size} of {total} bytes)", retryable=True)
+            return size
+
+        except DownloadError as e:
+            if not e.retryable:
+                raise
+            detail = str(e).removeprefix("Download failed: ")
+            if attempt == retries:
+                raise DownloadError(f"Download failed after {retries + 1} attempts: {detail}",
+                                    status=e.status) from e
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            if e.retry_after is not None:
+                delay = max(delay, min(e.retry_after, BACKOFF_MAX))
+            kept = dest.stat().st_size if resume and dest.exists() else 0
+            print(f"\n  {name}: {detail} -- retry {attempt + 1}/{retries} in {delay:.1f}s"
+                  + (f", resuming at {kept / 1024 / 1024:.1f} MB" if kept else ""), flush=True)
+            time.sleep(delay)
+
+    raise AssertionError("unreachable")
+
+
+def head(url: str, headers: dict | None = None, pool: HostPool | None = None) -> dict:
+    """Return the response headers of a HEAD request, lower-cased keys."""
+    with _open(url, "HEAD", headers, pool) as r:
+        return {k.lower(): v for k, v in r.headers.items()}
+
+
+def _reject(r, url: str, reject_types: tuple) -> None:
+    content_type = r.headers.get("Content-Type", "") or ""
+    if any(t in content_type for t in reject_types):
+        body = r.read().decode("utf-8", errors="replace")
+        raise DownloadError(f"Server returned error document:\n{body[:400]}")
+
+
+def _content_range(headers) -> tuple[int, int | None]:
+    """Parse 'bytes START-END/TOTAL' into (START, TOTAL or None)."""
+    value = headers.get("Content-Range", "") or ""
+    try:
+        span, _, total = value.split(" ", 1)[1].partition("/")
+        start = int(span.split("-", 1)[0])
+        return start, (int(total) if total and total != "*" else None)
+    except (IndexError, ValueError):
+        raise DownloadError(f"bad Content-Range header {value!r}", retryable=True)
+
+
+class _Response:
+    """Context wrapper that drops a pooled connection if the body is abandoned."""
+
+    def __init__(self, r, on_error=None):
+        self.r        = r
+        self.headers  = r.headers
+        self.status   = getattr(r, "status", 200)
+        self.on_error = on_error
+
+    def read(self, n: int = -1) -> bytes:
+        return self.r.read(n)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.on_error:
+            self.on_error()
+        self.r.close()
+        return False
+
+
+def _open(url: str, method: str, headers: dict | None, pool: HostPool | None) -> _Response:
+    headers = dict(headers or {})
+    scheme  = urllib.parse.urlsplit(url).scheme
+    if pool is None or urllib.request.getproxies().get(scheme):
+        req = urllib.request.Request(url, headers=headers, method=method)
+        try:
+            return _Response(urllib.request.urlopen(req, timeout=DEFAULT_TIMEOUT))
+        except urllib.error.HTTPError as e:
+            raise _status_error(url, e.code, e.reason, e.headers) from e
+        except urllib.error.URLError as e:
+            raise DownloadError(f"Download failed: {e.reason}", retryable=True) from e
+        except (OSError, http.client.HTTPException) as e:
+            raise DownloadError(f"Download failed: {e}", retryable=True) from e
+
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        key   = (parts.scheme, parts.hostname, parts.port)
+        path  = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        try:
+            r = _send(pool, key, method, path, headers)
+        except (OSError, http.client.HTTPException):
+            # Stale keep-alive socket -- reconnect once before giving up.
+            pool.discard(*key)
+            try:
+                r = _send(pool, key, method, path, headers)
+            except (OSError, http.client.HTTPException) as e:
+                pool.discard(*key)
+                raise DownloadError(f"Download failed: {e}", retryable=True) from e
+
+        if r.status in (301, 302, 303, 307, 308):
+            location = r.getheader("Location")
+            r.read()
+            if not location:
+                raise DownloadError(f"Download failed: redirect without Location ({url})")
+            url = urllib.parse.urljoin(url, location)
+            continue
+        if r.status not in (200, 206):
+            r.read()
+            raise _status_error(url, r.status, r.reason, r.headers)
+        return _Response(r, on_error=lambda k=key: pool.discard(*k))
+
+    raise DownloadError(f"Download failed: too many redirects ({url})")
+
+
+def _send(pool: HostPool, key: tuple, method: str, path: str, headers: dict):
+    conn = pool.get(*key)
+    conn.request(method, path, headers=headers)
+    return conn.getresponse()
+
+
+def _stream(r, dest: Path, mode: str, progress: Progress | None) -> int:
+    done = 0
+    with open(dest, mode) as f:
+        while chunk := r.read(CHUNK_SIZE):
+            f.write(chunk)
+            done += len(chunk)
+            if progress:
+                progress.advance(len(chunk))
+    return done
+
+
+# -- Concurrent stage ----------------------------------------------------------
+
+def run_concurrent(func, items: list, workers: int):
+    """
+    Call func(item) for every item on up to `workers` threads and yield
+    (index, item, result) in completion order, so callers can start working
+    on a finished download while the rest are still in flight.
+    The first exception cancels all pending items and is re-raised.
+    """
+    workers = max(1, min(workers, len(items) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func, item): i for i, item in enumerate(items)}
+        try:
+            for fut in as_completed(futures):
+                i = futures[fut]
+                yield i, items[i], fut.result()
+        except BaseException:
+            for fut in futures:
+                fut.cancel()
+            raise
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+elevation_stats.py
+------------------
+Single-pass elevation statistics over row windows.
+
+ElevationStats collects min, max, NaN count and a fixed-bin histogram while
+the caller streams blocks through it, so one pass yields everything the
+NoData fill and the metadata need -- no full-array np.nanmedian (which sorts a
+copy) and no separate passes for min, max and NaN count.
+
+The median is read off the histogram: with the default 0.1 m bins it is
+within 0.05 m of the exact value, far below 3DEP's vertical accuracy.
+"""
+
+import numpy as np
+
+HIST_MIN_M   = -500.0    # below the Dead Sea shore
+HIST_MAX_M   = 9000.0    # above Everest
+HIST_BIN_M   = 0.1
+
+
+class ElevationStats:
+    def __init__(self, lo: float = HIST_MIN_M, hi: float = HIST_MAX_M,
+                 bin_width: float = HIST_BIN_M):
+        self.lo        = lo
+        self.bin_width = bin_width
+        self.nbins     = int(np.ceil((hi - lo) / bin_width))
+        # Two extra bins collect values below lo / above hi.
+        self.hist      = np.zeros(self.nbins + 2, dtype=np.int64)
+        self.count     = 0          # valid samples
+        self.nan_count = 0          # NaN or masked-out samples
+        self.min       = np.inf
+        self.max       = -np.inf
+
+    def add(self, block: np.ndarray, invalid: np.ndarray | None = None) -> None:
+        """
+        Accumulate one block. NaNs are always invalid; `invalid` marks extra
+        samples (e.g. a nodata value) to count as missing.
+        """
+        block = np.asarray(block)
+        bad   = np.isnan(block)
+        if invalid is not None:
+            bad |= invalid
+        n_bad = int(bad.sum())
+        self.nan_count += n_bad
+        values = block[~bad] if n_bad else block.ravel()
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.min    = min(self.min, float(values.min()))
+        self.max    = max(self.max, float(values.max()))
+        idx = np.floor((values - self.lo) / self.bin_width)
+        np.clip(idx + 1, 0, self.nbins + 1, out=idx)
+        self.hist += np.bincount(idx.astype(np.intp), minlength=self.nbins + 2)
+
+    def median(self, default: float = 0.0) -> float:
+        """Approximate median of the valid samples (`default` if there are none)."""
+        if self.count == 0:
+            return default
+        cum = np.cumsum(self.hist)
+        b   = int(np.searchsorted(cum, (self.count + 1) // 2))
+        if b == 0:
+            return self.min
+        if b == self.nbins + 1:
+            return self.max
+        center = self.lo + (b - 0.5) * self.bin_width
+        return float(min(max(center, self.min), self.max))
+
+    def as_dict(self) -> dict:
+        return {
+            "min_elev":    float(self.min) if self.count else 0.0,
+            "max_elev":    float(self.max) if self.count else 0.0,
+            "median_elev": self.median(),
+            "nan_count":   self.nan_count,
+        }
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+exr_io.py
+---------
+Shared OpenEXR helpers for the heightmap writers.
+
+ScanlineWriter streams a float32 image to disk in blocks of rows, so callers
+never need the whole image (or a converted copy of it) in memory at once.
+
+The heightmap outputs of process_dem.py, combine_tiles.py and
+compose_canvas.py take the same options (add_arguments):
+
+  --exr-channels     r    elevation in R only, which Terrain3D reads
+                     rgb  the same data in R, G and B, for tools that want RGB
+  --exr-pixel-type   float  32-bit, lossless
+                     half   16-bit: half the size, but only 11 significant
+                            bits -- 0.5 m steps from 512 m, 1 m from 1024 m,
+                            2 m from 2048 m, 4 m from 4096 m. The largest
+                            rounding error is reported.
+  --exr-compression  none, rle, zips, zip (default), piz: lossless
+                     dwaa  lossy (tens of metres on terrain) and not readable
+                           by Godot's EXR importer; for previews in other tools
+
+bench/bench_exr.py measures size, write and read time of each setting.
+"""
+
+from __future__ import annotations
+
+import sys
+
+ROWS_PER_BLOCK  = 256   # rows handed to OpenEXR per writePixels() call
+CHANNELS        = {"r": "R", "rgb": "RGB"}
+PIXEL_TYPES     = ("float", "half")
+COMPRESSIONS    = ("none", "rle", "zips", "zip", "piz", "dwaa")
+DEFAULT_OPTIONS = {"channels": "R", "pixel_type": "float", "compression": "zip"}
+
+
+def import_heavy() -> None:
+    """Import numpy and OpenEXR into this module; the reader and writer do on first use."""
+    global np, OpenEXR, Imath
+    import numpy as np
+
+    try:
+        import OpenEXR
+        import Imath
+    except ImportError:
+        print("ERROR: OpenEXR not installed. Run setup.py --install first.", file=sys.stderr)
+        sys.exit(1)
+
+
+def add_arguments(parser) -> None:
+    """The --exr-channels/--exr-pixel-type/--exr-compression options of a script."""
+    parser.add_argument("--exr-channels", choices=list(CHANNELS), default="r",
+                        help="Heightmap EXR channels: R only, or the same data in R, G and B.")
+    parser.add_argument("--exr-pixel-type", choices=PIXEL_TYPES, default="float",
+                        help="32-bit float, or 16-bit half (half the size; the largest "
+                             "rounding error is reported).")
+    parser.add_argument("--exr-compression", choices=COMPRESSIONS, default="zip",
+                        help="EXR compression; dwaa is lossy (tens of metres on terrain) "
+                             "and not readable by Godot.")
+
+
+def writer_options(args) -> dict:
+    """ScanlineWriter keyword arguments from the parsed add_arguments() options."""
+    return {"channels":    CHANNELS[args.exr_channels],
+            "pixel_type":  args.exr_pixel_type,
+            "compression": args.exr_compression}
+
+
+def describe(options: dict) -> str:
+    """'R float, zip' style summary of writer options, for metadata files."""
+    return f"{options['channels']} {options['pixel_type']}, {options['compression']}"
+
+
+class ScanlineWriter:
+    """
+    Write a width x height float32 image as an EXR top to bottom, one block
+    of rows at a time. Every channel in `channels` receives the same data
+    (Terrain3D reads R). With pixel_type "half" the values are rounded to
+    16-bit floats; max_error is the largest rounding error so far.
+    """
+
+    def __init__(self, path, width: int, height: int, channels: str = "R",
+                 pixel_type: str = "float", compression: str = "zip"):
+        import_heavy()
+        self.width     = width
+        self.height    = height
+        self.channels  = channels
+        self.half      = pixel_type == "half"
+        self.max_error = 0.0
+        self.rows      = 0
+        pt     = Imath.PixelType(Imath.PixelType.HALF if self.half else Imath.PixelType.FLOAT)
+        header = OpenEXR.Header(width, height)
+        header["channels"]    = {c: Imath.Channel(pt) for c in channels}
+        header["compression"] = Imath.Compression(
+            Imath.Compression.NO_COMPRESSION if compression == "none"
+            else getattr(Imath.Compression, f"{compression.upper()}_COMPRESSION"))
+        header["lineOrder"]   = Imath.LineOrder(Imath.LineOrder.INCREASING_Y)
+        self._exr = OpenEXR.OutputFile(str(path), header)
+
+    def write(self, block: np.ndarray) -> None:
+        """Append `block` (rows x width) below the rows written so far."""
+        n, w = block.shape
+        if w != self.width or self.rows + n > self.height:
+            raise ValueError(f"block {n}x{w} does not fit at row {self.rows} "
+                             f"of a {self.width}x{self.height} EXR")
+        if self.half:
+            pixels = block.astype(np.float16)
+            error  = np.abs(pixels.astype(np.float32) - block)
+            if error.size and not np.isnan(error).all():
+                self.max_error = max(self.max_error, float(np.nanmax(error)))
+        else:
+            pixels = np.ascontiguousarray(block, dtype=np.float32)
+        data = pixels.tobytes()
+        self._exr.writePixels({c: data for c in self.channels}, n)
+        self.rows += n
+
+    def close(self) -> None:
+        if self._exr is not None:
+            self._exr.close()
+            self._exr = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ScanlineReader:
+    """Read rows of a single-channel float EXR without decoding the whole file."""
+
+    def __init__(self, path, channel: str = "R"):
+        import_heavy()
+        self._exr    = OpenEXR.InputFile(str(path))
+        dw           = self._exr.header()["dataWindow"]
+        self.width   = dw.max.x - dw.min.x + 1
+        self.height  = dw.max.y - dw.min.y + 1
+        self.channel = channel
+        self._pt     = Imath.PixelType(Imath.PixelType.FLOAT)
+
+    def read(self, y0: int, y1: int) -> np.ndarray:
+        """Rows y0 (inclusive) to y1 (exclusive) as a (y1 - y0) x width float32 array."""
+        raw = self._exr.channel(self.channel, self._pt, y0, y1 - 1)
+        return np.frombuffer(raw, dtype=np.float32).reshape(y1 - y0, self.width)
+
+    def close(self) -> None:
+        if self._exr is not None:
+            self._exr.close()
+            self._exr = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def row_blocks(height: int, rows: int = ROWS_PER_BLOCK):
+    """Yield (y0, y1) row ranges covering 0..height in blocks of `rows`."""
+    for y0 in range(0, height, rows):
+        yield y0, min(height, y0 + rows)
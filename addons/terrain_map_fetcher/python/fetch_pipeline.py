@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+fetch_pipeline.py
+-----------------
+Runs process_dem.py and process_imagery.py in one process, overlapped:
+
+  - the DEM runs on its own thread from the start;
+  - the NAIP download starts alongside it when its request does not depend
+    on the heightmap grid (see process_imagery.prefetch);
+  - the imagery fetch/warp starts as soon as the DEM has picked its output
+    grid, while the DEM tiles are still downloading and warping.
+
+Both scripts share this interpreter, so numpy/rasterio/GDAL are imported
+once, and the imagery is warped with the DEM's own CRS object. Each product
+is written and recorded in fetch_manifest.json exactly as the standalone
+scripts would. The imagery is only written once the DEM has finished: a DEM
+failure, before or after the grid is known, leaves the previous imagery
+and its manifest entry as they were, as the two-step runner did.
+With --events, both scripts' stage events go to the same file (stages.py).
+
+Usage:
+    python3 fetch_pipeline.py --dem-url-list dem_urls.txt --imagery-url-list imagery_urls.txt \
+                              --out-dir /path/to/output \
+                              --bbox MIN_LON MIN_LAT MAX_LON MAX_LAT \
+                              [--dem-args="--max-size 2048"] \
+                              [--imagery-args="--resampling bilinear"] [--no-prefetch] \
+                              [--events events.jsonl] [--profile DIR]
+"""
+
+import argparse
+import shlex
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import process_dem
+import process_imagery
+import stages
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dem-url-list",     required=True)
+    parser.add_argument("--imagery-url-list", required=True)
+    parser.add_argument("--out-dir",          required=True)
+    parser.add_argument("--bbox",             required=True, nargs=4, type=float,
+                        metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"))
+    parser.add_argument("--dem-args", default="",
+                        help='Extra process_dem.py options, e.g. --dem-args="--max-size 2048".')
+    parser.add_argument("--imagery-args", default="",
+                        help='Extra process_imagery.py options, e.g. --imagery-args="--resampling bilinear".')
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="Do not download the imagery before the DEM grid is known.")
+    stages.add_argument(parser)
+    args = parser.parse_args(argv)
+
+    out_dir  = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    bbox     = [repr(v) for v in args.bbox]
+    dem_argv = ["--url-list", args.dem_url_list, "--out-dir", args.out_dir,
+                "--bbox", *bbox, *shlex.split(args.dem_args)]
+    img_argv = ["--url-list", args.imagery_url_list, "--out-dir", args.out_dir,
+                "--bbox", *bbox, *shlex.split(args.imagery_args)]
+    dem_opts = process_dem.parse_args(dem_argv)
+    img_opts = process_imagery.parse_args(img_argv)
+
+    stdout     = sys.stdout
+    sys.stdout = _LineWriter(stdout)
+    try:
+        with stages.run("fetch_pipeline", args.events, args.profile):
+            _run_pipeline(args, out_dir, dem_argv, img_argv, dem_opts, img_opts)
+    finally:
+        sys.stdout = stdout
+
+
+def _run_pipeline(args, out_dir: Path, dem_argv: list[str], img_argv: list[str],
+                  dem_opts, img_opts) -> None:
+    t0 = time.perf_counter()
+
+    state     = {"dem_code": None, "meta": None}
+    grid_seen = threading.Event()
+
+    def on_grid(meta: dict) -> None:
+        state["meta"] = meta
+        grid_seen.set()
+
+    def run_dem() -> None:
+        try:
+            state["dem_code"] = _run(process_dem.main, dem_argv, on_grid=on_grid)
+        finally:
+            grid_seen.set()   # also on a cache hit, failure or cancel, which report no grid
+
+    def dem_ok() -> bool:
+        dem_thread.join()
+        return not state["dem_code"]
+
+    print("=== Terrain Map Fetcher: DEM + imagery pipeline ===")
+    dem_thread = threading.Thread(target=run_dem, name="dem")
+    dem_thread.start()
+
+    prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+    try:
+        prefetched = {}
+        urls = [l.strip() for l in Path(args.imagery_url_list).read_text().splitlines()
+                if l.strip()]
+        if urls and not args.no_prefetch:
+            prefetched = process_imagery.prefetch(out_dir, urls[0], tuple(args.bbox),
+                                                  dem_opts.max_size, img_opts.resolution,
+                                                  prefetcher)
+            if prefetched:
+                print("Downloading NAIP imagery alongside the DEM...")
+
+        while not grid_seen.wait(0.5):   # short waits keep Ctrl+C responsive
+            pass
+        if state["dem_code"] not in (None, 0):
+            print("\nERROR: DEM processing failed.", file=sys.stderr)
+            sys.exit(1)
+
+        if state["meta"] is not None:
+            print(f"DEM grid ready after {time.perf_counter() - t0:.1f}s -- starting imagery")
+        img_code = _run(process_imagery.main, img_argv, dem_meta=state["meta"],
+                        prefetched=prefetched, dem_ok=dem_ok)
+    finally:
+        # On an error or a cancel (stages.Cancelled) too, so the DEM thread
+        # is done before the caller goes on.
+        prefetcher.shutdown(wait=False, cancel_futures=True)
+        dem_thread.join()
+
+    if state["dem_code"]:
+        print("\nERROR: DEM processing failed.", file=sys.stderr)
+        sys.exit(1)
+    if img_code:
+        print("\nERROR: Imagery processing failed.", file=sys.stderr)
+        sys.exit(1)
+    print(f"\nPipeline complete in {time.perf_counter() - t0:.1f}s.")
+
+
+def _run(func, argv: list[str], **kwargs) -> int:
+    """Call a script's main() and return its exit status instead of exiting."""
+    try:
+        func(argv, **kwargs)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+class _LineWriter:
+    """
+    stdout that only passes on whole lines (or \\r progress updates), so the
+    two stages' output interleaves line by line instead of mid-line.
+    """
+
+    def __init__(self, stream):
+        self._stream  = stream
+        self._lock    = threading.Lock()
+        self._pending = {}   # thread id -> text after its last line break
+
+    def write(self, text: str) -> int:
+        key = threading.get_ident()
+        with self._lock:
+            buf = self._pending.pop(key, "") + text
+            cut = max(buf.rfind("\n"), buf.rfind("\r")) + 1
+            if cut:
+                self._stream.write(buf[:cut])
+            if cut < len(buf):
+                self._pending[key] = buf[cut:]
+        return len(text)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+image_encoders.py
+-----------------
+Output encoders for color maps, shared by process_imagery.py and
+compose_canvas.py:
+
+  png            lossless, zlib level --png-level (0-9; 6 is Pillow's default,
+                 1 is noticeably faster for a slightly larger file)
+  webp           lossy WebP at --webp-quality
+  webp-lossless  lossless WebP
+  dds-bc1        BC1 (DXT1) DDS with a full mip chain, 4 bits/px
+  dds-bc7        BC7 DDS (DX10 header) with a full mip chain, 8 bits/px;
+                 needs the optional etcpak package
+
+DDS files are already in a GPU texture format, so Godot uploads them
+without decoding or generating mipmaps. BC1 uses Pillow's encoder; BC7 is
+not in Pillow and is encoded with etcpak when it is installed.
+"""
+
+import io
+import struct
+from pathlib import Path
+
+FORMATS = {   # format -> file suffix
+    "png":           ".png",
+    "webp":          ".webp",
+    "webp-lossless": ".webp",
+    "dds-bc1":       ".dds",
+    "dds-bc7":       ".dds",
+}
+DEFAULT_PNG_LEVEL    = 6
+DEFAULT_WEBP_QUALITY = 90
+WEBP_METHOD          = 2     # 0 (fast) - 6 (slow); above 2 costs time for little size
+
+# DDS header constants (see Microsoft's DDS_HEADER / DDS_PIXELFORMAT docs).
+_DDSD_CAPS, _DDSD_HEIGHT, _DDSD_WIDTH    = 0x1, 0x2, 0x4
+_DDSD_PIXELFORMAT, _DDSD_MIPMAPCOUNT     = 0x1000, 0x20000
+_DDSD_LINEARSIZE                         = 0x80000
+_DDPF_FOURCC                             = 0x4
+_DDSCAPS_COMPLEX, _DDSCAPS_TEXTURE       = 0x8, 0x1000
+_DDSCAPS_MIPMAP                          = 0x400000
+_DXGI_FORMAT_BC7_UNORM                   = 98
+_D3D10_RESOURCE_DIMENSION_TEXTURE2D      = 3
+_DDS_ALPHA_MODE_OPAQUE                   = 3
+
+
+def add_arguments(parser, default: str = "png") -> None:
+    """The --image-format/--png-level/--webp-quality options of a script."""
+    parser.add_argument("--image-format", choices=list(FORMATS), default=default,
+                        help="Color map encoder.")
+    add_png_level(parser)
+    parser.add_argument("--webp-quality", type=int, default=DEFAULT_WEBP_QUALITY,
+                        help="Lossy WebP quality (0-100).")
+
+
+def add_png_level(parser) -> None:
+    """The --png-level option alone, for a script that only writes PNGs."""
+    parser.add_argument("--png-level", type=int, default=DEFAULT_PNG_LEVEL,
+                        choices=range(10), metavar="0-9",
+                        help="PNG zlib level (lower is faster, larger).")
+
+
+def suffix(fmt: str) -> str:
+    return FORMATS[fmt]
+
+
+def save(img, path: Path, fmt: str = "png",
+         png_level: int = DEFAULT_PNG_LEVEL,
+         webp_quality: int = DEFAULT_WEBP_QUALITY) -> None:
+    """Encode the RGB PIL image `img` to `path` as `fmt` (the suffix is not checked)."""
+    if fmt == "png":
+        img.save(str(path), format="PNG", compress_level=png_level)
+    elif fmt == "webp":
+        img.save(str(path), format="WEBP", quality=webp_quality, method=WEBP_METHOD)
+    elif fmt == "webp-lossless":
+        img.save(str(path), format="WEBP", lossless=True, quality=0, method=0)
+    elif fmt in ("dds-bc1", "dds-bc7"):
+        write_dds(img, path, fmt[4:])
+    else:
+        raise RuntimeError(f"Unknown image format: {fmt}")
+
+
+# -- DDS -----------------------------------------------------------------------
+
+def write_dds(img, path: Path, codec: str = "bc1") -> None:
+    """
+    Write `img` as a block-compressed DDS with every mip level down to 1x1.
+    Levels are box-filtered from the one above, floor-halved per side like
+    the GPU expects.
+    """
+    if codec == "bc1":
+        encode, block_bytes = _encode_bc1, 8
+    elif codec == "bc7":
+        encode, block_bytes = _encode_bc7, 16
+        _require_etcpak()
+    else:
+        raise RuntimeError(f"Unsupported DDS codec: {codec}")
+
+    from PIL import Image
+
+    img    = img.convert("RGB")
+    levels = [img]
+    while max(levels[-1].size) > 1:
+        w, h = levels[-1].size
+        levels.append(levels[-1].resize((max(1, w // 2), max(1, h // 2)), Image.BOX))
+
+    with open(path, "wb") as f:
+        f.write(_dds_header(img.width, img.height, len(levels), codec, block_bytes))
+        for level in levels:
+            data = encode(level)
+            if len(data) != _level_bytes(*level.size, block_bytes):
+                raise RuntimeError(f"{codec.upper()} encoder returned {len(data)} bytes "
+                                   f"for a {level.width}x{level.height} level")
+            f.write(data)
+
+
+def _level_bytes(width: int, height: int, block_bytes: int) -> int:
+    return max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * block_bytes
+
+
+def _dds_header(width: int, height: int, mip_count: int, codec: str,
+                block_bytes: int) -> bytes:
+    flags = (_DDSD_CAPS | _DDSD_HEIGHT | _DDSD_WIDTH | _DDSD_PIXELFORMAT
+             | _DDSD_MIPMAPCOUNT | _DDSD_LINEARSIZE)
+    caps  = _DDSCAPS_TEXTURE | (_DDSCAPS_COMPLEX | _DDSCAPS_MIPMAP if mip_count > 1 else 0)
+    fourcc = b"DXT1" if codec == "bc1" else b"DX10"
+    header = (b"DDS "
+              + struct.pack("<7I", 124, flags, height, width,
+                            _level_bytes(width, height, block_bytes), 0, mip_count)
+              + bytes(44)                                    # reserved
+              + struct.pack("<2I", 32, _DDPF_FOURCC) + fourcc
+              + struct.pack("<5I", 0, 0, 0, 0, 0)            # bit count and masks
+              + struct.pack("<5I", caps, 0, 0, 0, 0))
+    if fourcc == b"DX10":
+        header += struct.pack("<5I", _DXGI_FORMAT_BC7_UNORM,
+                              _D3D10_RESOURCE_DIMENSION_TEXTURE2D, 0, 1,
+                              _DDS_ALPHA_MODE_OPAQUE)
+    return header
+
+
+def _encode_bc1(level) -> bytes:
+    """BC1 blocks of one level, via Pillow's DDS writer (its header dropped)."""
+    buf = io.BytesIO()
+    level.save(buf, format="DDS", pixel_format="DXT1")
+    return buf.getvalue()[128:]
+
+
+def _encode_bc7(level) -> bytes:
+    """BC7 blocks of one level; etcpak wants RGBA padded to whole 4x4 blocks."""
+    import etcpak
+    import numpy as np
+    arr = np.asarray(level.convert("RGBA"))
+    h, w = arr.shape[:2]
+    pad_h, pad_w = -h % 4, -w % 4
+    if pad_h or pad_w:
+        arr = np.pad(arr, ((0, pad_h), (0, pad_w), (0, 0)), mode="edge")
+    return etcpak.compress_bc7(np.ascontiguousarray(arr).tobytes(), w + pad_w, h + pad_h)
+
+
+def _require_etcpak() -> None:
+    try:
+        import etcpak  # noqa: F401
+    except ImportError:
+        raise RuntimeError("dds-bc7 needs the etcpak package (pip install etcpak); "
+                           "use dds-bc1 or png instead") from None
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+output_manifest.py
+------------------
+Structured record of what process_dem.py and process_imagery.py last wrote
+into an output directory (fetch_manifest.json), so a later run with a nudged
+bbox can reuse the overlapping pixels and only fetch + warp the missing strips.
+
+Each product entry holds:
+  file        -- output file name inside the directory
+  crs         -- e.g. "EPSG:32613"
+  transform   -- affine (a, b, c, d, e, f) of the output grid
+  width/height
+  bbox_wgs84  -- requested bbox
+  params      -- settings that change pixel values (size cap, resampling...)
+  sources     -- URLs the pixels came from
+plus product-specific extras (native_res, nodata_filled, ...).
+
+Grid arithmetic here is pure Python so the scripts can plan reuse before
+touching any pixel data.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+MANIFEST_NAME = "fetch_manifest.json"
+VERSION       = 1
+
+# fetch_pipeline.py writes both products from one process; serialize the
+# read-modify-write so one entry never overwrites the other.
+_lock = threading.Lock()
+
+
+def load(out_dir: Path) -> dict:
+    """Return the manifest of `out_dir`, or {} if there is none (or it is unreadable)."""
+    try:
+        data = json.loads((Path(out_dir) / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+    return data if data.get("version") == VERSION else {}
+
+
+def save_entry(out_dir: Path, product: str, entry: dict) -> None:
+    """Replace one product's entry, writing the manifest atomically."""
+    with _lock:
+        data = load(out_dir) or {"version": VERSION}
+        data[product] = entry
+        _write(Path(out_dir), data)
+
+
+def drop_entry(out_dir: Path, product: str) -> None:
+    """Forget a product, e.g. because its file is about to be rewritten."""
+    with _lock:
+        data = load(out_dir)
+        if product in data:
+            del data[product]
+            _write(Path(out_dir), data)
+
+
+def _write(out_dir: Path, data: dict) -> None:
+    fd, name = tempfile.mkstemp(suffix=".tmp", dir=out_dir)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(name, out_dir / MANIFEST_NAME)
+
+
+def bbox_matches(a, b, tol: float = 1e-4) -> bool:
+    return a is not None and b is not None and len(a) == len(b) and \
+        all(abs(x - y) < tol for x, y in zip(a, b))
+
+
+# -- Grid overlap --------------------------------------------------------------
+
+def grid_offset(old_transform, new_transform, tol: float = 1e-3):
+    """
+    (row, col) of the old grid's origin in new-grid pixels, or None if the two
+    grids differ in resolution or are not aligned to whole pixels.
+    """
+    oa, _, oc, _, oe, of = old_transform[:6]
+    na, _, nc, _, ne, nf = new_transform[:6]
+    if abs(oa - na) > tol * abs(na) or abs(oe - ne) > tol * abs(ne):
+        return None
+    col = (oc - nc) / na
+    row = (of - nf) / ne
+    if abs(col - round(col)) > tol or abs(row - round(row)) > tol:
+        return None
+    return round(row), round(col)
+
+
+def overlap_and_strips(row_off: int, col_off: int, old_w: int, old_h: int,
+                       width: int, height: int):
+    """
+    Split a width x height grid into the rectangle covered by an old grid
+    placed at (row_off, col_off) and the strips it does not cover.
+    Rectangles are (r0, c0, r1, c1) in new-grid pixels. Returns
+    (overlap or None, [strips]); the strips never overlap each other.
+    """
+    r0, c0 = max(0, row_off), max(0, col_off)
+    r1, c1 = min(height, row_off + old_h), min(width, col_off + old_w)
+    if r1 <= r0 or c1 <= c0:
+        return None, [(0, 0, height, width)]
+    strips = []
+    if r0 > 0:
+        strips.append((0, 0, r0, width))
+    if r1 < height:
+        strips.append((r1, 0, height, width))
+    if c0 > 0:
+        strips.append((r0, 0, r1, c0))
+    if c1 < width:
+        strips.append((r0, c1, r1, width))
+    return (r0, c0, r1, c1), strips
+
+
+def rect_bounds(transform, rect) -> tuple:
+    """Georeferenced (left, bottom, right, top) of a pixel rectangle."""
+    a, _, c, _, e, f = transform[:6]
+    r0, c0, r1, c1 = rect
+    return (c + c0 * a, f + r1 * e, c + c1 * a, f + r0 * e)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+previews.py
+-----------
+Small preview images of a patch, for the library cards and the canvas:
+
+  preview.png          imagery, longer side 256 px
+  thumb.png            imagery, longer side 128 px
+  hillshade.png        shaded relief of the heightmap, 256 px
+  hillshade_thumb.png  shaded relief, 128 px
+
+Each source is decoded once, from the smallest pyramid level (pyramid.py)
+that still covers the largest preview; heightmaps without levels are
+streamed in row blocks and box-averaged on the way in. Every smaller size
+is derived from the one above with Image.reduce() plus a short lanczos fit.
+
+process_imagery.py and process_dem.py call this after writing their
+outputs. Run it on its own to create missing or stale previews of patches
+fetched before it existed.
+
+Usage:
+    python3 previews.py --project-dir /path/to/TerrainProject [--force]
+    python3 previews.py --patch-dir /path/to/patch [--force]
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import image_encoders
+import output_manifest
+import pyramid
+
+try:
+    from PIL import Image
+except ImportError:
+    print("ERROR: Pillow not installed. Run setup.py --install first.", file=sys.stderr)
+    sys.exit(1)
+
+SIZES_PX        = (256, 128)   # largest first; each is made from the previous one
+IMAGERY_NAMES   = {256: "preview.png",   128: "thumb.png"}
+HILLSHADE_NAMES = {256: "hillshade.png", 128: "hillshade_thumb.png"}
+AZIMUTH_DEG     = 315.0        # light from the north-west
+ALTITUDE_DEG    = 45.0
+Z_FACTOR        = 2.0          # previews are coarse; exaggerate the relief a little
+DEFAULT_RES_M   = 10.0         # pixel size assumed when a patch records none
+
+
+def fit(img, size: int):
+    """`img` scaled to fit size x size, aspect kept: reduce() by the whole factor, then lanczos."""
+    factor = max(img.size) // size
+    if factor > 1:
+        img = img.reduce(factor)
+    if max(img.size) > size:
+        scale = size / max(img.size)
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                         Image.LANCZOS)
+    return img
+
+
+# -- Imagery -------------------------------------------------------------------
+
+def write_imagery_previews(patch_dir: Path, img=None,
+                           png_level: int = image_encoders.DEFAULT_PNG_LEVEL) -> list[Path]:
+    """
+    Write preview.png and thumb.png. `img` is the decoded imagery when the
+    caller already has it; otherwise the cheapest pyramid level is read.
+    """
+    patch_dir = Path(patch_dir)
+    if img is None:
+        src = _imagery_path(patch_dir)
+        if src is None:
+            return []
+        with Image.open(src) as im:
+            width, height = im.size
+        path, _, _ = pyramid.pick_level(src, width, height, *_target(width, height))
+        with Image.open(path) as im:
+            im.draft("RGB", (SIZES_PX[0], SIZES_PX[0]))   # only JPEG honours this
+            img = im.convert("RGB")
+    return _write_sizes(img, patch_dir, IMAGERY_NAMES, png_level)
+
+
+# -- Heightmap -----------------------------------------------------------------
+
+def write_heightmap_previews(patch_dir: Path, res_m: float | None = None,
+                             png_level: int = image_encoders.DEFAULT_PNG_LEVEL) -> list[Path]:
+    """Write hillshade.png and hillshade_thumb.png from the patch heightmap."""
+    from exr_io import ScanlineReader
+
+    patch_dir = Path(patch_dir)
+    src = _heightmap_path(patch_dir)
+    if src is None:
+        return []
+    with ScanlineReader(src) as r:
+        width, height = r.width, r.height
+    path, _, _ = pyramid.pick_level(src, width, height, *_target(width, height))
+    elev  = _read_reduced(path, SIZES_PX[0])
+    res   = (res_m or _pixel_size(patch_dir) or DEFAULT_RES_M) * width / elev.shape[1]
+    shade = hillshade(elev, res)
+    return _write_sizes(Image.fromarray(shade, "L"), patch_dir, HILLSHADE_NAMES, png_level)
+
+
+def hillshade(elev: np.ndarray, res_m: float, azimuth: float = AZIMUTH_DEG,
+              altitude: float = ALTITUDE_DEG, z_factor: float = Z_FACTOR) -> np.ndarray:
+    """
+    Lambertian shaded relief of a north-up grid with `res_m` m pixels, as
+    uint8 (0 = facing away from the light, 255 = facing it).
+    """
+    elev = np.asarray(elev, dtype=np.float32)
+    if not np.isfinite(elev).all():
+        finite = elev[np.isfinite(elev)]
+        elev   = np.where(np.isfinite(elev), elev, finite.mean() if finite.size else 0.0)
+    if min(elev.shape) < 2:
+        return np.full(elev.shape, 255, dtype=np.uint8)
+
+    dz_dy, dz_dx = np.gradient(elev * z_factor, res_m)
+    dz_dn = -dz_dy                      # rows run southwards
+    az    = math.radians(azimuth)
+    alt   = math.radians(altitude)
+    # Unit normal (-dz/dx, -dz/dn, 1) against the light (sin az cos alt, cos az cos alt, sin alt).
+    light = (-dz_dx * math.sin(az) * math.cos(alt)
+             - dz_dn * math.cos(az) * math.cos(alt)
+             + math.sin(alt))
+    shade = light / np.sqrt(1.0 + dz_dx ** 2 + dz_dn ** 2)
+    return (np.clip(shade, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+
+def _read_reduced(path: Path, size: int) -> np.ndarray:
+    """
+    The EXR at `path`, box-averaged by the whole factor that keeps its longer
+    side at least `size`, read in row blocks so a full-size file never has
+    to fit in memory.
+    """
+    from exr_io import ROWS_PER_BLOCK, ScanlineReader
+
+    with ScanlineReader(path) as r:
+        f = max(1, max(r.width, r.height) // size)
+        if f == 1:
+            return r.read(0, r.height).copy()
+        out  = np.empty((-(-r.height // f), -(-r.width // f)), dtype=np.float32)
+        step = f * max(1, ROWS_PER_BLOCK // f)
+        for y0 in range(0, r.height, step):
+            block = _box_mean(r.read(y0, min(r.height, y0 + step)), f)
+            out[y0 // f:y0 // f + block.shape[0]] = block
+    return out
+
+
+def _box_mean(block: np.ndarray, f: int) -> np.ndarray:
+    """f x f box mean; a partial last row/column of boxes repeats the edge pixels."""
+    pad_h, pad_w = -block.shape[0] % f, -block.shape[1] % f
+    if pad_h or pad_w:
+        block = np.pad(block, ((0, pad_h), (0, pad_w)), mode="edge")
+    h, w = block.shape
+    return block.reshape(h // f, f, w // f, f).mean(axis=(1, 3), dtype=np.float32)
+
+
+def _pixel_size(patch_dir: Path) -> float | None:
+    """Heightmap pixel size in meters from the manifest, meta.json or the meta text."""
+    dem = output_manifest.load(patch_dir).get("dem")
+    if dem:
+        return abs(dem["transform"][0])
+    try:
+        res = float(json.loads((patch_dir / "meta.json").read_text()).get("resolution_m", 0))
+        if res > 0:
+            return res
+    except (OSError, ValueError):
+        pass
+    try:
+        m = re.search(r"Resolution:\s+([\d.]+)m", (patch_dir / "heightmap_000_meta.txt").read_text())
+        if m:
+            return float(m.group(1))
+    except OSError:
+        pass
+    return None
+
+
+# -- Shared --------------------------------------------------------------------
+
+def _target(width: int, height: int) -> tuple:
+    """pick_level target: the longer side must keep at least the largest preview size."""
+    return (SIZES_PX[0], 0) if width >= height else (0, SIZES_PX[0])
+
+
+def _write_sizes(img, patch_dir: Path, names: dict, png_level: int) -> list[Path]:
+    paths = []
+    for size in SIZES_PX:
+        img  = fit(img, size)
+        path = patch_dir / names[size]
+        tmp  = path.with_name(path.name + ".part")
+        img.save(str(tmp), format="PNG", compress_level=png_level)
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+def _imagery_path(patch_dir: Path) -> Path | None:
+    for name in ("imagery.png", "imagery_000.png"):
+        if (patch_dir / name).exists():
+            return patch_dir / name
+    return None
+
+
+def _heightmap_path(patch_dir: Path) -> Path | None:
+    for name in ("heightmap.exr", "heightmap_000.exr"):
+        if (patch_dir / name).exists():
+            return patch_dir / name
+    return None
+
+
+def _stale(src: Path | None, names: dict) -> bool:
+    """True if `src` exists and any of its previews is missing or older than it."""
+    if src is None:
+        return False
+    mtime = src.stat().st_mtime
+    for name in names.values():
+        p = src.parent / name
+        if not p.exists() or p.stat().st_mtime < mtime:
+            return True
+    return False
+
+
+# -- Backfill ------------------------------------------------------------------
+
+def backfill(patch_dirs: list[Path], force: bool = False,
+             png_level: int = image_encoders.DEFAULT_PNG_LEVEL) -> int:
+    """Create the missing or stale previews of each patch. Returns the files written."""
+    written = 0
+    for patch_dir in patch_dirs:
+        made = []
+        try:
+            if force or _stale(_imagery_path(patch_dir), IMAGERY_NAMES):
+                made += write_imagery_previews(patch_dir, png_level=png_level)
+            if force or _stale(_heightmap_path(patch_dir), HILLSHADE_NAMES):
+                made += write_heightmap_previews(patch_dir, png_level=png_level)
+        except Exception as e:
+            print(f"  {patch_dir.name}: ERROR: {e}", file=sys.stderr)
+            continue
+        if made:
+            print(f"  {patch_dir.name}: {', '.join(p.name for p in made)}")
+        written += len(made)
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    group  = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--project-dir", help="Every patch under <dir>/patches.")
+    group.add_argument("--patch-dir",   help="A single patch (or fetch output) directory.")
+    parser.add_argument("--force", action="store_true",
+                        help="Rewrite previews even if they are up to date.")
+    image_encoders.add_png_level(parser)
+    args = parser.parse_args()
+
+    if args.project_dir:
+        root = Path(args.project_dir) / "patches"
+        if not root.is_dir():
+            print(f"ERROR: {root} not found.", file=sys.stderr)
+            sys.exit(1)
+        patch_dirs = sorted(p for p in root.iterdir() if p.is_dir())
+    else:
+        patch_dirs = [Path(args.patch_dir)]
+
+    print(f"Checking previews of {len(patch_dirs)} patch(es)...")
+    written = backfill(patch_dirs, args.force, args.png_level)
+    print(f"Previews complete: {written} file(s) written.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,123 +2,310 @@
 """
 process_dem.py
 --------------
-Downloads USGS 3DEP GeoTIFF tiles, crops them to the requested bounding box,
-stitches them into a single seamless heightmap, and exports as a
-Terrain3D-compatible EXR (RGB 32-bit float, real meter values).
+Downloads USGS 3DEP GeoTIFF tiles, warps the part of each tile that overlaps
+the requested bounding box straight into one UTM output grid, and exports the
+result as a Terrain3D-compatible EXR (real meter values; 32-bit float in R
+unless the --exr-* options of exr_io.py say otherwise).
+
+The output grid, parameters and sources are recorded in fetch_manifest.json.
+When the bbox is nudged, pixels that overlap the previous heightmap are copied
+from it and only the missing strips are downloaded and warped.
+
+2x downsampled levels (heightmap_000_mip1.exr, ...) are written beside the
+heightmap; see pyramid.py.
 
 Usage:
     python3 process_dem.py --url-list /path/to/urls.txt \
                            --out-dir /path/to/output \
-                           --bbox MIN_LON MIN_LAT MAX_LON MAX_LAT
+                           --bbox MIN_LON MIN_LAT MAX_LON MAX_LAT \
+                           [--download-workers 4] [--workers N] [--warp-threads N] \
+                           [--max-size 4096] \
+                           [--cache-dir DIR] [--cache-max-gb 20] [--no-cache] \
+                           [--exr-channels r|rgb] [--exr-pixel-type float|half] \
+                           [--exr-compression zip] \
+                           [--events events.jsonl] [--profile DIR]
 """
 
+from __future__ import annotations
+
 import argparse
+import math
+import os
 import re
 import sys
 import tempfile
-import urllib.request
-import urllib.error
 from pathlib import Path
 
-import numpy as np
-
-try:
-    import rasterio
-    from rasterio.warp import calculate_default_transform, reproject, Resampling
-    from rasterio.crs import CRS
-    from rasterio.merge import merge as rasterio_merge
-    from rasterio.mask import mask as rasterio_mask
-    from rasterio.transform import from_bounds
-    import rasterio.transform
-    from shapely.geometry import box as shapely_box
-except ImportError:
-    print("ERROR: rasterio/shapely not installed. Run setup.py --install first.", file=sys.stderr)
-    sys.exit(1)
-
-try:
-    import OpenEXR
-    import Imath
-except ImportError:
-    print("ERROR: OpenEXR not installed. Run setup.py --install first.", file=sys.stderr)
-    sys.exit(1)
-
-CHUNK_SIZE   = 1024 * 256   # 256 KB download chunks
-MAX_PIX_SIZE = 4096         # cap output at 4096px per side
-
-
-def main() -> None:
+import exr_io
+import output_manifest
+import process_pool
+import stages
+from tile_cache import DEFAULT_MAX_GB, TileCache, default_cache_dir
+
+MAX_PIX_SIZE     = 4096     # default cap on output px per side (--max-size)
+IN_MEMORY_BYTES  = 512 * 1024 * 1024   # larger mosaics are backed by a temp file
+DOWNLOAD_WORKERS = 4        # concurrent tile downloads
+USER_AGENT       = "TerrainMapFetcher/0.1"
+WINDOW_PAD       = 2        # extra source pixels around a window for the bilinear kernel
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument("--url-list", required=True)
     parser.add_argument("--out-dir",  required=True)
     parser.add_argument("--bbox",     required=True, nargs=4, type=float,
                         metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"))
-    args = parser.parse_args()
+    parser.add_argument("--download-workers", type=int, default=DOWNLOAD_WORKERS,
+                        help="Number of tiles to download at once.")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Shared source tile cache (default: per-user cache directory).")
+    parser.add_argument("--cache-max-gb", type=float, default=DEFAULT_MAX_GB,
+                        help="Evict least-recently-used tiles above this size.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always download tiles and do not store them.")
+    parser.add_argument("--max-size", type=int, default=MAX_PIX_SIZE,
+                        help="Cap the output at this many px per side (0 = native resolution).")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Processes used to reproject tiles in parallel "
+                             "(0 = one per CPU, capped at the tile count; 1 = serial).")
+    parser.add_argument("--warp-threads", type=int, default=0,
+                        help="GDAL warper threads per tile (0 = share the CPUs among workers).")
+    exr_io.add_arguments(parser)
+    stages.add_argument(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None, on_grid=None) -> None:
+    """
+    `on_grid`, if given, is called with the output grid (size, transform,
+    CRS and bboxes) as soon as it is known, before the tiles are warped;
+    fetch_pipeline.py starts the imagery warp from it.
+    """
+    args = parse_args(argv)
+    with stages.run("process_dem", args.events, args.profile):
+        _process(args, on_grid)
 
+
+def _process(args: argparse.Namespace, on_grid) -> None:
     out_dir  = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     urls     = [l.strip() for l in Path(args.url_list).read_text().splitlines() if l.strip()]
     bbox_wgs = tuple(args.bbox)   # (min_lon, min_lat, max_lon, max_lat)
+    exr_opts = exr_io.writer_options(args)
 
-    if _is_cached(out_dir, bbox_wgs):
+    if _is_cached(out_dir, bbox_wgs, args.max_size, exr_opts):
         print("Cache hit -- bbox unchanged, skipping DEM download.")
         return
+    import_heavy()
 
     print(f"Processing {len(urls)} DEM tile(s)...")
     print(f"Requested bbox: {bbox_wgs}")
 
+    # The UTM zone only depends on the bbox, so the target grid is known before
+    # any tile arrives and each tile can be reprojected as soon as it lands.
+    utm_crs  = _detect_utm_crs(bbox_wgs)
+    bbox_utm = _wgs84_bbox_to_utm(bbox_wgs, utm_crs)
+    print(f"Target CRS: {utm_crs}")
+
+    # If the previous heightmap lies on a compatible grid, snap to it, reuse
+    # the overlap and only produce the strips it does not cover.
+    reuse   = _plan_reuse(output_manifest.load(out_dir).get("dem"), out_dir,
+                          utm_crs, bbox_utm, args.max_size, exr_opts)
+    regions = None   # pixel rectangles still to warp (None = whole grid)
+    todo    = list(range(len(urls)))
+    if reuse:
+        grid     = reuse["grid"]
+        regions  = reuse["strips"]
+        bbox_utm = output_manifest.rect_bounds(grid["transform"],
+                                               (0, 0, grid["height"], grid["width"]))
+        todo     = [i for i in todo if regions and _may_cover(urls[i], utm_crs, grid, regions)]
+        r0, c0, r1, c1 = reuse["overlap"]
+        print(f"Reusing {c1 - c0}x{r1 - r0} px from the previous heightmap; "
+              f"{len(regions)} strip(s) and {len(todo)} of {len(urls)} tile(s) left")
+    print(f"Bbox in UTM: {[f'{v:.0f}' for v in bbox_utm]}")
+
+    cache = None
+    if not args.no_cache:
+        cache = TileCache(Path(args.cache_dir) if args.cache_dir else default_cache_dir(),
+                          max_bytes=int(args.cache_max_gb * 1024**3))
+
+    cpus         = os.cpu_count() or 1
+    workers      = args.workers if args.workers > 0 else min(cpus, len(todo))
+    workers      = max(1, min(workers, len(todo)))
+    warp_threads = args.warp_threads if args.warp_threads > 0 else max(1, cpus // workers)
+    print(f"Reprojection: {workers} process(es) x {warp_threads} GDAL thread(s)")
+
     tmp_files: list[Path] = []
+    pool      = HostPool()
+    executor  = (process_pool.start(workers, [__name__, "numpy", "rasterio.warp"])
+                 if workers > 1 else None)
 
     try:
-        # -- Step 1: Download all tiles ----------------------------------------
-        downloaded: list[Path] = []
-        for i, url in enumerate(urls):
-            print(f"\n[{i+1}/{len(urls)}] Downloading: {url}")
-            tmp = Path(tempfile.mktemp(suffix=".tif"))
-            tmp_files.append(tmp)
-            _download(url, tmp)
-            print(f"  Download complete ({tmp.stat().st_size / 1024 / 1024:.1f} MB)")
-            downloaded.append(tmp)
-
-        # -- Step 2: Reproject each tile to UTM and crop to bbox ---------------
-        utm_crs   = _detect_utm_crs(downloaded[0], bbox_wgs)
-        bbox_utm  = _wgs84_bbox_to_utm(bbox_wgs, utm_crs)
-        print(f"\nTarget CRS: {utm_crs}")
-        print(f"Bbox in UTM: {[f'{v:.0f}' for v in bbox_utm]}")
-
-        cropped: list[Path] = []
-        for i, src_path in enumerate(downloaded):
-            out_path = Path(tempfile.mktemp(suffix=".tif"))
-            tmp_files.append(out_path)
-            if _reproject_and_crop(src_path, out_path, utm_crs, bbox_utm):
-                cropped.append(out_path)
-                print(f"  [{i+1}/{len(downloaded)}] Cropped OK")
+        # -- Step 1+2: Download tiles concurrently and warp each one into the -
+        # output mosaic as soon as it lands. Overlaps are resolved by URL
+        # order (first wins), independent of which download finished first.
+        print(f"\nDownloading {len(todo)} tile(s) with "
+              f"{max(1, min(args.download_workers, len(todo)))} worker(s)...")
+        download = stages.stage("download", tiles=len(todo))
+        warp     = stages.stage("warp", tiles=len(todo), regions=len(regions or [None]))
+        progress = Progress(len(todo), stage=download)
+        dl_paths = [Path(tempfile.mktemp(suffix=".tif")) for _ in urls]
+        tmp_files.extend(dl_paths)
+
+        def download_one(i: int) -> Path:
+            path    = _download(urls[i], dl_paths[i], pool=pool, progress=progress, cache=cache)
+            size_mb = path.stat().st_size / 1024 / 1024
+            progress.finish(urls[i], f"{Path(urls[i]).name} ready ({size_mb:.1f} MB)")
+            return path
+
+        mosaic  = None
+        owner   = None
+        placed  = 0
+        pending = {}   # warp future -> (tile index, downloaded path)
+        waiting = {}   # tile index -> warps still outstanding
+        hit     = set()
+        warped  = 0    # tiles with all their warps composited
+        filled  = 0    # NoData pixels the warps filled with their window's median
+
+        def setup_grid() -> None:
+            nonlocal mosaic, owner, placed
+            shape  = (grid["height"], grid["width"])
+            mosaic = _alloc_grid(shape, np.float32, np.nan, tmp_files)
+            owner  = _alloc_grid(shape, np.int16, np.iinfo(np.int16).max, tmp_files)
+            print(f"  Output grid: {grid['width']}x{grid['height']} px at "
+                  f"{grid['res_x']:.2f}m x {grid['res_y']:.2f}m")
+            stages.emit("grid", width=grid["width"], height=grid["height"],
+                        epsg=utm_crs.to_epsg())
+            if reuse:
+                with stages.stage("load_overlap") as st:
+                    _load_overlap(reuse, mosaic, owner)
+                    r0, c0, r1, c1 = reuse["overlap"]
+                    st.add(pixels=(r1 - r0) * (c1 - c0))
+                placed += 1
+            if on_grid is not None:
+                on_grid({"width":      grid["width"],
+                         "height":     grid["height"],
+                         "transform":  grid["transform"],
+                         "crs":        utm_crs,
+                         "epsg":       utm_crs.to_epsg(),
+                         "bbox_wgs84": bbox_wgs,
+                         "bbox_utm":   tuple(bbox_utm)})
+
+        def composite(i: int, src_path: Path, result: dict | None) -> None:
+            nonlocal filled, warped
+            name = Path(urls[i]).name
+            if result is not None and result["filled"]:
+                filled += result["filled"]
+                print(f"  {name}: filled {result['filled']} NoData pixels "
+                      f"with median ({result['median']:.1f}m)")
+            if result is not None and _composite(mosaic, owner, i, result):
+                hit.add(i)
+            if result is not None:
+                warp.add(pixels=result["data"].size)
+            waiting[i] -= 1
+            if waiting[i]:
+                return
+            warped += 1
+            warp.progress(warped, len(todo), "tiles")
+            if i in hit:
+                print(f"  {name}: warped into mosaic")
             else:
-                print(f"  [{i+1}/{len(downloaded)}] No overlap with bbox -- skipped")
-
-        if not cropped:
+                print(f"  {name}: no overlap with bbox -- skipped")
+            if src_path == dl_paths[i]:
+                src_path.unlink()
+
+        def drain(block: bool) -> None:
+            if not pending:
+                return
+            done, _ = wait(pending, timeout=None if block else 0,
+                           return_when=FIRST_COMPLETED)
+            for fut in done:
+                composite(*pending.pop(fut), fut.result())
+
+        if reuse:
+            setup_grid()
+        for _, i, src_path in run_concurrent(download_one, todo, args.download_workers):
+            if mosaic is None:
+                grid = _grid_for(_native_res(src_path, utm_crs, bbox_utm),
+                                 bbox_utm, args.max_size)
+                setup_grid()
+            waiting[i] = len(regions or [None])
+            for region in regions or [None]:
+                if executor is None:
+                    composite(i, src_path,
+                              _warp_window(src_path, utm_crs, grid, warp_threads, region))
+                else:
+                    fut = executor.submit(_warp_window, src_path, utm_crs, grid,
+                                          warp_threads, region)
+                    pending[fut] = (i, src_path)
+            drain(block=False)
+        download.end()
+        while pending:
+            drain(block=True)
+        warp.end()
+        placed += len(hit)
+
+        if cache:
+            print(cache.summary())
+
+        if not placed:
             print("ERROR: No tiles overlapped the requested bbox.", file=sys.stderr)
             sys.exit(1)
+        del owner
 
-        # -- Step 3: Merge cropped tiles into one mosaic -----------------------
-        print(f"\nMerging {len(cropped)} cropped tile(s)...")
-        mosaic_path = Path(tempfile.mktemp(suffix=".tif"))
-        tmp_files.append(mosaic_path)
-        _merge_tiles(cropped, mosaic_path)
-
-        # -- Step 4: Write EXR -------------------------------------------------
+        # -- Step 3: Write EXR -------------------------------------------------
+        # Written beside the old file and renamed over it, because the old
+        # file may be the source of the reused pixels until this point.
         exr_path  = out_dir / "heightmap_000.exr"
-        meta      = _write_exr(mosaic_path, exr_path)
+        exr_tmp   = out_dir / "heightmap_000.exr.part"
+        tmp_files.append(exr_tmp)
+        output_manifest.drop_entry(out_dir, "dem")
+        with stages.stage("exr_write") as st:
+            meta = _write_exr(mosaic, grid, exr_tmp, exr_opts)
+            os.replace(exr_tmp, exr_path)
+            st.add(nbytes=exr_path.stat().st_size, pixels=meta["width"] * meta["height"])
 
         print(f"\nOK Saved: {exr_path.name}")
         print(f"  Size:      {meta['width']}x{meta['height']} px")
         print(f"  Elevation: {meta['min_elev']:.1f}m - {meta['max_elev']:.1f}m")
+        if "max_error" in meta:
+            print(f"  Half:      max rounding error {meta['max_error']:.3f}m")
         print(f"  CRS:       {utm_crs}")
         print(f"  Coverage:  {meta['coverage_km_x']:.1f} x {meta['coverage_km_y']:.1f} km")
 
+        with stages.stage("pyramid") as st:
+            levels = pyramid.build_heightmap_levels(exr_path, exr_opts)
+            st.add(nbytes=sum(p.stat().st_size for p in levels))
+        if levels:
+            w, h = pyramid.level_sizes(meta["width"], meta["height"])[-1]
+            print(f"  Pyramid:   {len(levels)} level(s) down to {w}x{h} px")
+        with stages.stage("previews") as st:
+            written = previews.write_heightmap_previews(out_dir, grid["res_x"])
+            st.add(nbytes=sum(p.stat().st_size for p in written))
+        print(f"  Previews:  {', '.join(p.name for p in written)}")
+
         _write_meta(out_dir / "heightmap_000_meta.txt", meta, utm_crs, bbox_wgs, bbox_utm)
+        output_manifest.save_entry(out_dir, "dem", {
+            "file":          exr_path.name,
+            "crs":           str(utm_crs),
+            "transform":     list(grid["transform"][:6]),
+            "width":         grid["width"],
+            "height":        grid["height"],
+            "native_res":    list(grid["native_res"]),
+            "bbox_wgs84":    list(bbox_wgs),
+            "bbox_utm":      list(bbox_utm),
+            "params":        {"max_size": args.max_size, "exr": exr_opts},
+            "sources":       urls,
+            "nodata_filled": meta["nodata_filled"],
+            "window_filled": filled,
+            "levels":        len(levels),
+        })
         print("\nDEM processing complete.")
 
     finally:
+        pool.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
         for p in tmp_files:
             try:
                 if p.exists():
@@ -127,43 +314,103 @@ def main() -> None:
                 pass
 
 
+def import_heavy() -> None:
+    """
+    Import numpy, rasterio/GDAL, OpenEXR and the modules built on them into
+    this module. They are most of the start-up time, so main() only calls
+    this once the cache check has found work to do; the reprojection
+    workers call it from _warp_window.
+    """
+    global np, rasterio, calculate_default_transform, reproject, transform_bounds, Resampling
+    global CRS, Affine, Window, window_from_bounds, window_bounds, window_transform
+    global HostPool, Progress, fetch, head, run_concurrent, ElevationStats
+    global ScanlineReader, ScanlineWriter, row_blocks, previews, pyramid
+    global FIRST_COMPLETED, wait
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    import numpy as np
+
+    from downloader import HostPool, Progress, fetch, head, run_concurrent
+    from elevation_stats import ElevationStats
+    from exr_io import ScanlineReader, ScanlineWriter, row_blocks
+    import previews
+    import pyramid
+
+    try:
+        import rasterio
+        from rasterio.warp import calculate_default_transform, reproject, transform_bounds, Resampling
+        from rasterio.crs import CRS
+        from rasterio.transform import Affine
+        from rasterio.windows import Window, from_bounds as window_from_bounds
+        from rasterio.windows import bounds as window_bounds, transform as window_transform
+    except ImportError:
+        print("ERROR: rasterio not installed. Run setup.py --install first.", file=sys.stderr)
+        sys.exit(1)
+
+
 # -- Cache check ---------------------------------------------------------------
 
-def _is_cached(out_dir: Path, bbox_wgs: tuple) -> bool:
-    """Return True if existing outputs were produced from the same bbox."""
+def _is_cached(out_dir: Path, bbox_wgs: tuple, max_size: int, exr_opts: dict) -> bool:
+    """Return True if existing outputs were produced from the same bbox and options."""
     exr  = out_dir / "heightmap_000.exr"
     meta = out_dir / "heightmap_000_meta.txt"
     if not exr.exists() or not meta.exists():
         return False
+    entry = output_manifest.load(out_dir).get("dem")
+    if entry:
+        params = entry.get("params", {})
+        return (output_manifest.bbox_matches(entry.get("bbox_wgs84"), bbox_wgs)
+                and params.get("max_size") == max_size
+                and params.get("exr", exr_io.DEFAULT_OPTIONS) == exr_opts)
     for line in meta.read_text().splitlines():
         m = re.match(r"Bbox \(WGS84\):\s+\(([^)]+)\)", line)
         if m:
             stored = tuple(float(x) for x in m.group(1).split(","))
-            return all(abs(a - b) < 1e-4 for a, b in zip(stored, bbox_wgs))
+            return (all(abs(a - b) < 1e-4 for a, b in zip(stored, bbox_wgs))
+                    and exr_opts == exr_io.DEFAULT_OPTIONS)
     return False
 
 
 # -- Download ------------------------------------------------------------------
 
-def _download(url: str, dest: Path) -> None:
-    req = urllib.request.Request(url, headers={"User-Agent": "TerrainMapFetcher/0.1"})
+def _download(url: str, dest: Path, pool: HostPool | None = None,
+              progress: Progress | None = None, cache: TileCache | None = None) -> Path:
+    """
+    Fetch `url` and return the path to read it from: a cache blob when a
+    cache is given (hit or freshly stored), otherwise `dest`.
+    The cache key includes the server's ETag/Last-Modified, so a re-published
+    tile is downloaded again instead of served stale.
+    """
+    headers = {"User-Agent": USER_AGENT}
+    if cache is None:
+        fetch(url, dest, headers=headers, pool=pool, progress=progress)
+        return dest
+
     try:
-        with urllib.request.urlopen(req, timeout=300) as r:
-            total = int(r.headers.get("Content-Length", 0))
-            done  = 0
-            with open(dest, "wb") as f:
-                while chunk := r.read(CHUNK_SIZE):
-                    f.write(chunk)
-                    done += len(chunk)
-                    if total:
-                        print(f"  {done/total*100:.0f}%", end="\r", flush=True)
-    except urllib.error.URLError as e:
-        raise RuntimeError(f"Download failed: {e.reason}") from e
+        h        = head(url, headers=headers, pool=pool)
+        key      = cache.key_for(url, h.get("etag", ""), h.get("last-modified", ""))
+        if_range = h.get("etag") or h.get("last-modified")
+    except RuntimeError:
+        # HEAD failed (offline or unsupported) -- trust the last stored version.
+        key      = cache.last_key(url) or cache.key_for(url)
+        if_range = None
+
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+
+    # Partial files are kept on failure, so a re-run resumes where this one stopped.
+    part = cache.partial(key)
+    try:
+        fetch(url, part, headers=headers, pool=pool, progress=progress, if_range=if_range)
+        return cache.put(key, url, part)
+    finally:
+        cache.release(key, part)
 
 
 # -- CRS helpers ---------------------------------------------------------------
 
-def _detect_utm_crs(src_path: Path, bbox_wgs: tuple) -> CRS:
+def _detect_utm_crs(bbox_wgs: tuple) -> CRS:
     """Pick UTM zone from the center of the requested bbox."""
     center_lon = (bbox_wgs[0] + bbox_wgs[2]) / 2.0
     center_lat = (bbox_wgs[1] + bbox_wgs[3]) / 2.0
@@ -183,152 +430,328 @@ def _wgs84_bbox_to_utm(bbox_wgs: tuple, utm_crs: CRS) -> tuple:
     return (min(xs), min(ys), max(xs), max(ys))
 
 
-# -- Reproject + crop ----------------------------------------------------------
+# -- Output grid ---------------------------------------------------------------
 
-def _reproject_and_crop(src_path: Path, dst_path: Path,
-                        utm_crs: CRS, bbox_utm: tuple) -> bool:
+def _native_res(src_path: Path, utm_crs: CRS, bbox_utm: tuple) -> tuple:
     """
-    Reproject tile to UTM, fill NoData, then crop to bbox_utm.
-    Returns False if the tile has no overlap with bbox_utm.
+    The source's native pixel size in UTM meters over bbox_utm. It only
+    depends on the source CRS and pixel size, which all tiles of a 3DEP
+    product share, so it does not matter which tile arrives first.
     """
     with rasterio.open(src_path) as src:
-        transform, width, height = calculate_default_transform(
-            src.crs, utm_crs, src.width, src.height, *src.bounds)
-
-        profile = src.profile.copy()
-        profile.update(crs=utm_crs, transform=transform,
-                       width=width, height=height,
-                       driver="GTiff", dtype="float32", count=1,
-                       nodata=np.nan)
-
-        reproj_tmp = Path(tempfile.mktemp(suffix=".tif"))
-        try:
-            with rasterio.open(reproj_tmp, "w", **profile) as dst:
-                data = np.empty((height, width), dtype=np.float32)
-                reproject(
-                    source=rasterio.band(src, 1),
-                    destination=data,
-                    src_transform=src.transform,
-                    src_crs=src.crs,
-                    dst_transform=transform,
-                    dst_crs=utm_crs,
-                    resampling=Resampling.bilinear,
-                )
-                # Fill nodata with median to avoid edge cliffs.
-                # NOTE: np.isnan() is required -- (data == np.nan) is always False
-                # in IEEE 754, so NaN pixels would silently survive without it.
-                nodata_val = src.nodata if src.nodata is not None else -9999
-                mask = np.isnan(data) | (data == nodata_val) | (data < -1000)
-                if mask.any():
-                    median = float(np.median(data[~mask])) if (~mask).any() else 0.0
-                    data[mask] = median
-                    print(f"  Filled {mask.sum()} NoData pixels with median ({median:.1f}m)")
-                dst.write(data, 1)
-
-            # Now crop to bbox.
-            with rasterio.open(reproj_tmp) as reproj:
-                # Check overlap.
-                tile_bounds = reproj.bounds
-                if (bbox_utm[2] < tile_bounds.left  or bbox_utm[0] > tile_bounds.right or
-                    bbox_utm[3] < tile_bounds.bottom or bbox_utm[1] > tile_bounds.top):
-                    return False
-
-                crop_shape = [shapely_box(*bbox_utm).__geo_interface__]
-                cropped_data, cropped_transform = rasterio_mask(
-                    reproj, crop_shape, crop=True, filled=True, nodata=np.nan)
-
-                crop_profile = reproj.profile.copy()
-                crop_profile.update(
-                    transform=cropped_transform,
-                    width=cropped_data.shape[2],
-                    height=cropped_data.shape[1])
-
-                with rasterio.open(dst_path, "w", **crop_profile) as out:
-                    out.write(cropped_data)
-            return True
-        finally:
-            if reproj_tmp.exists():
-                reproj_tmp.unlink()
+        left, bottom, right, top = transform_bounds(utm_crs, src.crs, *bbox_utm, densify_pts=21)
+        src_w = max(1, round((right - left) / src.res[0]))
+        src_h = max(1, round((top - bottom) / src.res[1]))
+        native, _, _ = calculate_default_transform(
+            src.crs, utm_crs, src_w, src_h, left, bottom, right, top)
+    return abs(native.a), abs(native.e)
 
 
-# -- Merge ---------------------------------------------------------------------
+def _grid_for(native_res: tuple, bbox_utm: tuple, max_pix: int) -> dict:
+    """
+    The final heightmap grid: bbox_utm at the native resolution, coarsened
+    proportionally if either side exceeds max_pix (0 = never coarsen). Every
+    tile is warped straight onto this grid, so no second resampling pass is
+    needed.
+    """
+    span_x = bbox_utm[2] - bbox_utm[0]
+    span_y = bbox_utm[3] - bbox_utm[1]
+    width  = max(1, round(span_x / native_res[0]))
+    height = max(1, round(span_y / native_res[1]))
+
+    # Keep aspect ratio so vertex_spacing stays square (equal X and Y).
+    if max_pix > 0 and (width > max_pix or height > max_pix):
+        scale  = max_pix / max(width, height)
+        width  = max(1, int(width  * scale))
+        height = max(1, int(height * scale))
+
+    res_x = span_x / width
+    res_y = span_y / height
+    return {
+        "transform":  Affine(res_x, 0.0, bbox_utm[0], 0.0, -res_y, bbox_utm[3]),
+        "width":      width,
+        "height":     height,
+        "res_x":      res_x,
+        "res_y":      res_y,
+        "native_res": tuple(native_res),
+    }
 
-def _merge_tiles(tile_paths: list[Path], out_path: Path) -> None:
-    datasets = [rasterio.open(p) for p in tile_paths]
-    try:
-        mosaic, transform = rasterio_merge(datasets, method="first")
-        profile = datasets[0].profile.copy()
-        profile.update(transform=transform,
-                       width=mosaic.shape[2],
-                       height=mosaic.shape[1])
-        with rasterio.open(out_path, "w", **profile) as dst:
-            dst.write(mosaic)
-    finally:
-        for ds in datasets:
-            ds.close()
 
+# -- Reuse of a previous heightmap ---------------------------------------------
 
-# -- EXR export ----------------------------------------------------------------
+def _plan_reuse(prev: dict | None, out_dir: Path, utm_crs: CRS, bbox_utm: tuple,
+                max_pix: int, exr_opts: dict) -> dict | None:
+    """
+    Decide whether the heightmap described by the manifest entry `prev` can
+    supply part of the new one. It can if it has the same CRS and size cap,
+    filled no NoData at all (a tile's fill is the median of its warp window
+    and the residual one the median of the whole extent, so both change when
+    the bbox moves), stored its pixels losslessly (not dwaa) and either
+    exactly (float) or rounded the same way the new one will (half), and the
+    new bbox would get (within 1%) the same pixel size.
+    The new grid then keeps that pixel size exactly and its origin is snapped
+    to the old grid, so overlapping pixels are identical and can be copied.
+    NoData in the new strips is filled with the median of the strip rather
+    than of the whole window a fresh run would warp; such a run records its
+    fill, so the next one does not reuse it.
+
+    Returns {"grid", "overlap", "strips", "offset", "exr"} or None.
+    """
+    if not prev or prev.get("crs") != str(utm_crs):
+        return None
+    if prev.get("nodata_filled", 1) or prev.get("window_filled", 1):
+        return None
+    if prev.get("params", {}).get("max_size") != max_pix:
+        return None
+    prev_exr = prev.get("params", {}).get("exr", exr_io.DEFAULT_OPTIONS)
+    if prev_exr["compression"] == "dwaa" or (
+            prev_exr["pixel_type"] == "half" and exr_opts["pixel_type"] != "half"):
+        return None
+    exr = out_dir / prev.get("file", "")
+    if not exr.is_file():
+        return None
+
+    old   = Affine(*prev["transform"])
+    fresh = _grid_for(prev["native_res"], bbox_utm, max_pix)
+    res_x, res_y = old.a, -old.e
+    if abs(fresh["res_x"] - res_x) > 0.01 * res_x or abs(fresh["res_y"] - res_y) > 0.01 * res_y:
+        return None
+
+    left   = old.c + round((bbox_utm[0] - old.c) / res_x) * res_x
+    top    = old.f - round((old.f - bbox_utm[3]) / res_y) * res_y
+    width  = max(1, round((bbox_utm[2] - left) / res_x))
+    height = max(1, round((top - bbox_utm[1]) / res_y))
+    if max_pix > 0 and max(width, height) > max_pix:
+        return None
+    grid = {
+        "transform":  Affine(res_x, 0.0, left, 0.0, -res_y, top),
+        "width":      width,
+        "height":     height,
+        "res_x":      res_x,
+        "res_y":      res_y,
+        "native_res": tuple(prev["native_res"]),
+    }
+
+    offset = output_manifest.grid_offset(old, grid["transform"])
+    if offset is None:
+        return None
+    overlap, strips = output_manifest.overlap_and_strips(
+        *offset, prev["width"], prev["height"], width, height)
+    if overlap is None:
+        return None
+    return {"grid": grid, "overlap": overlap, "strips": strips, "offset": offset, "exr": exr}
+
+
+def _load_overlap(reuse: dict, mosaic: np.ndarray, owner: np.ndarray) -> None:
+    """Copy the reused rectangle out of the previous EXR, a block of rows at a time."""
+    r0, c0, r1, c1 = reuse["overlap"]
+    ro, co         = reuse["offset"]
+    with ScanlineReader(reuse["exr"]) as old:
+        for y0, y1 in row_blocks(r1 - r0):
+            rows = old.read(r0 - ro + y0, r0 - ro + y1)
+            mosaic[r0 + y0:r0 + y1, c0:c1] = rows[:, c0 - co:c1 - co]
+    owner[r0:r1, c0:c1] = -1   # ahead of every tile
+
+
+def _may_cover(url: str, utm_crs: CRS, grid: dict, regions: list) -> bool:
+    """
+    False only if the URL is a 3DEP 1x1 degree tile (named like n39w106) that
+    misses every region; tiles whose extent is unknown are always fetched.
+    """
+    m = re.search(r"(?<![a-z])([ns])(\d{1,2})([ew])(\d{1,3})(?![0-9])", Path(url).name.lower())
+    if not m:
+        return True
+    north = int(m.group(2)) * (1 if m.group(1) == "n" else -1)
+    west  = int(m.group(4)) * (1 if m.group(3) == "e" else -1)
+    for region in regions:
+        left, bottom, right, top = transform_bounds(
+            utm_crs, "EPSG:4326",
+            *output_manifest.rect_bounds(grid["transform"], region), densify_pts=21)
+        if left < west + 1.01 and right > west - 0.01 and \
+                bottom < north + 0.01 and top > north - 1.01:
+            return True
+    return False
+
+
+def _alloc_grid(shape: tuple, dtype, fill, tmp_files: list[Path]) -> np.ndarray:
+    """
+    Array for a full output grid, pre-filled with `fill`. Grids above
+    IN_MEMORY_BYTES are backed by a temp file (np.memmap), so a 16k-32k px
+    mosaic is paged by the OS instead of held in RAM.
+    """
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if nbytes <= IN_MEMORY_BYTES:
+        return np.full(shape, fill, dtype=dtype)
+    fd, name = tempfile.mkstemp(suffix=".grid")
+    os.close(fd)
+    path = Path(name)
+    tmp_files.append(path)
+    arr = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+    for y0, y1 in row_blocks(shape[0]):
+        arr[y0:y1] = fill
+    return arr
+
+
+# -- Warp ----------------------------------------------------------------------
+
+def _warp_window(src_path: Path, utm_crs: CRS, grid: dict, num_threads: int = 1,
+                 region: tuple | None = None) -> dict | None:
+    """
+    Warp the part of one source tile that overlaps the output grid (or just
+    its `region`, a (row0, col0, row1, col1) pixel rectangle). Only the
+    overlapping source window is read and only the matching destination
+    window is warped, using `num_threads` GDAL warper threads.
+
+    Runs in a worker process in parallel mode, so it takes and returns only
+    picklable values. Returns {"row", "col", "data", "filled", "median"} with
+    `data` the warped destination window (NaN where the tile has no data), or
+    None if the tile has no overlap.
+    """
+    import_heavy()
+    r0, c0, r1, c1 = region or (0, 0, grid["height"], grid["width"])
+    dst_transform  = grid["transform"] * Affine.translation(c0, r0)
+    grid_bounds    = output_manifest.rect_bounds(grid["transform"], (r0, c0, r1, c1))
 
-def _write_exr(src_path: Path, exr_path: Path) -> dict:
     with rasterio.open(src_path) as src:
-        native_h, native_w = src.height, src.width
-
-        # Proportional scale if native dimensions exceed the 4096 cap.
-        # Keep aspect ratio so vertex_spacing stays square (equal X and Y).
-        if native_w > MAX_PIX_SIZE or native_h > MAX_PIX_SIZE:
-            scale = MAX_PIX_SIZE / max(native_w, native_h)
-            target_w = int(native_w * scale)
-            target_h = int(native_h * scale)
-        else:
-            target_w, target_h = native_w, native_h
-
-        # Single read+resample -- rasterio bilinear-interpolates all real data to
-        # fill the target dimensions. No padding, no flat shelf.
-        data = src.read(
-            1,
-            out_shape=(target_h, target_w),
-            resampling=Resampling.bilinear,
-        ).astype(np.float32)
-        h, w = target_h, target_w
-
-        # Safety net: fill any NaN that survived the per-tile fill or the merge.
-        nan_count = int(np.isnan(data).sum())
-        if nan_count > 0:
-            median = float(np.nanmedian(data))
-            data = np.where(np.isnan(data), median, data)
-            print(f"  Filled {nan_count} residual NaN pixels with median ({median:.1f}m)")
-
-        # Compute elevation stats.
-        min_elev = float(np.nanmin(data))
-        max_elev = float(np.nanmax(data))
-
-        # Resolution in meters per pixel (from the original, un-resampled transform).
-        transform = src.transform
-        res_x = abs(transform.a)
-        res_y = abs(transform.e)
-
-        coverage_km_x = w * res_x / 1000
-        coverage_km_y = h * res_y / 1000
-
-    # Write single-channel float EXR (R = elevation in real meters).
-    # Terrain3D's load_image reads the R channel for heightmaps.
-    header  = OpenEXR.Header(w, h)
-    channel = Imath.Channel(Imath.PixelType(Imath.PixelType.FLOAT))
-    header["channels"] = {"R": channel}
-    exr = OpenEXR.OutputFile(str(exr_path), header)
-    exr.writePixels({"R": data.tobytes()})
-    exr.close()
+        src_bounds = transform_bounds(utm_crs, src.crs, *grid_bounds, densify_pts=21)
+        src_win = _clip_window(window_from_bounds(*src_bounds, transform=src.transform),
+                               src.width, src.height, WINDOW_PAD)
+        if src_win is None:
+            return None
+
+        data = src.read(1, window=src_win).astype(np.float32, copy=False)
+        src_transform     = src.transform
+        src_win_transform = window_transform(src_win, src_transform)
+        src_crs           = src.crs
+
+        # Fill nodata with median to avoid edge cliffs.
+        # NOTE: np.isnan() is required -- (data == np.nan) is always False
+        # in IEEE 754, so NaN pixels would silently survive without it.
+        nodata_val = src.nodata if src.nodata is not None else -9999
+        filled, median = _fill_nodata(data, nodata_val)
+
+    # Destination window covered by the source window.
+    covered = transform_bounds(src_crs, utm_crs, *window_bounds(src_win, src_transform),
+                               densify_pts=21)
+    dst_win = _clip_window(window_from_bounds(*covered, transform=dst_transform),
+                           c1 - c0, r1 - r0, 1)
+    if dst_win is None:
+        return None
+
+    scratch = np.full((int(dst_win.height), int(dst_win.width)), np.nan, dtype=np.float32)
+    reproject(
+        source=data,
+        destination=scratch,
+        src_transform=src_win_transform,
+        src_crs=src_crs,
+        dst_transform=window_transform(dst_win, dst_transform),
+        dst_crs=utm_crs,
+        dst_nodata=np.nan,
+        resampling=Resampling.bilinear,
+        num_threads=max(1, num_threads),
+    )
+    return {"row": r0 + int(dst_win.row_off), "col": c0 + int(dst_win.col_off),
+            "data": scratch, "filled": filled, "median": median}
+
+
+def _composite(mosaic: np.ndarray, owner: np.ndarray, index: int, result: dict) -> bool:
+    """
+    Copy a warped window into `mosaic`. A pixel is written if no tile with a
+    lower index has claimed it (rasterio merge method="first" in URL order),
+    tracked in `owner`, so the result does not depend on completion order.
+    Returns False if the window holds no data.
+    """
+    data   = result["data"]
+    r0, c0 = result["row"], result["col"]
+    r1, c1 = r0 + data.shape[0], c0 + data.shape[1]
+    take   = ~np.isnan(data)
+    if not take.any():
+        return False
+    own  = owner[r0:r1, c0:c1]
+    take &= own > index
+    mosaic[r0:r1, c0:c1][take] = data[take]
+    own[take] = index
+    return True
+
 
+def _fill_nodata(data: np.ndarray, nodata_val: float) -> tuple[int, float]:
+    """
+    Replace NaN, `nodata_val` and < -1000 m pixels in place with the median of
+    the valid ones. Works in row blocks: one pass for the statistics, one for
+    the fill, no full-size mask. Returns (pixels filled, median used).
+    """
+    stats = ElevationStats()
+    for y0, y1 in row_blocks(data.shape[0]):
+        block = data[y0:y1]
+        stats.add(block, invalid=(block == nodata_val) | (block < -1000))
+    if stats.nan_count == 0:
+        return 0, 0.0
+    median = stats.median(default=0.0)
+    for y0, y1 in row_blocks(data.shape[0]):
+        block = data[y0:y1]
+        np.copyto(block, median, where=np.isnan(block) | (block == nodata_val) | (block < -1000))
+    return stats.nan_count, median
+
+
+def _clip_window(win: Window, width: int, height: int, pad: int) -> Window | None:
+    """Round `win` outwards, grow it by `pad` px and clip it to the raster. None if empty."""
+    c0 = max(0,      math.floor(win.col_off) - pad)
+    r0 = max(0,      math.floor(win.row_off) - pad)
+    c1 = min(width,  math.ceil(win.col_off + win.width)  + pad)
+    r1 = min(height, math.ceil(win.row_off + win.height) + pad)
+    if c1 <= c0 or r1 <= r0:
+        return None
+    return Window(c0, r0, c1 - c0, r1 - r0)
+
+
+# -- EXR export ----------------------------------------------------------------
+
+def _write_exr(data: np.ndarray, grid: dict, exr_path: Path, exr_opts: dict) -> dict:
+    """
+    Stream the mosaic to an EXR (see exr_io.writer_options) in row blocks.
+    One ElevationStats pass yields NaN count, min, max and the fill median;
+    the second pass fills residual NaNs and writes, one block at a time.
+    """
+    h, w = data.shape
+
+    stats = ElevationStats()
+    for y0, y1 in row_blocks(h):
+        stats.add(data[y0:y1])
+
+    # Safety net: fill any NaN the tiles did not cover (e.g. bbox edges
+    # beyond the downloaded tiles, or gaps between them).
+    median = stats.median(default=0.0)
+    if stats.nan_count > 0:
+        print(f"  Filled {stats.nan_count} residual NaN pixels with median ({median:.1f}m)")
+
+    # R = elevation in real meters; Terrain3D's load_image reads the R
+    # channel for heightmaps.
+    with ScanlineWriter(exr_path, w, h, **exr_opts) as exr:
+        for y0, y1 in row_blocks(h):
+            block = data[y0:y1]
+            if stats.nan_count:
+                block = np.array(block, dtype=np.float32)
+                np.copyto(block, median, where=np.isnan(block))
+            exr.write(block)
+
+    # The fill value lies between min and max, so filling does not move them.
+    summary = stats.as_dict()
+    res_x   = grid["res_x"]
+    res_y   = grid["res_y"]
+    extra   = {"max_error": exr.max_error} if exr.half else {}
     return {
+        "exr":          exr_opts,
         "width":        w,
         "height":       h,
-        "min_elev":     min_elev,
-        "max_elev":     max_elev,
+        "min_elev":     summary["min_elev"] if stats.count else median,
+        "max_elev":     summary["max_elev"] if stats.count else median,
+        "median_elev":  median,
+        "nodata_filled": stats.nan_count,
         "res_x":        res_x,
         "res_y":        res_y,
-        "coverage_km_x": coverage_km_x,
-        "coverage_km_y": coverage_km_y,
+        "coverage_km_x": w * res_x / 1000,
+        "coverage_km_y": h * res_y / 1000,
+        **extra,
     }
 
 
@@ -339,10 +762,14 @@ def _write_meta(path: Path, meta: dict, crs: CRS, bbox_wgs: tuple, bbox_utm: tup
         "Terrain Map Fetcher -- Heightmap Metadata",
         "=" * 40,
         f"Output file:   heightmap_000.exr",
+        f"EXR pixels:    {exr_io.describe(meta['exr'])}"
+        + (f" (max rounding error {meta['max_error']:.3f}m)" if "max_error" in meta else ""),
         f"Size:          {meta['width']} x {meta['height']} px",
         f"Resolution:    {meta['res_x']:.1f}m x {meta['res_y']:.1f}m per pixel",
         f"Coverage:      {meta['coverage_km_x']:.2f} x {meta['coverage_km_y']:.2f} km",
         f"Elevation:     {meta['min_elev']:.1f}m - {meta['max_elev']:.1f}m",
+        f"Median elev:   {meta['median_elev']:.1f}m",
+        f"NoData filled: {meta['nodata_filled']} px",
         f"CRS:           {crs}",
         f"Bbox (WGS84):  {bbox_wgs}",
         f"Bbox (UTM):    {bbox_utm[0]:.1f} {bbox_utm[1]:.1f} {bbox_utm[2]:.1f} {bbox_utm[3]:.1f}",
@@ -9,50 +9,105 @@ Use this PNG as the `color_file_name` in the Terrain3D Importer (importer.tscn),
 NOT as a texture in the Asset Dock. The importer splits it into per-region
 color maps that are geographically aligned with the heightmap.
 
+When the heightmap was rebuilt on a grid aligned with the previous imagery
+(see fetch_manifest.json), the overlap is copied from the old PNG and only
+the missing strips are requested from exportImage.
+
+2x downsampled levels (imagery_000_mip1.png, ...) are written beside the PNG
+(see pyramid.py), along with preview.png and thumb.png (see previews.py).
+
+The output follows the heightmap's pixel size (or --resolution). When that
+needs more pixels than the URL's size=, the bbox is split into a grid of
+exportImage sub-requests of at most --tile-px per side, fetched --workers at
+a time (each retried on its own) and mosaicked before the reprojection.
+
+The downloaded WGS84 raster is reprojected onto the UTM grid in a single
+multi-threaded GDAL warp of all three bands, without an intermediate resize.
+--resampling bilinear/cubic trades the default lanczos kernel for speed.
+
 Usage:
-    python3 process_imagery.py --url-list /path/to/urls.txt --out-dir /path/to/output
+    python3 process_imagery.py --url-list /path/to/urls.txt --out-dir /path/to/output \
+                               [--resolution 0] [--workers 4] [--tile-px 4096] \
+                               [--resampling lanczos] [--warp-threads 0] [--png-level 6] \
+                               [--events events.jsonl] [--profile DIR]
 """
 
+from __future__ import annotations
+
 import argparse
+import math
+import os
 import re
 import sys
-import urllib.request
-import urllib.error
+import tempfile
 from pathlib import Path
 from io import BytesIO
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-try:
-    from PIL import Image
-    import numpy as np
-except ImportError:
-    print("ERROR: Pillow/numpy not installed. Run setup.py --install first.", file=sys.stderr)
-    sys.exit(1)
-
-try:
-    import rasterio
-    from rasterio.transform import from_bounds
-    from rasterio.warp import reproject, Resampling
-    from rasterio.crs import CRS
-except ImportError:
-    print("ERROR: rasterio not installed. Run setup.py --install first.", file=sys.stderr)
-    sys.exit(1)
+import image_encoders
+from image_encoders import DEFAULT_PNG_LEVEL
+import output_manifest
+import stages
 
-MAX_SIZE = 4096
+MAX_SIZE         = 4096     # cap on an image that is not reprojected (no heightmap)
+TILE_PX          = 4096     # largest exportImage sub-request per side
+IMAGERY_WORKERS  = 4        # concurrent sub-requests
+DECODE_ATTEMPTS  = 2        # a sub-tile that does not decode is fetched again
+IN_MEMORY_BYTES  = 512 * 1024 * 1024   # larger source mosaics are backed by a temp file
+M_PER_DEG_LAT    = 110574.0
+M_PER_DEG_LON_EQ = 111320.0
+SOURCE_SLACK     = 1.02     # tile only when the URL's size= is short by more than this
+RESAMPLING       = ("lanczos", "cubic", "bilinear")
 
 
-def main() -> None:
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument("--url-list", required=True)
     parser.add_argument("--out-dir",  required=True)
     parser.add_argument("--bbox", required=False, nargs=4, type=float,
                         metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"))
-    args = parser.parse_args()
+    parser.add_argument("--resolution", type=float, default=0.0,
+                        help="Output ground resolution in m/px (0 = the heightmap's pixel size).")
+    parser.add_argument("--workers", type=int, default=IMAGERY_WORKERS,
+                        help="Number of exportImage sub-requests to fetch at once.")
+    parser.add_argument("--tile-px", type=int, default=TILE_PX,
+                        help="Largest sub-request per side, in px.")
+    parser.add_argument("--resampling", choices=RESAMPLING, default="lanczos",
+                        help="Warp kernel; bilinear or cubic are faster, e.g. for previews.")
+    parser.add_argument("--warp-threads", type=int, default=0,
+                        help="GDAL warper threads (0 = one per CPU).")
+    image_encoders.add_png_level(parser)   # patch imagery is always PNG
+    stages.add_argument(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None, dem_meta: dict | None = None,
+         prefetched: dict | None = None, dem_ok=None) -> None:
+    """
+    `dem_meta` is the heightmap grid when the caller already has it (see
+    process_dem.main's on_grid); otherwise it is read from the output dir.
+    `prefetched` maps URLs to futures of their downloaded bytes. `dem_ok()`,
+    if given, is called once the image is built and before anything is
+    written: it waits for the heightmap still being made and returns whether
+    it succeeded; if not, the run fails and leaves the outputs alone.
+    """
+    args = parse_args(argv)
+    with stages.run("process_imagery", args.events, args.profile):
+        _process(args, dem_meta, prefetched, dem_ok)
+
+
+def _process(args: argparse.Namespace, dem_meta: dict | None, prefetched: dict | None,
+             dem_ok=None) -> None:
+    warp_threads = args.warp_threads if args.warp_threads > 0 else (os.cpu_count() or 1)
 
     url_list_path = Path(args.url_list)
     out_dir       = Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    if args.bbox and _is_cached(out_dir, tuple(args.bbox)):
+    meta = dem_meta if dem_meta is not None else _parse_dem_meta(out_dir)
+    grid = _output_grid(meta, args.resolution) if meta else None
+
+    if args.bbox and _is_cached(out_dir, tuple(args.bbox), grid, args.resampling):
         print("Cache hit -- bbox unchanged, skipping imagery download.")
         sys.exit(0)
 
@@ -61,13 +116,54 @@ def main() -> None:
         print("No imagery URLs -- skipping.")
         sys.exit(0)
 
-    url = urls[0]
+    import_heavy()
+    if grid:
+        # The cache check above works on plain tuples; the warp needs rasterio's.
+        grid["transform"] = Affine(*grid["transform"][:6])
+        grid.setdefault("crs", CRS.from_epsg(grid["epsg"]))
+
+    url    = urls[0]
+    source = _source_grid(url, grid["res"] if grid else args.resolution)
+    reuse  = _plan_reuse(out_dir, url, grid, source, args.resampling) \
+        if grid and source else None
+    if reuse:
+        try:
+            img, sources = _patch_strips(reuse, url, grid, args.tile_px, args.workers,
+                                         args.resampling, warp_threads)
+        except Exception as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+        _save_outputs(out_dir, img, url, grid, sources, args.resampling,
+                      args.png_level, dem_ok)
+        return
+
+    if source and source["tiled"]:
+        tmp_files = []
+        try:
+            arr, sources = _fetch_tiled(url, source, args.tile_px, args.workers, tmp_files)
+            if grid:
+                img = _warp_image(arr, source["bbox"], grid, args.resampling, warp_threads)
+            else:
+                img = Image.fromarray(np.ascontiguousarray(arr))
+                print("  Warning: heightmap_000_meta.txt not found -- skipping reprojection")
+            del arr
+        except Exception as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            for f in tmp_files:
+                f.unlink(missing_ok=True)
+        _save_outputs(out_dir, img, url, grid, sources, args.resampling,
+                      args.png_level, dem_ok)
+        return
+
     print(f"Downloading NAIP imagery...")
     print(f"  URL: {url[:120]}...")
 
-    # Download the WMS PNG.
+    # Download the WMS PNG, unless the caller already started it.
     try:
-        data = _download(url)
+        pending = (prefetched or {}).get(url)
+        data    = pending.result() if pending is not None else _download_stage(url)
     except Exception as e:
         print(f"ERROR: {e}", file=sys.stderr)
         sys.exit(1)
@@ -78,6 +174,7 @@ def main() -> None:
         print("ERROR: Server returned empty response.", file=sys.stderr)
         sys.exit(1)
 
+    decode = stages.stage("decode")
     try:
         img = Image.open(BytesIO(data))
     except Exception as e:
@@ -89,78 +186,215 @@ def main() -> None:
 
     # Convert to RGB -- drop any alpha the WMS may have added.
     img = img.convert("RGB")
-
-    # Downscale to MAX_SIZE if needed (pre-scale before final resize).
-    if img.width > MAX_SIZE or img.height > MAX_SIZE:
-        img.thumbnail((MAX_SIZE, MAX_SIZE), Image.LANCZOS)
-        print(f"  Downscaled to: {img.width}x{img.height}")
-
-    # Reproject from WGS84 to UTM and resize to match the heightmap exactly.
-    meta = _parse_dem_meta(out_dir)
-    if meta:
-        arr = np.array(img)          # HxWx3 uint8
-        src_h, src_w = arr.shape[:2]
-        src_crs = CRS.from_epsg(4326)
-        dst_crs = CRS.from_epsg(meta["epsg"])
-        src_transform = from_bounds(*meta["bbox_wgs84"], src_w, src_h)
-        dst_transform = from_bounds(*meta["bbox_utm"],   meta["width"], meta["height"])
-        warped = np.zeros((3, meta["height"], meta["width"]), dtype=np.uint8)
-        for band in range(3):
-            reproject(
-                source=arr[:, :, band],
-                destination=warped[band],
-                src_transform=src_transform,
-                src_crs=src_crs,
-                dst_transform=dst_transform,
-                dst_crs=dst_crs,
-                resampling=Resampling.lanczos,
-            )
-        img = Image.fromarray(warped.transpose(1, 2, 0))  # back to HxWx3
-        print(f"  Reprojected WGS84 -> UTM, final size: {img.width}x{img.height}")
+    decode.add(nbytes=len(data), pixels=img.width * img.height)
+    decode.end()
+
+    # Reproject from WGS84 to UTM and resample to match the heightmap exactly,
+    # straight from the downloaded raster.
+    if grid:
+        arr = np.asarray(img)           # HxWx3 uint8
+        del img
+        img = _warp_image(arr, grid["bbox_wgs84"], grid, args.resampling, warp_threads)
     else:
+        if img.width > MAX_SIZE or img.height > MAX_SIZE:
+            img.thumbnail((MAX_SIZE, MAX_SIZE), Image.LANCZOS)
+            print(f"  Downscaled to: {img.width}x{img.height}")
         print("  Warning: heightmap_000_meta.txt not found -- skipping reprojection")
 
+    _save_outputs(out_dir, img, url, grid, [url], args.resampling, args.png_level, dem_ok)
+
+
+def import_heavy() -> None:
+    """
+    Import Pillow, numpy, rasterio/GDAL and the modules built on them into
+    this module. main() only calls this once the cache check has found work
+    to do, so an up-to-date output is reported without paying for them.
+    """
+    global Image, np, rasterio, Affine, from_bounds, reproject, transform_bounds
+    global Resampling, CRS, WGS84, HostPool, Progress, fetch, run_concurrent
+    global previews, pyramid
+    from downloader import HostPool, Progress, fetch, run_concurrent
+    import previews
+    import pyramid
+
+    try:
+        from PIL import Image
+        import numpy as np
+    except ImportError:
+        print("ERROR: Pillow/numpy not installed. Run setup.py --install first.", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        import rasterio
+        from rasterio.transform import Affine, from_bounds
+        from rasterio.warp import reproject, transform_bounds, Resampling
+        from rasterio.crs import CRS
+    except ImportError:
+        print("ERROR: rasterio not installed. Run setup.py --install first.", file=sys.stderr)
+        sys.exit(1)
+    WGS84 = CRS.from_epsg(4326)
+
+
+def _save_outputs(out_dir: Path, img, url: str, meta: dict | None, sources: list,
+                  resampling: str = "lanczos", png_level: int = DEFAULT_PNG_LEVEL,
+                  dem_ok=None) -> None:
+    """
+    Write imagery_000.png, the preview, the text meta and the manifest entry,
+    unless `dem_ok()` (see main) reports that the heightmap failed.
+    """
+    if dem_ok is not None and not dem_ok():
+        print("ERROR: The heightmap failed -- not saving the imagery.", file=sys.stderr)
+        sys.exit(1)
     # -- Save plain RGB PNG for Terrain3D Color Map slot ---------------------
+    # Written beside the old file and renamed over it, so an interrupted run
+    # never leaves a PNG that the manifest describes wrongly.
+    output_manifest.drop_entry(out_dir, "imagery")
     out_path = out_dir / "imagery_000.png"
-    img.save(str(out_path), format="PNG")
+    tmp_path = out_dir / "imagery_000.png.part"
+    with stages.stage("png_encode", level=png_level) as st:
+        img.save(str(tmp_path), format="PNG", compress_level=png_level)
+        os.replace(tmp_path, out_path)
+        st.add(nbytes=out_path.stat().st_size, pixels=img.width * img.height)
     print(f"OK Saved: {out_path.name}")
     print(f"  Size: {img.width}x{img.height}, mode: RGB")
     print(f"  Use this as the Color Map in the Terrain3D Importer")
 
-    # -- Save 256x256 preview thumbnail ----------------------------------------
-    preview_path = out_dir / "preview.png"
-    preview = img.copy()
-    preview.thumbnail((256, 256), Image.LANCZOS)
-    preview.save(str(preview_path), format="PNG")
-    print(f"OK Saved preview: {preview_path.name} ({preview.width}x{preview.height})")
+    with stages.stage("pyramid") as st:
+        levels = pyramid.build_image_levels(out_path, img, png_level)
+        st.add(nbytes=sum(p.stat().st_size for p in levels))
+    if levels:
+        print(f"  Pyramid: {len(levels)} level(s)")
+
+    # -- Save preview thumbnails ----------------------------------------------
+    with stages.stage("previews") as st:
+        written = previews.write_imagery_previews(out_dir, img, png_level)
+        st.add(nbytes=sum(p.stat().st_size for p in written))
+    print(f"OK Saved previews: {', '.join(p.name for p in written)}")
 
     _write_meta(out_dir / "imagery_000_meta.txt", img.width, img.height, url)
+    if meta:
+        output_manifest.save_entry(out_dir, "imagery", {
+            "file":       out_path.name,
+            "crs":        f"EPSG:{meta['epsg']}",
+            "transform":  list(meta["transform"][:6]),
+            "width":      img.width,
+            "height":     img.height,
+            "bbox_wgs84": list(meta["bbox_wgs84"]),
+            "params":     {"service": _strip_extent(url), "resampling": resampling},
+            "sources":    sources,
+            "levels":     len(levels),
+        })
     print("Imagery processing complete.")
 
 
-def _download(url: str) -> bytes:
-    req = urllib.request.Request(url, headers={
+def _warp_image(arr: np.ndarray, bbox_wgs: tuple, grid: dict, resampling: str,
+                num_threads: int):
+    """Warp an HxWx3 WGS84 image covering `bbox_wgs` onto `grid`; returns a PIL image."""
+    warped = np.zeros((3, grid["height"], grid["width"]), dtype=np.uint8)
+    _warp_into(arr, bbox_wgs, warped, grid["transform"], grid["crs"], resampling, num_threads)
+    img = Image.fromarray(warped.transpose(1, 2, 0))   # back to HxWx3
+    print(f"  Reprojected WGS84 -> UTM ({resampling}, {num_threads} thread(s)), "
+          f"final size: {img.width}x{img.height}")
+    return img
+
+
+def _warp_into(arr: np.ndarray, bbox_wgs: tuple, dst: np.ndarray, dst_transform,
+               dst_crs: CRS, resampling: str = "lanczos", num_threads: int = 1) -> None:
+    """
+    Warp an HxWx3 WGS84 image covering `bbox_wgs` into the 3xHxW `dst` with
+    one GDAL call for all bands, so the coordinate transform is set up once
+    and the warper's threads split the work.
+    """
+    src_h, src_w = arr.shape[:2]
+    with stages.stage("warp", resampling=resampling, threads=num_threads) as st:
+        reproject(
+            source=arr.transpose(2, 0, 1),
+            destination=dst,
+            src_transform=from_bounds(*bbox_wgs, src_w, src_h),
+            src_crs=WGS84,
+            dst_transform=dst_transform,
+            dst_crs=dst_crs,
+            resampling=Resampling[resampling],
+            num_threads=num_threads,
+        )
+        st.add(nbytes=arr.nbytes, pixels=dst.shape[1] * dst.shape[2])
+
+
+def _download(url: str, pool: HostPool | None = None,
+              progress: Progress | None = None) -> bytes:
+    """
+    Fetch the exportImage response. Transient failures are retried with
+    backoff, resuming from the bytes already received where the server allows.
+    """
+    headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
         "Referer": "https://gis.apfo.usda.gov/",
         "Accept": "image/png,image/*,*/*"
-    })
+    }
+    fd, name = tempfile.mkstemp(suffix=".img")
+    os.close(fd)
+    tmp = Path(name)
     try:
-        with urllib.request.urlopen(req, timeout=300) as r:
-            content_type = r.headers.get("Content-Type", "")
-            if "xml" in content_type or "html" in content_type:
-                body = r.read().decode("utf-8", errors="replace")
-                raise RuntimeError(f"Server returned error document:\n{body[:400]}")
-            return r.read()
-    except urllib.error.URLError as e:
-        raise RuntimeError(f"Download failed: {e.reason}") from e
-
-
-def _is_cached(out_dir: Path, bbox_wgs: tuple) -> bool:
-    """Return True if existing outputs were produced from the same bbox."""
+        fetch(url, tmp, headers=headers, pool=pool, progress=progress,
+              reject_types=("xml", "html"))
+        return tmp.read_bytes()
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _download_stage(url: str, prefetched: bool = False) -> bytes:
+    """_download(), timed as this script's "download" stage from whichever thread runs it."""
+    with stages.stage("download", script="process_imagery", prefetched=prefetched) as st:
+        data = _download(url)
+        st.add(nbytes=len(data))
+    return data
+
+
+def prefetch(out_dir: Path, url: str, bbox_wgs: tuple, max_size: int,
+             resolution: float, executor) -> dict:
+    """
+    Start downloading `url` on `executor` before the heightmap grid exists,
+    when main() is certain to make that single request: no previous imagery
+    to keep or patch, and no grid process_dem.py can pick (--max-size caps
+    its pixel size from below) is fine enough to need sub-requests.
+    Returns {url: future} for main()'s `prefetched`, or {}.
+    """
+    out_dir = Path(out_dir)
+    if output_manifest.load(out_dir).get("imagery") or (out_dir / "imagery_000.png").exists():
+        return {}
+    res_m = resolution
+    if res_m <= 0:
+        if max_size <= 0:
+            return {}
+        lat   = math.radians((bbox_wgs[1] + bbox_wgs[3]) / 2)
+        res_m = max((bbox_wgs[2] - bbox_wgs[0]) * M_PER_DEG_LON_EQ * math.cos(lat),
+                    (bbox_wgs[3] - bbox_wgs[1]) * M_PER_DEG_LAT) / max_size
+    source = _source_grid(url, res_m)
+    if source is None or source["tiled"]:
+        return {}
+    import_heavy()
+    return {url: executor.submit(_download_stage, url, prefetched=True)}
+
+
+def _is_cached(out_dir: Path, bbox_wgs: tuple, grid: dict | None,
+               resampling: str = "lanczos") -> bool:
+    """
+    Return True if existing outputs were produced from the same bbox. With a
+    manifest, the imagery must also sit on the grid this run would produce,
+    warped with the same kernel -- the heightmap meta alone cannot tell, as it
+    is rewritten before this runs.
+    """
     png  = out_dir / "imagery_000.png"
     meta = out_dir / "heightmap_000_meta.txt"
     if not png.exists() or not meta.exists():
         return False
+    manifest = output_manifest.load(out_dir)
+    imagery  = manifest.get("imagery")
+    if imagery and grid:
+        return (output_manifest.bbox_matches(imagery.get("bbox_wgs84"), bbox_wgs)
+                and output_manifest.grid_offset(imagery["transform"], grid["transform"]) == (0, 0)
+                and (imagery["width"], imagery["height"]) == (grid["width"], grid["height"])
+                and imagery.get("params", {}).get("resampling") == resampling)
     for line in meta.read_text().splitlines():
         m = re.match(r"Bbox \(WGS84\):\s+\(([^)]+)\)", line)
         if m:
@@ -188,7 +422,273 @@ def _parse_dem_meta(out_dir: Path):
         m = re.match(r"Bbox \(UTM\):\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)", line)
         if m:
             result["bbox_utm"] = tuple(float(m.group(i)) for i in range(1, 5))
-    return result if {"width", "height", "epsg", "bbox_wgs84", "bbox_utm"} <= result.keys() else None
+    if not {"width", "height", "epsg", "bbox_wgs84", "bbox_utm"} <= result.keys():
+        return None
+
+    # The manifest holds the exact grid; the text file only has 0.1 m precision.
+    dem = output_manifest.load(out_dir).get("dem")
+    if dem and (dem["width"], dem["height"]) == (result["width"], result["height"]) \
+            and dem["crs"] == f"EPSG:{result['epsg']}":
+        result["transform"] = tuple(dem["transform"][:6])
+    else:
+        result["transform"] = _bounds_transform(*result["bbox_utm"],
+                                                result["width"], result["height"])
+    return result
+
+
+def _output_grid(meta: dict, resolution: float) -> dict:
+    """
+    The imagery grid: the heightmap's, or its bounds at `resolution` m/px.
+    Adds "res", the grid's pixel size in meters.
+    """
+    a, _, c, _, e, f = meta["transform"][:6]
+    grid = dict(meta, res=a)
+    if resolution <= 0 or abs(resolution - a) < 1e-6 * a:
+        return grid
+    left, top     = c, f
+    right, bottom = left + a * meta["width"], top + e * meta["height"]
+    width  = max(1, round((right - left) / resolution))
+    height = max(1, round((top - bottom) / resolution))
+    grid.update(width=width, height=height, res=(right - left) / width,
+                transform=_bounds_transform(left, bottom, right, top, width, height))
+    return grid
+
+
+def _bounds_transform(left: float, bottom: float, right: float, top: float,
+                      width: int, height: int) -> tuple:
+    """rasterio.transform.from_bounds as a plain 6-tuple, usable before rasterio is imported."""
+    return ((right - left) / width, 0.0, left, 0.0, (bottom - top) / height, top)
+
+
+def _url_extent(url: str):
+    """((min_lon, min_lat, max_lon, max_lat), (width, height)) from an exportImage URL, or None."""
+    query = {k.lower(): v for k, v in parse_qsl(urlsplit(url).query)}
+    try:
+        bbox = tuple(float(x) for x in query["bbox"].split(","))
+        size = tuple(int(x) for x in query["size"].split(","))
+    except (KeyError, ValueError):
+        return None
+    if len(bbox) != 4 or len(size) != 2:
+        return None
+    return bbox, size
+
+
+def _source_grid(url: str, res_m: float) -> dict | None:
+    """
+    The WGS84 image to request for the URL's bbox: the URL's own size, or --
+    where that is coarser than `res_m` meters -- enough pixels to reach it, in
+    which case "tiled" is set. None if the URL carries no bbox/size.
+    """
+    extent = _url_extent(url)
+    if extent is None:
+        return None
+    bbox, (width, height) = extent
+    source = {"bbox": bbox, "width": width, "height": height, "tiled": False}
+    if res_m > 0:
+        lat    = math.radians((bbox[1] + bbox[3]) / 2)
+        need_w = math.ceil((bbox[2] - bbox[0]) * M_PER_DEG_LON_EQ * math.cos(lat) / res_m)
+        need_h = math.ceil((bbox[3] - bbox[1]) * M_PER_DEG_LAT / res_m)
+        if need_w > width * SOURCE_SLACK or need_h > height * SOURCE_SLACK:
+            source.update(width=max(width, need_w), height=max(height, need_h), tiled=True)
+    return source
+
+
+def _alloc_rgb(height: int, width: int, tmp_files: list[Path]) -> np.ndarray:
+    """Zeroed HxWx3 uint8 array; above IN_MEMORY_BYTES it is backed by a temp file."""
+    if height * width * 3 <= IN_MEMORY_BYTES:
+        return np.zeros((height, width, 3), dtype=np.uint8)
+    fd, name = tempfile.mkstemp(suffix=".rgb")
+    os.close(fd)
+    path = Path(name)
+    tmp_files.append(path)
+    return np.memmap(path, dtype=np.uint8, mode="w+", shape=(height, width, 3))
+
+
+def _fetch_tiled(url: str, source: dict, tile_px: int, workers: int,
+                 tmp_files: list[Path]):
+    """
+    Fetch source["bbox"] as a source["width"] x source["height"] image, split
+    into sub-requests of at most `tile_px` per side whose edges fall on whole
+    pixels of the full image, `workers` at a time. Returns (HxWx3 mosaic,
+    [sub-request URLs]).
+    """
+    bbox          = source["bbox"]
+    width, height = source["width"], source["height"]
+    nx, ny = math.ceil(width / tile_px), math.ceil(height / tile_px)
+    xs     = [round(k * width / nx) for k in range(nx + 1)]
+    ys     = [round(k * height / ny) for k in range(ny + 1)]
+    rects  = [(ys[r], xs[c], ys[r + 1], xs[c + 1]) for r in range(ny) for c in range(nx)]
+    dx     = (bbox[2] - bbox[0]) / width
+    dy     = (bbox[3] - bbox[1]) / height
+
+    print(f"Downloading NAIP imagery: {width}x{height} px in {len(rects)} sub-request(s) "
+          f"({nx}x{ny}) with {max(1, min(workers, len(rects)))} worker(s)...")
+    print(f"  URL: {url[:120]}...")
+    mosaic   = _alloc_rgb(height, width, tmp_files)
+    pool     = HostPool()
+    stage    = stages.stage("download", requests=len(rects))
+    progress = Progress(len(rects), stage=stage)
+
+    def fetch_one(rect: tuple):
+        r0, c0, r1, c1 = rect
+        sub_bbox = (bbox[0] + c0 * dx, bbox[3] - r1 * dy, bbox[0] + c1 * dx, bbox[3] - r0 * dy)
+        sub_url  = _with_extent(url, sub_bbox, c1 - c0, r1 - r0)
+        for attempt in range(1, DECODE_ATTEMPTS + 1):
+            data = _download(sub_url, pool=pool, progress=progress)
+            try:
+                with Image.open(BytesIO(data)) as im:
+                    tile = im.convert("RGB")
+                break
+            except OSError as e:
+                if attempt == DECODE_ATTEMPTS:
+                    raise RuntimeError(f"Could not decode sub-tile at ({c0}, {r0}): {e}") from e
+                print(f"\n  Sub-tile at ({c0}, {r0}) did not decode -- "
+                      f"retry {attempt}/{DECODE_ATTEMPTS - 1}", flush=True)
+        if tile.size != (c1 - c0, r1 - r0):
+            print(f"\n  Warning: sub-tile at ({c0}, {r0}) came back {tile.width}x{tile.height}, "
+                  f"expected {c1 - c0}x{r1 - r0} -- resampling", flush=True)
+            tile = tile.resize((c1 - c0, r1 - r0), Image.LANCZOS)
+        progress.finish(sub_url, f"{c1 - c0}x{r1 - r0} px at ({c0}, {r0}), "
+                                 f"{len(data) / 1024:.1f} KB")
+        return sub_url, np.asarray(tile)
+
+    sources = [None] * len(rects)
+    total   = 0
+    try:
+        for i, (r0, c0, r1, c1), (sub_url, tile) in run_concurrent(fetch_one, rects, workers):
+            mosaic[r0:r1, c0:c1] = tile
+            sources[i] = sub_url
+            total     += tile.nbytes
+            stage.add(pixels=(r1 - r0) * (c1 - c0))
+    finally:
+        pool.close()
+    stage.end()
+    print(f"  Downloaded {len(rects)} sub-tile(s), {total / 1024 / 1024:.1f} MB decoded")
+    return mosaic, sources
+
+
+# -- Reuse of previous imagery -------------------------------------------------
+
+def _strip_extent(url: str) -> str:
+    """The exportImage URL without its bbox and size, i.e. what identifies the source."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k.lower() not in ("bbox", "size")]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _with_extent(url: str, bbox: tuple, width: int, height: int) -> str:
+    parts = urlsplit(url)
+    query = []
+    for k, v in parse_qsl(parts.query):
+        if k.lower() == "bbox":
+            v = ",".join(f"{x:.8f}" for x in bbox)
+        elif k.lower() == "size":
+            v = f"{width},{height}"
+        query.append((k, v))
+    return urlunsplit(parts._replace(query=urlencode(query, safe=",")))
+
+
+def _plan_reuse(out_dir: Path, url: str, meta: dict, source: dict,
+                resampling: str = "lanczos") -> dict | None:
+    """
+    Decide whether the previous imagery can supply part of the new one: same
+    service and layer, same CRS, and its grid is a whole-pixel offset of the
+    new heightmap grid (process_dem.py snaps nudged grids to the old one).
+    Returns {"png", "overlap", "strips", "offset", "deg_per_px"} or None.
+    """
+    prev = output_manifest.load(out_dir).get("imagery")
+    png  = out_dir / "imagery_000.png"
+    if not prev or not png.exists() or prev.get("crs") != f"EPSG:{meta['epsg']}":
+        return None
+    if prev.get("params") != {"service": _strip_extent(url), "resampling": resampling}:
+        return None
+    offset = output_manifest.grid_offset(prev["transform"], meta["transform"])
+    if offset is None:
+        return None
+    # The old WGS84 request is not axis-aligned in UTM, so the old PNG has
+    # black wedges along its edges. Only reuse what lies inside its footprint.
+    ro, co         = offset
+    r0, c0, r1, c1 = _inscribed_rect(prev["bbox_wgs84"], meta)
+    r0, c0 = max(r0, ro), max(c0, co)
+    r1, c1 = min(r1, ro + prev["height"]), min(c1, co + prev["width"])
+    if r1 <= r0 or c1 <= c0:
+        return None
+    overlap, strips = output_manifest.overlap_and_strips(
+        r0, c0, c1 - c0, r1 - r0, meta["width"], meta["height"])
+    # Keep the ground resolution the full request would have had.
+    bbox = source["bbox"]
+    return {"png": png, "overlap": overlap, "strips": strips, "offset": offset,
+            "deg_per_px": ((bbox[2] - bbox[0]) / source["width"],
+                           (bbox[3] - bbox[1]) / source["height"])}
+
+
+def _inscribed_rect(bbox_wgs: tuple, meta: dict, margin: int = 3) -> tuple:
+    """
+    Pixel rectangle (r0, c0, r1, c1) of the new grid lying inside `bbox_wgs`,
+    shrunk by `margin` px so the lanczos kernel had full support there.
+    """
+    from rasterio.warp import transform as warp_transform
+    min_lon, min_lat, max_lon, max_lat = bbox_wgs
+    steps = [i / 20 for i in range(21)]
+    lons  = [min_lon + (max_lon - min_lon) * t for t in steps]
+    lats  = [min_lat + (max_lat - min_lat) * t for t in steps]
+    dst   = meta["crs"]
+    left, _   = warp_transform(WGS84, dst, [min_lon] * 21, lats)
+    right, _  = warp_transform(WGS84, dst, [max_lon] * 21, lats)
+    _, bottom = warp_transform(WGS84, dst, lons, [min_lat] * 21)
+    _, top    = warp_transform(WGS84, dst, lons, [max_lat] * 21)
+    t = meta["transform"]
+    return (math.ceil((t.f - min(top)) / -t.e) + margin,
+            math.ceil((max(left) - t.c) / t.a) + margin,
+            math.floor((t.f - max(bottom)) / -t.e) - margin,
+            math.floor((min(right) - t.c) / t.a) - margin)
+
+
+def _patch_strips(reuse: dict, url: str, meta: dict, tile_px: int = TILE_PX,
+                  workers: int = IMAGERY_WORKERS, resampling: str = "lanczos",
+                  num_threads: int = 1):
+    """Build the new image from the reused overlap plus the missing strips."""
+    r0, c0, r1, c1 = reuse["overlap"]
+    ro, co         = reuse["offset"]
+    out = np.zeros((3, meta["height"], meta["width"]), dtype=np.uint8)
+    with stages.stage("load_overlap") as st, Image.open(reuse["png"]) as old:
+        crop = old.convert("RGB").crop((c0 - co, r0 - ro, c1 - co, r1 - ro))
+        out[:, r0:r1, c0:c1] = np.asarray(crop).transpose(2, 0, 1)
+        st.add(pixels=(r1 - r0) * (c1 - c0))
+    print(f"Reusing {c1 - c0}x{r1 - r0} px from the previous imagery; "
+          f"{len(reuse['strips'])} strip(s) to fetch")
+
+    sources = []
+    dst_crs = meta["crs"]
+    for n, rect in enumerate(reuse["strips"], 1):
+        # Pad by a few px so the lanczos kernel has support at the strip edges.
+        sr0, sc0, sr1, sc1 = rect
+        padded = (max(0, sr0 - 4), max(0, sc0 - 4),
+                  min(meta["height"], sr1 + 4), min(meta["width"], sc1 + 4))
+        bbox   = transform_bounds(dst_crs, WGS84,
+                                  *output_manifest.rect_bounds(meta["transform"], padded),
+                                  densify_pts=21)
+        width  = max(1, math.ceil((bbox[2] - bbox[0]) / reuse["deg_per_px"][0]))
+        height = max(1, math.ceil((bbox[3] - bbox[1]) / reuse["deg_per_px"][1]))
+        print(f"  Strip {n}/{len(reuse['strips'])}: {sc1 - sc0}x{sr1 - sr0} px "
+              f"(requesting {width}x{height})")
+        tmp_files = []
+        try:
+            arr, strip_sources = _fetch_tiled(
+                url, {"bbox": bbox, "width": width, "height": height}, tile_px, workers,
+                tmp_files)
+            part = np.zeros((3, sr1 - sr0, sc1 - sc0), dtype=np.uint8)
+            _warp_into(arr, bbox, part, meta["transform"] * Affine.translation(sc0, sr0),
+                       dst_crs, resampling, num_threads)
+            del arr
+        finally:
+            for f in tmp_files:
+                f.unlink(missing_ok=True)
+        out[:, sr0:sr1, sc0:sc1] = part
+        sources.extend(strip_sources)
+
+    print(f"  Patched image: {meta['width']}x{meta['height']}")
+    return Image.fromarray(out.transpose(1, 2, 0)), sources
 
 
 def _write_meta(path: Path, width: int, height: int, url: str) -> None:
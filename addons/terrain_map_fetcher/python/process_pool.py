@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+process_pool.py
+---------------
+The worker process pool shared by process_dem.py (reprojection),
+combine_tiles.py (tile decoding) and terrain3d_regions.py (region writing).
+
+Forking a process that runs other threads can copy a lock one of them holds
+into the child, which then deadlocks on it. ProcessPoolExecutor forks its
+workers lazily, at the first submit() -- by then process_dem.py's download
+threads are running -- so start() forks them all before it returns, while
+the caller is still single-threaded. A process that already runs other
+threads (fetch_pipeline.py, worker.py) gets a forkserver instead, with the
+`preload` modules imported once; the server is reused by every later pool
+in the same process. Windows always spawns.
+"""
+
+import sys
+import threading
+
+
+def start(max_workers: int, preload: list[str]):
+    """A ProcessPoolExecutor of `max_workers` processes, safe to use next to threads."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    ctx = None
+    if sys.platform != "win32" and threading.active_count() > 1:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload(preload)
+        else:
+            ctx = multiprocessing.get_context("spawn")
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx)
+    if (ctx or multiprocessing).get_start_method() == "fork":
+        # A forking executor launches all its workers on the first submit.
+        executor.submit(int).result()
+    return executor
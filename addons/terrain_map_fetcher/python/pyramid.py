@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+pyramid.py
+----------
+2x downsampled levels (mips) of a patch's heightmap and imagery, stored as
+separate files beside the full-resolution one:
+
+  heightmap_000.exr       level 0 (full resolution)
+  heightmap_000_mip1.exr  level 1 (ceil(w/2) x ceil(h/2))
+  heightmap_000_mip2.exr  ...
+  imagery_000.png, imagery_000_mip1.png, ...
+
+Levels stop once the longer side is at most MIN_LEVEL_SIZE px. Each level is
+exactly ceil(previous / 2) per side, so a consumer can work out every level's
+size from the base size alone and open only the cheapest file that still
+meets its target resolution (pick_level).
+
+Heightmap levels are 2x2 box means, streamed from the previous level in
+row blocks and written with the base's EXR options (exr_io.py), so every
+level has its channels, pixel type and compression. Imagery levels use
+Pillow's Image.reduce (also a box filter).
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from image_encoders import DEFAULT_PNG_LEVEL
+
+MIN_LEVEL_SIZE = 256   # smallest level: longer side at most this many px
+
+
+def level_path(base: Path, level: int) -> Path:
+    base = Path(base)
+    return base if level == 0 else base.with_name(f"{base.stem}_mip{level}{base.suffix}")
+
+
+def level_sizes(width: int, height: int, min_size: int = MIN_LEVEL_SIZE) -> list[tuple]:
+    """[(w, h)] of level 0, 1, ... for a width x height base."""
+    sizes = [(width, height)]
+    while max(sizes[-1]) > min_size:
+        w, h = sizes[-1]
+        sizes.append(((w + 1) // 2, (h + 1) // 2))
+    return sizes
+
+
+def pick_level(base: Path, width: int, height: int,
+               target_w: int, target_h: int) -> tuple[Path, int, int]:
+    """
+    The smallest existing level of `base` (a width x height level 0) that is
+    at least target_w x target_h. Returns (path, level width, level height);
+    level 0 if no smaller level qualifies or none were built.
+    """
+    best = (Path(base), width, height)
+    for level, (w, h) in enumerate(level_sizes(width, height)):
+        if w < target_w or h < target_h:
+            break
+        path = level_path(base, level)
+        if level and path.exists():
+            best = (path, w, h)
+    return best
+
+
+def clear_levels(base: Path) -> None:
+    """Delete the levels of an earlier `base`, which no longer match it."""
+    base = Path(base)
+    for p in base.parent.glob(f"{base.stem}_mip*{base.suffix}"):
+        p.unlink(missing_ok=True)
+
+
+# -- Builders ------------------------------------------------------------------
+
+def build_heightmap_levels(base: Path, exr_opts: dict | None = None) -> list[Path]:
+    """
+    Write the EXR levels of `base`, each streamed from the one above it so
+    only a block of rows is in memory at a time, with the ScanlineWriter
+    options `exr_opts` (exr_io.writer_options; default: float R, zip) the
+    base was written with. Returns the level paths.
+    """
+    from exr_io import DEFAULT_OPTIONS, ScanlineReader, ScanlineWriter, row_blocks
+
+    clear_levels(base)
+    with ScanlineReader(base) as r:
+        sizes = level_sizes(r.width, r.height)
+    opts  = exr_opts or DEFAULT_OPTIONS
+    paths = []
+    src   = Path(base)
+    for level, (w, h) in enumerate(sizes[1:], 1):
+        dst = level_path(base, level)
+        tmp = dst.with_name(dst.name + ".part")
+        with ScanlineReader(src) as r, ScanlineWriter(tmp, w, h, **opts) as out:
+            for y0, y1 in row_blocks(r.height):   # even-sized blocks
+                out.write(_halve(r.read(y0, y1)))
+        os.replace(tmp, dst)
+        paths.append(dst)
+        src = dst
+    return paths
+
+
+def build_image_levels(base: Path, img, png_level: int = DEFAULT_PNG_LEVEL) -> list[Path]:
+    """Write the PNG levels of `base` from `img`, its decoded PIL image."""
+    clear_levels(base)
+    paths = []
+    for level, (w, h) in enumerate(level_sizes(img.width, img.height)[1:], 1):
+        img = img.reduce(2)
+        dst = level_path(base, level)
+        tmp = dst.with_name(dst.name + ".part")
+        img.save(str(tmp), format="PNG", compress_level=png_level)
+        os.replace(tmp, dst)
+        paths.append(dst)
+    return paths
+
+
+def _halve(block: np.ndarray) -> np.ndarray:
+    """2x2 box mean; an odd last row/column is averaged with itself."""
+    if block.shape[0] % 2:
+        block = np.concatenate([block, block[-1:]], axis=0)
+    if block.shape[1] % 2:
+        block = np.concatenate([block, block[:, -1:]], axis=1)
+    h, w = block.shape
+    return block.reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3), dtype=np.float32)
@@ -6,6 +6,7 @@ Run with --check to just verify, or --install to pip-install missing packages.
 
 import sys
 import importlib
+import importlib.util
 import subprocess
 
 REQUIRED = {
@@ -19,13 +20,14 @@ REQUIRED = {
 
 
 def check() -> list[str]:
-    missing = []
-    for module, pkg in REQUIRED.items():
-        try:
-            importlib.import_module(module)
-        except ImportError:
-            missing.append(pkg)
-    return missing
+    """
+    Pip requirements whose module cannot be found. Only the import system's
+    spec lookup runs -- nothing is imported -- so this takes milliseconds
+    instead of the second or so that loading GDAL and numpy would.
+    """
+    importlib.invalidate_caches()   # a long-lived caller may have just installed them
+    return [pkg for module, pkg in REQUIRED.items()
+            if importlib.util.find_spec(module) is None]
 
 
 def install(packages: list[str]) -> bool:
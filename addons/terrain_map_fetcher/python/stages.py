@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+stages.py
+---------
+Opt-in, machine-readable progress, timing and profiling for the processing
+scripts. The stage boundaries are defined here once, for all of them.
+
+Every script accepts --events FILE and --profile DIR (add_argument) and
+wraps its work in run(); inside it, each step is a named stage:
+
+    with stages.stage("exr_write") as st:
+        ...
+        st.add(nbytes=size, pixels=w * h)
+
+or, for steps that overlap (the DEM downloads and warps), st = stage(...)
+... st.end(). Without --events nothing is written and a stage costs two
+clock reads. With it, one JSON object per line is appended to FILE ("-" =
+stdout, where the lines are interleaved with the usual output -- split on
+"\\r" as well as "\\n"):
+
+  {"event": "run_start", "script", "t"}
+  {"event": "stage_start", "script", "stage", "t", ...}
+  {"event": "progress", "script", "stage", "t", "done", "total", "unit"}
+  {"event": "stage_end", "script", "stage", "ok", "t_start", "t_end",
+   "elapsed_s", "bytes", "mb_per_s", "pixels", "mpix_per_s", "peak_rss_mb", ...}
+  {"event": "run_end", "script", "t", "exit_code", "elapsed_s", "peak_rss_mb"}
+
+"t*" are Unix times in seconds. "bytes" and "pixels" are what the stage
+processed (downloaded, decoded, warped, written); the rates are per second
+of the stage's wall time. "peak_rss_mb" is this process's peak resident
+set so far (worker processes not included). progress events are throttled
+to a few per second. Scripts run inside fetch_pipeline.py or worker.py
+without --events of their own report into the caller's file.
+
+With --profile DIR, tracemalloc traces the whole run and every stage gets
+  NN_<script>_<stage>.prof   cProfile stats (pstats / snakeviz)
+  NN_<script>_<stage>.txt    the top functions by cumulative time and the
+                             top allocations still live at the stage's end
+and <script>_profile.txt summarizes time and peak traced allocation per
+stage (stage_end events carry the latter as "peak_alloc_mb"). cProfile
+sees the thread that started the stage: when stages overlap in one thread
+(the DEM's download and warp), the first one's profile covers both until
+it ends and the other is profiled from then on. The download threads and
+process_dem.py's warp processes are not profiled (--workers 1 keeps the
+warps in-process). tracemalloc sees Python and numpy allocations, not
+GDAL's or OpenEXR's. Both slow the run down.
+
+request_cancel() (worker.py's cancel) makes every thread that starts a run
+or stage, or reports into one with add() or progress(), raise Cancelled
+until clear_cancel(); the scripts' finally blocks then clean up as for any
+other error.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PROGRESS_INTERVAL = 0.25     # seconds between progress events of one stage
+TRACE_FRAMES      = 1        # frames per traced allocation; deeper makes snapshots far slower
+TOP_N             = 30       # functions / allocations listed per stage
+
+_lock    = threading.Lock()
+_sink    = None           # open events file, sys.stdout marker "-", or None
+_local   = threading.local()
+_open    = []             # stages not ended yet
+_profile = None           # _Profiler while a run has --profile
+_cancel  = threading.Event()
+
+
+class Cancelled(BaseException):
+    """Raised after request_cancel(); not an Exception, so scripts do not catch it."""
+
+
+def request_cancel() -> None:
+    _cancel.set()
+
+
+def clear_cancel() -> None:
+    _cancel.clear()
+
+
+def check_cancelled() -> None:
+    """Raise Cancelled if request_cancel() was called since the last clear_cancel()."""
+    if _cancel.is_set():
+        raise Cancelled()
+
+
+def add_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--events", metavar="FILE", default=None,
+                        help="Append JSON-lines progress and timing events to FILE ('-' = stdout).")
+    parser.add_argument("--profile", metavar="DIR", default=None,
+                        help="Write cProfile stats and tracemalloc top allocations per stage, "
+                             "and a summary table, to DIR.")
+
+
+@contextmanager
+def run(script: str, events: str | None = None, profile: str | None = None):
+    """
+    Wrap a script's main(). Opens `events` and starts `profile` if given
+    (otherwise keeps whatever a caller started) and reports run_start/
+    run_end, with the exit code of a sys.exit() passing through.
+    """
+    global _sink, _profile
+    prev_sink, prev_script = _sink, getattr(_local, "script", None)
+    if events:
+        with _lock:
+            _sink = "-" if events == "-" else open(events, "a", encoding="utf-8")
+    profiler = _Profiler(Path(profile), script) if profile and _profile is None else None
+    if profiler:
+        _profile = profiler
+    _local.script = script
+    t0   = time.perf_counter()
+    code = 0
+    emit("run_start", script=script)
+    try:
+        check_cancelled()
+        yield
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) or e.code is None else 1
+        raise
+    except BaseException:
+        code = 1
+        raise
+    finally:
+        with _lock:
+            unfinished = [st for st in _open if st.script == script]
+        for st in unfinished:   # left open by an error or exit
+            st.end(ok=False)
+        emit("run_end", script=script, exit_code=code or 0,
+             elapsed_s=round(time.perf_counter() - t0, 4), peak_rss_mb=peak_rss_mb())
+        _local.script = prev_script
+        if profiler:
+            _profile = None
+            profiler.close()
+        if events:
+            with _lock:
+                if _sink != "-":
+                    _sink.close()
+                _sink = prev_sink
+
+
+def emit(event: str, **fields) -> None:
+    """Write one event line (a no-op without --events)."""
+    if _sink is None:
+        return
+    fields.setdefault("script", getattr(_local, "script", None))
+    line = json.dumps({"event": event, "t": round(time.time(), 4), **fields},
+                      separators=(",", ":")) + "\n"
+    with _lock:
+        if _sink is None:
+            return
+        if _sink == "-":
+            sys.stdout.write(line)
+            sys.stdout.flush()
+        else:
+            _sink.write(line)
+            _sink.flush()
+
+
+def stage(name: str, script: str | None = None, **fields) -> "Stage":
+    """
+    Start a stage; end it with .end() or use it as a context manager.
+    `script` defaults to the one run() set for this thread.
+    """
+    check_cancelled()
+    return Stage(name, script, **fields)
+
+
+class Stage:
+    """
+    One timed step. add() and progress() may be called from any thread, so
+    download and warp workers can report into their stage directly.
+    """
+
+    def __init__(self, name: str, script: str | None = None, **fields):
+        self.name     = name
+        self.fields   = fields
+        self.script   = script or getattr(_local, "script", None)
+        self.nbytes   = 0
+        self.pixels   = 0
+        self._lock    = threading.Lock()
+        self._last    = 0.0
+        self._ended   = False
+        self.t_start  = time.time()
+        self._t0      = time.perf_counter()
+        with _lock:
+            _open.append(self)
+        emit("stage_start", script=self.script, stage=name, **fields)
+        self._prof    = _profile.begin(self) if _profile else None
+
+    def add(self, nbytes: int = 0, pixels: int = 0) -> None:
+        check_cancelled()
+        with self._lock:
+            self.nbytes += nbytes
+            self.pixels += pixels
+
+    def progress(self, done, total=None, unit: str = "bytes") -> None:
+        """Report `done` of `total` `unit`s; throttled, but the final update always goes out."""
+        check_cancelled()
+        if _sink is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last < PROGRESS_INTERVAL and done != total:
+                return
+            self._last = now
+        emit("progress", script=self.script, stage=self.name, done=done, total=total, unit=unit)
+
+    def end(self, ok: bool = True, **fields) -> None:
+        with self._lock:
+            if self._ended:
+                return
+            self._ended = True
+        elapsed = time.perf_counter() - self._t0
+        if self._prof:
+            fields = {**fields, **self._prof.finish(self, elapsed, ok)}
+        with _lock:
+            _open.remove(self)
+        rate    = (lambda n: round(n / elapsed, 2) if elapsed > 0 else None)
+        emit("stage_end", script=self.script, stage=self.name, ok=ok,
+             t_start=round(self.t_start, 4), t_end=round(self.t_start + elapsed, 4),
+             elapsed_s=round(elapsed, 4),
+             bytes=self.nbytes, mb_per_s=rate(self.nbytes / 1024 / 1024),
+             pixels=self.pixels, mpix_per_s=rate(self.pixels / 1e6),
+             peak_rss_mb=peak_rss_mb(), **{**self.fields, **fields})
+
+    def __enter__(self) -> "Stage":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end(ok=exc_type is None)
+
+
+class _Profiler:
+    """cProfile + tracemalloc bookkeeping of one --profile run."""
+
+    def __init__(self, out_dir: Path, script: str):
+        import tracemalloc
+        self.dir     = out_dir
+        self.script  = script
+        self.records = []
+        self.count   = 0
+        self.local   = threading.local()   # .owner: stage whose cProfile runs in this thread
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.tracing = not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start(TRACE_FRAMES)
+
+    def begin(self, st: Stage) -> "_Profiler":
+        import tracemalloc
+        with _lock:
+            self.count += 1
+            st._seq = self.count
+            # Fold the peak so far into every open stage before resetting
+            # it for this one, so overlapping stages keep their own peaks.
+            current, peak = tracemalloc.get_traced_memory()
+            for other in _open:
+                if other is not st:
+                    other._peak = max(getattr(other, "_peak", 0), peak)
+            tracemalloc.reset_peak()
+            st._mem0 = st._peak = current
+        st._thread   = threading.get_ident()
+        st._cprofile = None
+        st._late     = None
+        if getattr(self.local, "owner", None) is None:
+            self._profile(st)
+        return self
+
+    def _profile(self, st: Stage) -> None:
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            return   # Python 3.12+: one profiler per process, already in another thread
+        self.local.owner = st
+        st._cprofile     = prof
+
+    def finish(self, st: Stage, elapsed: float, ok: bool) -> dict:
+        import io
+        import pstats
+        import tracemalloc
+        stats = None
+        if st._cprofile is not None and threading.get_ident() == st._thread:
+            st._cprofile.disable()
+            self.local.owner = None
+            stats = pstats.Stats(st._cprofile)
+        with _lock:
+            current, peak = tracemalloc.get_traced_memory()
+            st._peak = max(st._peak, peak)
+        snapshot = tracemalloc.take_snapshot()
+
+        name   = f"{st._seq:02d}_{st.script}_{st.name}"
+        report = io.StringIO()
+        report.write(f"{st.script} / {st.name}: {elapsed:.3f}s, "
+                     f"peak traced {st._peak / 1024 / 1024:.1f} MB, "
+                     f"{'ok' if ok else 'FAILED'}\n\n")
+        if stats is not None:
+            stats.dump_stats(str(self.dir / f"{name}.prof"))
+            if st._late:
+                report.write(f"(cProfile from {st._late:.3f}s on; before that an "
+                             f"overlapping stage's profile covered this one)\n")
+            report.write(f"-- Top {TOP_N} functions by cumulative time --\n")
+            stats.stream = report
+            stats.sort_stats("cumulative").print_stats(TOP_N)
+        else:
+            report.write("(no cProfile: the profile of an overlapping stage covers this one)\n\n")
+        report.write(f"-- Top {TOP_N} allocations live at the end of the stage --\n")
+        for line in snapshot.statistics("lineno")[:TOP_N]:
+            report.write(f"{line}\n")
+        (self.dir / f"{name}.txt").write_text(report.getvalue(), encoding="utf-8")
+
+        record = {"seq": st._seq, "script": st.script, "stage": st.name, "ok": ok,
+                  "elapsed_s": round(elapsed, 4),
+                  "peak_alloc_mb": round(st._peak / 1024 / 1024, 1),
+                  "alloc_delta_mb": round((current - st._mem0) / 1024 / 1024, 1),
+                  "profile": f"{name}.prof" if stats is not None else None}
+        with _lock:
+            self.records.append(record)
+            # A stage this one overlapped in its thread (the DEM's warp,
+            # after its download) is profiled from here on.
+            waiting = [o for o in _open if o is not st and getattr(o, "_cprofile", True) is None
+                       and o._thread == threading.get_ident()] if stats is not None else []
+        if waiting:
+            waiting[0]._late = time.perf_counter() - waiting[0]._t0
+            self._profile(waiting[0])
+        return {"peak_alloc_mb": record["peak_alloc_mb"]}
+
+    def close(self) -> None:
+        """Write the summary table and stop tracing if this run started it."""
+        import tracemalloc
+        rows = sorted(self.records, key=lambda r: r["seq"])
+        lines = [f"{'#':>3}  {'script':<16}{'stage':<14}{'time s':>9}{'peak MB':>10}"
+                 f"{'delta MB':>10}  profile"]
+        for r in rows:
+            lines.append(f"{r['seq']:>3}  {r['script'] or '':<16}{r['stage']:<14}"
+                         f"{r['elapsed_s']:>9.3f}{r['peak_alloc_mb']:>10.1f}"
+                         f"{r['alloc_delta_mb']:>+10.1f}  {r['profile'] or '-'}"
+                         + ("" if r["ok"] else "  (failed)"))
+        (self.dir / f"{self.script}_profile.txt").write_text("\n".join(lines) + "\n",
+                                                             encoding="utf-8")
+        (self.dir / f"{self.script}_profile.json").write_text(json.dumps(rows, indent=2),
+                                                              encoding="utf-8")
+        if self.tracing:
+            tracemalloc.stop()
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process so far, in MB (None if unknown)."""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class Counters(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + \
+                           [(n, ctypes.c_size_t) for n in (
+                               "PeakWorkingSetSize", "WorkingSetSize",
+                               "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                               "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                               "PagefileUsage", "PeakPagefileUsage")]
+
+            kernel32 = ctypes.WinDLL("kernel32")
+            psapi    = ctypes.WinDLL("psapi")
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.c_void_p,
+                                                   wintypes.DWORD]
+            counters    = Counters()
+            counters.cb = ctypes.sizeof(Counters)
+            if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(),
+                                              ctypes.byref(counters), counters.cb):
+                return None
+            return round(counters.PeakWorkingSetSize / 1024 / 1024, 1)
+        except (OSError, AttributeError):
+            return None
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux, bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+terrain3d_regions.py
+--------------------
+Export of a heightmap (and color map) cut along the Terrain3D region grid,
+shared by combine_tiles.py and compose_canvas.py (--output regions|both).
+
+Terrain3D keeps a terrain as square regions of --region-size vertices on a
+grid of region locations around the world origin (a 32 x 32 map, -16 to
+15 on each axis). One image the size of the whole world has to be loaded
+and sliced into those regions in the editor; written already cut, each
+region is loaded on its own. The canvas's top-left pixel goes to the corner
+of region --region-origin X Y (default: the one that centres the canvas on
+the origin) and every region the canvas touches is written as
+
+  terrain3d_regions/terrain3d_XX_YY_height.exr  heightmap (the --exr-* options)
+  terrain3d_regions/terrain3d_XX_YY_color.png   color map (--image-format), if any
+
+named after its location the way Terrain3D names its region files
+(terrain3d_00-01 is x 0, y -1). Regions past the canvas's right or bottom
+edge are padded to full size by repeating its last column/row; regions no
+tile or patch mask covers are not written, and the elevation range
+(elev_min_m/elev_max_m) is taken over the covered pixels only. The regions
+are encoded in --workers processes (OpenEXR holds the GIL while it
+encodes), and terrain3d_regions/regions.json indexes them:
+
+  {"region_size", "origin", "canvas_width", "canvas_height",
+   "vertex_spacing", "heightmap_exr", "imagery_format",
+   "elev_min_m", "elev_max_m", "skipped",
+   "regions": [{"location": [x, y], "height", "color", "canvas_rect"}]}
+
+"canvas_rect" is [x0, y0, x1, y1], the canvas pixels the region holds; the
+rest of it is padding. The region at location (x, y) belongs at world
+position (x, y) * region_size * vertex_spacing. "vertex_spacing" (metres
+per pixel) is null when the script does not know it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from collections import deque
+from pathlib import Path
+
+import exr_io
+import image_encoders
+import process_pool
+import stages
+
+REGION_SIZES        = (64, 128, 256, 512, 1024, 2048)
+DEFAULT_REGION_SIZE = 256          # Terrain3D's default
+REGION_MAP_SIZE     = 32           # locations per axis, -16 to 15
+OUTPUTS             = ("single", "regions", "both")
+DIR_NAME            = "terrain3d_regions"
+INDEX_NAME          = "regions.json"
+
+
+def add_arguments(parser) -> None:
+    """The --output/--region-size/--region-origin options of a script."""
+    parser.add_argument("--output", choices=OUTPUTS, default="single",
+                        help="Write one image, Terrain3D region tiles (see terrain3d_regions.py), "
+                             "or both.")
+    parser.add_argument("--region-size", type=int, choices=REGION_SIZES,
+                        default=DEFAULT_REGION_SIZE,
+                        help="Terrain3D region size in pixels; match the Terrain3D node's.")
+    parser.add_argument("--region-origin", type=int, nargs=2, metavar=("X", "Y"), default=None,
+                        help="Region location of the canvas's top-left corner "
+                             "(default: centre the canvas on the world origin).")
+
+
+def location_name(x: int, y: int) -> str:
+    """Terrain3D's file stem for region location (x, y): terrain3d_00-01 for (0, -1)."""
+    return "terrain3d" + "".join(f"{'_' if v >= 0 else '-'}{abs(v):02d}" for v in (x, y))
+
+
+def plan(width: int, height: int, region_size: int,
+         origin: tuple[int, int] | None = None) -> dict:
+    """
+    The regions a width x height canvas covers: {"region_size", "origin",
+    "width", "height", "cols", "rows", "regions": [{"location", "rect"}]},
+    "rect" being the canvas pixels (x0, y0, x1, y1) in the region, in
+    row-major order.
+    """
+    cols = -(-width // region_size)
+    rows = -(-height // region_size)
+    if origin is None:
+        origin = (-(cols // 2), -(rows // 2))
+    regions = []
+    for r in range(rows):
+        for c in range(cols):
+            x0, y0 = c * region_size, r * region_size
+            regions.append({"location": (origin[0] + c, origin[1] + r),
+                            "rect": (x0, y0, min(width, x0 + region_size),
+                                     min(height, y0 + region_size))})
+    return {"region_size": region_size, "origin": tuple(origin),
+            "width": width, "height": height, "cols": cols, "rows": rows, "regions": regions}
+
+
+def export(out_dir: Path, height, grid: dict, exr_opts: dict, workers: int = 0,
+           color=None, image_opts: dict | None = None, coverage=None,
+           vertex_spacing: float | None = None) -> dict:
+    """
+    Write the regions of `grid` (plan()) from the float32 heightmap `height`
+    and, if given, the uint8 RGB `color` of the same size into
+    out_dir/terrain3d_regions, replacing an earlier export there, and the
+    index. `coverage(x0, y0, x1, y1)` is the boolean mask of the pixels of
+    that canvas block some tile or patch mask covers; regions with none are
+    skipped and the rest measure their elevation range over them only.
+    image_opts holds image_encoders.save()'s fmt/png_level/webp_quality.
+    Returns the index plus "path" (the index file) and, for half pixels,
+    "max_error".
+    """
+    out = Path(out_dir) / DIR_NAME
+    out.mkdir(parents=True, exist_ok=True)
+    for old in out.glob("terrain3d[_-]*"):
+        old.unlink()
+    (out / INDEX_NAME).unlink(missing_ok=True)
+
+    size  = grid["region_size"]
+    half  = REGION_MAP_SIZE // 2
+    masks = {}
+    for r in grid["regions"]:
+        mask = None if coverage is None else coverage(*r["rect"])
+        if mask is None or mask.all():
+            masks[r["location"]] = None
+        elif mask.any():
+            masks[r["location"]] = mask
+    todo  = [r for r in grid["regions"] if r["location"] in masks]
+    outer = [r["location"] for r in todo
+             if not all(-half <= v < half for v in r["location"])]
+    if outer:
+        print(f"WARNING: {len(outer)} region(s) lie outside Terrain3D's region map "
+              f"({-half} to {half - 1}), e.g. {list(outer[0])}; use a larger --region-size "
+              f"or another --region-origin.")
+
+    jobs = workers if workers > 0 else os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(todo)))
+    print(f"Writing {len(todo)} Terrain3D region(s) of {size} px to {out.name}/ "
+          f"({len(grid['regions']) - len(todo)} empty skipped, {jobs} process(es))...")
+
+    executor = None
+    if jobs > 1:
+        executor = process_pool.start(jobs, [__name__, "numpy", "OpenEXR"])
+    ahead   = iter(todo)
+    pending = deque()
+
+    def job(region: dict) -> tuple:
+        x0, y0, x1, y1 = region["rect"]
+        return (out / location_name(*region["location"]), size,
+                height[y0:y1, x0:x1], None if color is None else color[y0:y1, x0:x1],
+                exr_opts, image_opts, masks[region["location"]])
+
+    def submit_ahead() -> None:
+        while len(pending) < jobs:
+            region = next(ahead, None)
+            if region is None:
+                return
+            pending.append(executor.submit(_write_region, *job(region)))
+
+    entries, error = [], 0.0
+    lo, hi = float("inf"), float("-inf")
+    try:
+        with stages.stage("region_write", regions=len(todo), region_size=size,
+                          **exr_opts) as st:
+            if executor is not None:
+                submit_ahead()
+            for n, region in enumerate(todo, 1):
+                st.progress(n - 1, len(todo), "regions")
+                if executor is None:
+                    written = _write_region(*job(region))
+                else:
+                    written = pending.popleft().result()
+                    submit_ahead()
+                lo, hi = min(lo, written["min"]), max(hi, written["max"])
+                error  = max(error, written.get("max_error", 0.0))
+                st.add(nbytes=written["nbytes"], pixels=size * size)
+                entries.append({"location": list(region["location"]),
+                                "height": written["height"], "color": written.get("color"),
+                                "canvas_rect": list(region["rect"])})
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    index = {
+        "region_size":    size,
+        "origin":         list(grid["origin"]),
+        "canvas_width":   grid["width"],
+        "canvas_height":  grid["height"],
+        "vertex_spacing": vertex_spacing,
+        "heightmap_exr":  exr_opts,
+        "imagery_format": image_opts["fmt"] if color is not None else None,
+        "elev_min_m":     lo if entries else None,
+        "elev_max_m":     hi if entries else None,
+        "skipped":        len(grid["regions"]) - len(todo),
+        "regions":        entries,
+    }
+    path = out / INDEX_NAME
+    path.write_text(json.dumps(index, indent=2))
+    print(f"OK Saved: {len(entries)} region(s) and {out.name}/{path.name}")
+    return {**index, "path": path, **({"max_error": error} if exr_opts["pixel_type"] == "half" else {})}
+
+
+def _write_region(stem: Path, size: int, height, color, exr_opts: dict,
+                  image_opts: dict | None, mask=None) -> dict:
+    """
+    Write one region's heightmap (and color map), padded to size x size.
+    Its min/max are over the pixels `mask` selects (all if None). Runs in a
+    worker process in parallel mode, so it takes and returns only picklable
+    values.
+    """
+    import numpy as np
+    heights = height if mask is None else height[mask]
+    written = {"min": float(heights.min()), "max": float(heights.max())}
+    pad     = ((0, size - height.shape[0]), (0, size - height.shape[1]))
+    height  = np.pad(height, pad, mode="edge") if any(p for _, p in pad) else height
+    path    = stem.with_name(stem.name + "_height.exr")
+    with exr_io.ScanlineWriter(path, size, size, **exr_opts) as exr:
+        for y0, y1 in exr_io.row_blocks(size):
+            exr.write(height[y0:y1])
+    written["height"] = path.name
+    written["nbytes"] = path.stat().st_size
+    if exr.half:
+        written["max_error"] = exr.max_error
+    if color is not None:
+        from PIL import Image
+        color = np.pad(color, pad + ((0, 0),), mode="edge") if any(p for _, p in pad) else color
+        path  = stem.with_name(stem.name + "_color" + image_encoders.suffix(image_opts["fmt"]))
+        image_encoders.save(Image.fromarray(np.ascontiguousarray(color), "RGB"), path, **image_opts)
+        written["color"]   = path.name
+        written["nbytes"] += path.stat().st_size
+    return written
+
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+tile_cache.py
+-------------
+Persistent on-disk cache for downloaded source tiles (3DEP GeoTIFFs), shared
+across patches and projects.
+
+Layout under the cache directory:
+  blobs/<key>.bin   -- tile contents; key = sha256(url + ETag + Last-Modified)
+  urls/<hash>.json  -- last known key for a URL (used when the server is
+                       unreachable and validators cannot be checked)
+  tmp/              -- in-progress writes, moved into place atomically;
+                       <key>.part files survive failed runs so the next run
+                       can resume them with a Range request
+
+Entries are evicted least-recently-used first once the total size exceeds
+the configured cap. A hit refreshes the blob's mtime, which is the LRU clock.
+All writes go through a temp file + os.replace(), so concurrent runs can
+share one cache directory safely.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_MAX_GB = 20.0
+STALE_LOCK_S   = 6 * 3600   # a .lock older than this belongs to a dead run
+
+
+def default_cache_dir() -> Path:
+    """Per-user cache directory, overridable with TERRAIN_FETCHER_CACHE."""
+    env = os.environ.get("TERRAIN_FETCHER_CACHE")
+    if env:
+        return Path(env)
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+        return base / "TerrainMapFetcher" / "tile_cache"
+    base = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    return base / "terrain_map_fetcher" / "tiles"
+
+
+class TileCache:
+    def __init__(self, root: Path, max_bytes: int = int(DEFAULT_MAX_GB * 1024**3)):
+        self.root      = Path(root)
+        self.max_bytes = max_bytes
+        self.hits      = 0
+        self.misses    = 0
+        self.hit_bytes = 0
+        self._pinned: set = set()   # blobs handed out during this run
+        self._lock     = threading.Lock()
+        for sub in ("blobs", "urls", "tmp"):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+
+    # -- Keys ------------------------------------------------------------------
+
+    @staticmethod
+    def key_for(url: str, etag: str = "", last_modified: str = "") -> str:
+        ident = "\n".join((url, etag or "", last_modified or ""))
+        return hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+    def _blob(self, key: str) -> Path:
+        return self.root / "blobs" / f"{key}.bin"
+
+    def _url_record(self, url: str) -> Path:
+        return self.root / "urls" / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    # -- Lookup / store --------------------------------------------------------
+
+    def get(self, key: str) -> Path | None:
+        """Return the cached blob for `key` (refreshing its LRU time), or None."""
+        blob = self._blob(key)
+        try:
+            os.utime(blob)
+            size = blob.stat().st_size
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits      += 1
+            self.hit_bytes += size
+            self._pinned.add(blob)
+        return blob
+
+    def last_key(self, url: str) -> str | None:
+        """Key of the most recently stored version of `url`, if any."""
+        try:
+            return json.loads(self._url_record(url).read_text()).get("key")
+        except (OSError, ValueError):
+            return None
+
+    def temp_path(self) -> Path:
+        """A fresh file inside the cache volume, so put() is a rename, not a copy."""
+        fd, name = tempfile.mkstemp(suffix=".part", dir=self.root / "tmp")
+        os.close(fd)
+        return Path(name)
+
+    def partial(self, key: str) -> Path:
+        """
+        Resumable download target for `key`. The first run to claim it gets the
+        shared tmp/<key>.part (possibly left half-written by an earlier run);
+        a concurrent run downloading the same tile gets a private temp file.
+        Call release() when done, whether or not the download succeeded.
+        """
+        part = self.root / "tmp" / f"{key}.part"
+        lock = part.with_suffix(".lock")
+        try:
+            if time.time() - lock.stat().st_mtime > STALE_LOCK_S:
+                lock.unlink()
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return self.temp_path()
+        return part
+
+    def release(self, key: str, part: Path) -> None:
+        """Drop the claim taken by partial(); private temp files are removed."""
+        shared = self.root / "tmp" / f"{key}.part"
+        if part == shared:
+            shared.with_suffix(".lock").unlink(missing_ok=True)
+        else:
+            part.unlink(missing_ok=True)
+
+    def put(self, key: str, url: str, src: Path) -> Path:
+        """Atomically move `src` into the cache under `key` and return its path."""
+        blob = self._blob(key)
+        os.replace(src, blob)
+        with self._lock:
+            self._pinned.add(blob)
+        self._write_atomic(self._url_record(url),
+                           json.dumps({"url": url, "key": key, "stored_at": time.time()}))
+        self.evict()
+        return blob
+
+    def _write_atomic(self, path: Path, text: str) -> None:
+        fd, name = tempfile.mkstemp(suffix=".part", dir=self.root / "tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(name, path)
+
+    # -- Eviction --------------------------------------------------------------
+
+    def evict(self) -> int:
+        """
+        Delete least-recently-used blobs until under max_bytes. Blobs handed out
+        during this run are never evicted by it. Returns bytes freed.
+        """
+        entries = []
+        for p in (self.root / "blobs").glob("*.bin"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue  # removed by a concurrent run
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(e[1] for e in entries)
+        freed = 0
+        for _, size, p in sorted(entries):
+            if total - freed <= self.max_bytes:
+                break
+            if p in self._pinned:
+                continue
+            try:
+                p.unlink()
+                freed += size
+            except OSError:
+                pass  # in use by another process (Windows) -- try the next one
+        return freed
+
+    # -- Reporting -------------------------------------------------------------
+
+    def summary(self) -> str:
+        return (f"Tile cache: {self.hits} hit(s), {self.misses} miss(es), "
+                f"{self.hit_bytes / 1024 / 1024:.1f} MB served from {self.root}")
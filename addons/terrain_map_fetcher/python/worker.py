@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+worker.py
+---------
+Optional long-lived helper process for the editor plugin. It imports the
+processing scripts once and serves them as JSON-RPC 2.0 methods, one JSON
+object per line, over stdin/stdout (--stdio) or a localhost TCP socket
+(--port; several clients may connect, e.g. one to run jobs and one to
+cancel them).
+
+Any local program, a web page's cross-origin POST included, can reach a
+localhost port, so over TCP every request must carry the "token" member the
+worker wrote to --port-file (its second line, after the port) when it
+started; a connection is closed on the first line that is not a JSON
+request with that token.
+
+Methods:
+  ping                  {"pid", "python", "uptime_s", "jobs_run", "running", "queued"}
+  check_dependencies    {"missing": [pip requirement, ...]}
+  process_dem           params {"args": [command line of the script]}
+  process_imagery         -> {"exit_code", "elapsed_s"}
+  fetch_pipeline
+  combine_tiles
+  compose_canvas
+  cancel                params {"id": request id} -> {"cancelled": bool}
+  shutdown
+
+Script jobs run one at a time, in request order, on a job thread. Whatever
+they print is sent to the requesting client as "log" notifications
+{"id", "stream", "text"}, one per line; output of the worker's own threads
+goes to its stderr. Cancelling a queued job drops it; cancelling a running
+one makes the job's threads raise stages.Cancelled at their next stage
+start or progress report (a GDAL warp or EXR write in progress finishes
+first), so the scripts' finally blocks still shut their pools down and
+remove temp files. A cancelled job fails with error code -32001.
+
+Between jobs the process keeps what a fresh interpreter pays for again on
+every call: the imported numpy/rasterio/GDAL/OpenEXR/Pillow modules with
+their registered drivers and the PROJ database, and process_dem.py's
+forkserver with the module preloaded for its reprojection workers.
+
+Usage:
+    python3 worker.py --stdio [--idle-timeout 900]
+    python3 worker.py --port 0 [--port-file /path/to/port.txt] [--idle-timeout 900]
+"""
+
+import argparse
+import hmac
+import importlib
+import io
+import json
+import os
+import queue
+import secrets
+import socket
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+import stages
+
+SCRIPTS = {   # RPC method -> module whose main(argv) runs it
+    "process_dem":     "process_dem",
+    "process_imagery": "process_imagery",
+    "fetch_pipeline":  "fetch_pipeline",
+    "combine_tiles":   "combine_tiles",
+    "compose_canvas":  "compose_canvas",
+}
+IDLE_TIMEOUT_S = 900.0   # exit after this long without requests (0 = never)
+
+PARSE_ERROR      = -32700
+INVALID_REQUEST  = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS   = -32602
+INTERNAL_ERROR   = -32603
+JOB_CANCELLED    = -32001
+UNAUTHORIZED     = -32002
+
+
+class Worker:
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT_S):
+        self.idle_timeout = idle_timeout
+        self.started      = time.monotonic()
+        self.last_active  = self.started
+        self.jobs_run     = 0
+        self.stopped      = threading.Event()
+        self._queue       = queue.Queue()
+        self._lock        = threading.Lock()
+        self._queued      = {}     # request id -> job, not started yet
+        self._current     = None   # running job
+        self._runner      = threading.Thread(target=self._run_jobs, name="rpc-jobs", daemon=True)
+        self._runner.start()
+        threading.Thread(target=self._warm_up, name="rpc-warmup", daemon=True).start()
+        if idle_timeout > 0:
+            threading.Thread(target=self._watch_idle, name="rpc-idle", daemon=True).start()
+
+    # -- Requests --------------------------------------------------------------
+
+    def handle(self, line: str, conn: "Connection") -> bool:
+        """
+        Answer one request line from `conn`. Returns False when the line is
+        not a JSON request carrying the connection's token (if it has one);
+        the transport then drops the client.
+        """
+        try:
+            msg = json.loads(line)
+        except ValueError as e:
+            conn.send_error(None, PARSE_ERROR, f"Parse error: {e}")
+            return False
+        if not isinstance(msg, dict) or not isinstance(msg.get("method"), str):
+            conn.send_error(None, INVALID_REQUEST, "Invalid request")
+            return False
+        if conn.token is not None and not (
+                isinstance(msg.get("token"), str)
+                and hmac.compare_digest(msg["token"].encode(), conn.token.encode())):
+            conn.send_error(msg.get("id"), UNAUTHORIZED, "Missing or wrong token")
+            return False
+        if not _valid_id(msg.get("id")):
+            conn.send_error(None, INVALID_REQUEST, "The id must be a string, an integer or null")
+            return True
+        self.last_active = time.monotonic()
+        req_id = msg.get("id")
+        method = msg["method"]
+        params = msg.get("params") or {}
+
+        if method in SCRIPTS:
+            args = params.get("args", []) if isinstance(params, dict) else None
+            if not isinstance(args, list) or not all(isinstance(a, str) for a in args):
+                conn.send_error(req_id, INVALID_PARAMS, '"args" must be a list of strings')
+                return True
+            with self._lock:
+                taken = req_id is None or req_id in self._queued or \
+                    (self._current is not None and self._current.id == req_id)
+                if not taken:
+                    job = self._queued[req_id] = Job(req_id, method, args, conn)
+            if taken:
+                conn.send_error(req_id, INVALID_REQUEST, "Jobs need an id that is not in use")
+                return True
+            self._queue.put(job)
+        elif method == "ping":
+            conn.send_result(req_id, self.status())
+        elif method == "check_dependencies":
+            try:
+                import setup
+                conn.send_result(req_id, {"missing": setup.check()})
+            except Exception as e:
+                conn.send_error(req_id, INTERNAL_ERROR, str(e))
+        elif method == "cancel":
+            target = params.get("id") if isinstance(params, dict) else None
+            if _valid_id(target):
+                conn.send_result(req_id, {"cancelled": self.cancel(target)})
+            else:
+                conn.send_error(req_id, INVALID_PARAMS, '"id" must be a string or an integer')
+        elif method == "shutdown":
+            conn.send_result(req_id, {"ok": True})
+            self.stop()
+        else:
+            conn.send_error(req_id, METHOD_NOT_FOUND, f"Method not found: {method}")
+        return True
+
+    def status(self) -> dict:
+        with self._lock:
+            running = self._current.id if self._current else None
+            queued  = list(self._queued)
+        return {"pid": os.getpid(), "python": sys.version.split()[0],
+                "uptime_s": round(time.monotonic() - self.started, 1),
+                "jobs_run": self.jobs_run, "running": running, "queued": queued}
+
+    def cancel(self, req_id) -> bool:
+        """Drop a queued job or interrupt the running one. False if `req_id` is neither."""
+        with self._lock:
+            job = self._queued.pop(req_id, None)
+            if job is not None:
+                job.cancelled = True
+                job.conn.send_error(job.id, JOB_CANCELLED, "Cancelled")
+                return True
+            job = self._current
+            if job is None or job.id != req_id or job.cancelled:
+                return False
+            job.cancelled = True
+            stages.request_cancel()
+        return True
+
+    def stop(self) -> None:
+        with self._lock:
+            running = self._current.id if self._current else None
+        if running is not None:
+            self.cancel(running)
+        self._queue.put(None)
+        self.stopped.set()
+
+    # -- Jobs ------------------------------------------------------------------
+
+    def _run_jobs(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if self._queued.pop(job.id, None) is None:
+                    continue   # cancelled while queued
+                job.thread_id = threading.get_ident()
+                job.baseline  = set(threading.enumerate())
+                stages.clear_cancel()
+                self._current = job
+            t0 = time.perf_counter()
+            try:
+                code = _run_script(SCRIPTS[job.method], job.args)
+            except stages.Cancelled:
+                code = None
+            with self._lock:
+                self._current = None
+            for log in job.logs.values():
+                log.flush_pending()
+            self.jobs_run   += 1
+            self.last_active = time.monotonic()
+            if job.cancelled:
+                job.conn.send_error(job.id, JOB_CANCELLED, "Cancelled")
+            else:
+                job.conn.send_result(job.id, {"exit_code": code,
+                                              "elapsed_s": round(time.perf_counter() - t0, 3)})
+
+    def _warm_up(self) -> None:
+        """
+        Import every script and the heavy modules it defers (import_heavy)
+        in the background, so even the first job starts warm.
+        """
+        for module in dict.fromkeys(SCRIPTS.values()):
+            try:
+                mod = importlib.import_module(module)
+                if hasattr(mod, "import_heavy"):
+                    mod.import_heavy()
+            except BaseException:
+                pass   # reported when a job needs it
+
+    def _watch_idle(self) -> None:
+        while not self.stopped.wait(5.0):
+            with self._lock:
+                busy = self._current is not None or bool(self._queued)
+            if not busy and time.monotonic() - self.last_active > self.idle_timeout:
+                print("Idle timeout -- exiting.", file=sys.stderr)
+                self.stop()
+
+
+class Job:
+    def __init__(self, req_id, method: str, args: list[str], conn: "Connection"):
+        self.id        = req_id
+        self.method    = method
+        self.args      = args
+        self.conn      = conn
+        self.cancelled = False
+        self.thread_id = None
+        self.baseline  = set()   # threads alive when the job started
+        self.logs      = {name: _LogStream(conn, req_id, name) for name in ("stdout", "stderr")}
+
+    def owns(self, thread: threading.Thread) -> bool:
+        """True for the job thread and the threads started while it runs (not the worker's own)."""
+        return thread.ident == self.thread_id or (
+            thread not in self.baseline and not thread.name.startswith("rpc-"))
+
+
+def _run_script(module: str, args: list[str]) -> int:
+    """Run `module`.main(args) and return its exit status instead of exiting."""
+    sys.argv = [f"{module}.py", *args]   # for the script's usage/error messages
+    try:
+        importlib.import_module(module).main(args)
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+
+def _valid_id(req_id) -> bool:
+    """JSON-RPC ids are strings, numbers or null; fractional ones are not accepted here."""
+    return req_id is None or (isinstance(req_id, (str, int)) and not isinstance(req_id, bool))
+
+
+def _ignore_cancelled(args) -> None:
+    """A job thread (fetch_pipeline.py's DEM thread) that ends on a cancel is expected."""
+    if not issubclass(args.exc_type, stages.Cancelled):
+        threading.__excepthook__(args)
+
+
+# -- Output --------------------------------------------------------------------
+
+class _JobOutput(io.TextIOBase):
+    """
+    sys.stdout/sys.stderr of the worker: what the running job's threads
+    write goes to its client (_LogStream), everything else to `real`.
+    """
+
+    def __init__(self, worker: Worker, stream: str, real):
+        self._worker = worker
+        self._stream = stream
+        self._real   = real
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        job = self._worker._current
+        if job is not None and job.owns(threading.current_thread()):
+            return job.logs[self._stream].write(text)
+        return self._real.write(text)
+
+    def flush(self) -> None:
+        self._real.flush()
+
+    def fileno(self) -> int:
+        return self._real.fileno()
+
+
+class _LogStream(io.TextIOBase):
+    """Text stream that sends each finished line (or \\r progress update) as a log notification."""
+
+    def __init__(self, conn: "Connection", req_id, stream: str):
+        self._conn    = conn
+        self._id      = req_id
+        self._stream  = stream
+        self._lock    = threading.Lock()
+        self._pending = ""
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        with self._lock:
+            buf = self._pending + text
+            cut = max(buf.rfind("\n"), buf.rfind("\r")) + 1
+            self._pending = buf[cut:]
+        for line in buf[:cut].replace("\r", "\n").split("\n"):
+            if line.strip():
+                self._conn.send({"jsonrpc": "2.0", "method": "log",
+                                 "params": {"id": self._id, "stream": self._stream,
+                                            "text": line.rstrip()}})
+        return len(text)
+
+    def flush_pending(self) -> None:
+        if self._pending:
+            self.write("\n")
+
+
+class Connection:
+    """
+    One client; sends are serialized so notifications never split a message.
+    With a `token`, every request from it must carry that token.
+    """
+
+    def __init__(self, write, token: str | None = None):
+        self._write = write
+        self._lock  = threading.Lock()
+        self.token  = token
+
+    def send(self, msg: dict) -> None:
+        data = json.dumps(msg) + "\n"
+        with self._lock:
+            try:
+                self._write(data)
+            except OSError:
+                pass   # client went away; the job still finishes
+
+    def send_result(self, req_id, result) -> None:
+        self.send({"jsonrpc": "2.0", "id": req_id, "result": result})
+
+    def send_error(self, req_id, code: int, message: str) -> None:
+        self.send({"jsonrpc": "2.0", "id": req_id, "error": {"code": code, "message": message}})
+
+
+# -- Transports ----------------------------------------------------------------
+
+def serve_stdio(worker: Worker) -> None:
+    """Requests on stdin, replies on stdout. EOF on stdin (the editor closed) stops the worker."""
+    # Keep the real stdout for the protocol and point fd 1 at stderr, so
+    # nothing else (a child process, a C library) can write into the stream.
+    proto = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8", newline="\n")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def write(data: str) -> None:
+        proto.write(data)
+        proto.flush()
+
+    conn = Connection(write)
+
+    def read() -> None:
+        for line in sys.stdin:
+            if line.strip():
+                worker.handle(line, conn)
+        worker.stop()
+
+    threading.Thread(target=read, name="rpc-stdin", daemon=True).start()
+    worker.stopped.wait()
+
+
+def serve_tcp(worker: Worker, port: int, port_file: str | None) -> None:
+    """
+    Requests from any number of clients on 127.0.0.1:`port` (0 = any free
+    port) that know the token written to `port_file` (or printed, without one).
+    """
+    server = socket.create_server(("127.0.0.1", port))
+    port   = server.getsockname()[1]
+    token  = secrets.token_hex(16)
+    if port_file:
+        tmp = Path(port_file + ".part")
+        fd  = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(f"{port}\n{token}\n")
+        os.replace(tmp, port_file)
+        print(f"Worker listening on 127.0.0.1:{port}", flush=True)
+    else:
+        print(f"Worker listening on 127.0.0.1:{port} (token {token})", flush=True)
+
+    def client(sock: socket.socket) -> None:
+        with sock, sock.makefile("r", encoding="utf-8", newline="\n") as reader:
+            conn = Connection(lambda data: sock.sendall(data.encode("utf-8")), token)
+            try:
+                for line in reader:
+                    if line.strip() and not worker.handle(line, conn):
+                        return
+            except (OSError, UnicodeDecodeError):
+                return
+
+    def accept() -> None:
+        n = 0
+        while not worker.stopped.is_set():
+            try:
+                sock, _ = server.accept()
+            except OSError:
+                return
+            n += 1
+            threading.Thread(target=client, args=(sock,), name=f"rpc-client-{n}",
+                             daemon=True).start()
+
+    threading.Thread(target=accept, name="rpc-accept", daemon=True).start()
+    worker.stopped.wait()
+    server.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    group  = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--stdio", action="store_true", help="Serve on stdin/stdout.")
+    group.add_argument("--port",  type=int, help="Serve on this localhost TCP port (0 = any).")
+    parser.add_argument("--port-file", default=None,
+                        help="Write the TCP port and the request token here once listening.")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT_S,
+                        help="Exit after this many seconds without requests (0 = never).")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    threading.excepthook = _ignore_cancelled
+    worker = Worker(args.idle_timeout)
+    sys.stdout = _JobOutput(worker, "stdout", sys.stdout)
+    sys.stderr = _JobOutput(worker, "stderr", sys.stderr)
+    if args.stdio:
+        serve_stdio(worker)
+    else:
+        serve_tcp(worker, args.port, args.port_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,8 @@ var _export_h_spin: SpinBox
 var _edge_feather_spin: SpinBox
 var _auto_import_check: CheckBox
 var _python_runner: Node
+var _export_btn: Button
+var _cancel_btn: Button
 var _status_lbl: Label
 var _placed_rows: Dictionary = {}  # instance_id → Label
 
@@ -293,10 +295,16 @@ func _build_ui() -> void:
 	_auto_import_check.text = "Import to Terrain3D"
 	right.add_child(_auto_import_check)
 
-	var export_btn := Button.new()
-	export_btn.text = "Export"
-	export_btn.pressed.connect(_on_export_pressed)
-	right.add_child(export_btn)
+	_export_btn = Button.new()
+	_export_btn.text = "Export"
+	_export_btn.pressed.connect(_on_export_pressed)
+	right.add_child(_export_btn)
+
+	_cancel_btn = Button.new()
+	_cancel_btn.text = "Cancel Export"
+	_cancel_btn.visible = false
+	_cancel_btn.pressed.connect(_on_cancel_pressed)
+	right.add_child(_cancel_btn)
 
 	_status_lbl = _make_label("", 10)
 	_status_lbl.add_theme_color_override("font_color", Color(0.7, 0.7, 0.7))
@@ -562,8 +570,12 @@ func _on_export_pressed() -> void:
 	var out_h: int = int(_export_h_spin.value)
 	var feather: int = int(_edge_feather_spin.value)
 	_set_status("Exporting %dx%d px…" % [out_w, out_h])
-	var result: Dictionary = _python_runner.compose_canvas(
+	_export_btn.disabled = true
+	_cancel_btn.visible = _python_runner.use_worker
+	var result: Dictionary = await _python_runner.compose_canvas(
 		_project.project_dir, export_name, out_w, out_h, feather)
+	_export_btn.disabled = false
+	_cancel_btn.visible = false
 	if result.get("success", false):
 		_set_status("Exported to: " + result.get("output_path", "?"))
 		if _auto_import_check.button_pressed:
@@ -572,6 +584,12 @@ func _on_export_pressed() -> void:
 		_set_status("Export failed: " + result.get("error", "Unknown"), true)
 
 
+func _on_cancel_pressed() -> void:
+	if _python_runner.is_worker_job_running():
+		_set_status("Cancelling…")
+		_python_runner.cancel_worker_job()
+
+
 func _trigger_terrain3d_import(export_dir: String) -> void:
 	if export_dir.is_empty():
 		return
@@ -12,6 +12,7 @@ var _panel: Object        # map_fetcher_panel reference (via meta)
 var _patch_list_vbox: VBoxContainer
 var _delete_btn: Button
 var _status_lbl: Label
+var _cancel_btn: Button
 
 # Right panel — mask editor
 var _mask_editor: MaskEditor
@@ -86,6 +87,12 @@ func _build_ui() -> void:
 	_status_lbl.autowrap_mode = TextServer.AUTOWRAP_WORD_SMART
 	left.add_child(_status_lbl)
 
+	_cancel_btn = Button.new()
+	_cancel_btn.text = "Cancel Fetch"
+	_cancel_btn.visible = false
+	_cancel_btn.pressed.connect(_on_cancel_pressed)
+	left.add_child(_cancel_btn)
+
 	# Patch list inside a ScrollContainer
 	var scroll := ScrollContainer.new()
 	scroll.size_flags_vertical = Control.SIZE_EXPAND_FILL
@@ -271,10 +278,18 @@ func _start_fetch(patch_name: String, bbox: Dictionary) -> void:
 
 func _on_api_completed(dem_urls: Array, imagery_urls: Array, out_dir: String, bbox: Dictionary) -> void:
 	_set_status("Downloading %d DEM + %d imagery tile(s)…" % [dem_urls.size(), imagery_urls.size()])
-	var result: Dictionary = _python_runner.process_tiles(dem_urls, imagery_urls, out_dir, bbox)
+	_cancel_btn.visible = _python_runner.use_worker
+	var result: Dictionary = await _python_runner.process_tiles(dem_urls, imagery_urls, out_dir, bbox)
+	_cancel_btn.visible = false
 	_on_python_done(result)
 
 
+func _on_cancel_pressed() -> void:
+	if _python_runner.is_worker_job_running():
+		_set_status("Cancelling…")
+		_python_runner.cancel_worker_job()
+
+
 func _on_api_failed(error_msg: String) -> void:
 	_is_busy = false
 	_set_status("API error: " + error_msg, true)